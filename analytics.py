@@ -0,0 +1,215 @@
+import logging
+import threading
+
+import numpy as np
+
+from database import db_connection
+from snapshot import QUOTE_INDEX
+
+SUMMARY_TABLE = "option_chain.chain_summary"
+
+# Summary table metric columns, in table order
+SUMMARY_COLUMNS = [
+    ("spot_price", "DOUBLE PRECISION"),
+    ("atm_strike", "DOUBLE PRECISION"),
+    ("strikes", "INTEGER"),
+    ("ce_oi", "BIGINT"),
+    ("pe_oi", "BIGINT"),
+    ("pcr_oi", "REAL"),
+    ("pcr_volume", "REAL"),
+    ("max_pain", "DOUBLE PRECISION"),
+    ("atm_straddle", "DOUBLE PRECISION"),
+    ("atm_iv", "REAL"),
+    ("iv_skew", "REAL"),
+    ("ce_oi_change", "BIGINT"),
+    ("pe_oi_change", "BIGINT"),
+    ("max_ce_oi_strike", "DOUBLE PRECISION"),
+    ("max_pe_oi_strike", "DOUBLE PRECISION"),
+    ("max_ce_oi_add_strike", "DOUBLE PRECISION"),
+    ("max_pe_oi_add_strike", "DOUBLE PRECISION"),
+]
+
+
+def create_summary_table():
+    """Create the per-minute chain summary table"""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS option_chain")
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+                symbol VARCHAR(20) NOT NULL,
+                expiry_date VARCHAR(50) NOT NULL,
+                minute TIMESTAMP NOT NULL,
+                fetch_time TIMESTAMP NOT NULL,
+                {", ".join(f"{name} {sql_type}" for name, sql_type in SUMMARY_COLUMNS)},
+                PRIMARY KEY (symbol, expiry_date, minute)
+            )
+            """)
+        conn.commit()
+
+
+def _nan_to_none(value):
+    return None if value is None or value != value else value
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else np.nan
+
+
+def _strike_at_max(strikes, values):
+    """Strike with the largest value, or NaN when there is nothing to compare"""
+    if not np.isfinite(values).any():
+        return np.nan
+    return strikes[np.nanargmax(values)]
+
+
+def max_pain(strikes, ce_oi, pe_oi):
+    """Expiry price (among listed strikes) at which option writers pay out the least"""
+    # payout[k] = sum_i CE_OI_i * max(K_k - K_i, 0) + PE_OI_i * max(K_i - K_k, 0)
+    diff = strikes[:, None] - strikes[None, :]
+    payout = np.maximum(diff, 0) @ ce_oi + np.maximum(-diff, 0) @ pe_oi
+    return strikes[np.argmin(payout)]
+
+
+def compute_metrics(snapshot):
+    """PCR, max pain, ATM straddle, IV skew and OI buildup for one snapshot"""
+    values = snapshot.values
+    strikes = values[:, QUOTE_INDEX['Strike Price']]
+    values = values[~np.isnan(strikes)]
+    strikes = strikes[~np.isnan(strikes)]
+    if not len(strikes):
+        return None
+
+    def col(name):
+        return values[:, QUOTE_INDEX[name]]
+
+    ce_oi = np.nan_to_num(col('CE OI'))
+    pe_oi = np.nan_to_num(col('PE OI'))
+    ce_oi_change = col('CE Chg in OI')
+    pe_oi_change = col('PE Chg in OI')
+    ce_iv, pe_iv = col('CE IV'), col('PE IV')
+    atm = np.argmin(np.abs(strikes - snapshot.atm_strike))
+
+    # Skew: mean OTM put IV minus mean OTM call IV (both sides of ATM, zero IVs ignored)
+    otm_puts = pe_iv[(strikes < strikes[atm]) & (pe_iv > 0)]
+    otm_calls = ce_iv[(strikes > strikes[atm]) & (ce_iv > 0)]
+    iv_skew = otm_puts.mean() - otm_calls.mean() if len(otm_puts) and len(otm_calls) else np.nan
+    atm_ivs = np.array([ce_iv[atm], pe_iv[atm]])
+    atm_ivs = atm_ivs[atm_ivs > 0]
+
+    total_ce_oi, total_pe_oi = ce_oi.sum(), pe_oi.sum()
+    return {
+        "spot_price": snapshot.spot_price,
+        "atm_strike": snapshot.atm_strike,
+        "strikes": len(strikes),
+        "ce_oi": int(total_ce_oi),
+        "pe_oi": int(total_pe_oi),
+        "pcr_oi": _ratio(total_pe_oi, total_ce_oi),
+        "pcr_volume": _ratio(np.nansum(col('PE Volume')), np.nansum(col('CE Volume'))),
+        "max_pain": max_pain(strikes, ce_oi, pe_oi) if total_ce_oi + total_pe_oi > 0 else np.nan,
+        "atm_straddle": col('CE LTP')[atm] + col('PE LTP')[atm],
+        "atm_iv": atm_ivs.mean() if len(atm_ivs) else np.nan,
+        "iv_skew": iv_skew,
+        "ce_oi_change": int(np.nansum(ce_oi_change)),
+        "pe_oi_change": int(np.nansum(pe_oi_change)),
+        "max_ce_oi_strike": _strike_at_max(strikes, col('CE OI')),
+        "max_pe_oi_strike": _strike_at_max(strikes, col('PE OI')),
+        "max_ce_oi_add_strike": _strike_at_max(strikes, ce_oi_change),
+        "max_pe_oi_add_strike": _strike_at_max(strikes, pe_oi_change),
+    }
+
+
+def summary_row(snapshot):
+    """Summary table row for a snapshot, or None if it has no strikes"""
+    metrics = compute_metrics(snapshot)
+    if metrics is None:
+        return None
+    # Truncated to the minute, so sub-minute ticks and streamed snapshots upsert one row per minute
+    minute = f"{snapshot.fetch_time[:10]} {snapshot.timestamp[:5]}:00"
+    return (
+        (snapshot.symbol, snapshot.expiry_date, minute, snapshot.fetch_time)
+        + tuple(_nan_to_none(_plain(metrics[name])) for name, _ in SUMMARY_COLUMNS)
+    )
+
+
+def _plain(value):
+    """NumPy scalars to Python numbers for the database driver"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def insert_summaries(rows):
+    """Upsert summary rows; a later fetch in the same minute replaces the earlier one"""
+    names = [name for name, _ in SUMMARY_COLUMNS]
+    columns = ["symbol", "expiry_date", "minute", "fetch_time"] + names
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in ["fetch_time"] + names)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SUMMARY_TABLE} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT (symbol, expiry_date, minute) DO UPDATE SET {updates}",
+                rows
+            )
+        conn.commit()
+    return len(rows)
+
+
+class SummaryCollector:
+    """Collects summary rows from fetch threads and writes them once per cycle
+
+    At most `max_pending` rows are held while the database is unreachable; the oldest are dropped.
+    """
+
+    def __init__(self, max_pending=50000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._rows = []
+        self.dropped = 0
+
+    def _trim(self):
+        """Drop the oldest rows beyond max_pending (lock held); returns how many were dropped"""
+        excess = len(self._rows) - self.max_pending
+        if excess <= 0:
+            return 0
+        del self._rows[:excess]
+        self.dropped += excess
+        return excess
+
+    def add(self, snapshot):
+        """Compute and queue the summary for a full (not delta-filtered) snapshot"""
+        try:
+            row = summary_row(snapshot)
+        except Exception as e:
+            logging.error(f"Error computing analytics for {snapshot.symbol}_{snapshot.expiry_date}: {str(e)}")
+            return None
+        if row is not None:
+            with self._lock:
+                self._rows.append(row)
+                dropped = self._trim()
+            if dropped:
+                logging.warning(f"Chain summary queue full, dropped the {dropped} oldest rows")
+        return row
+
+    def flush(self):
+        """Write queued rows; on failure they are logged and kept for the next flush"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        # Only the latest row of each (symbol, expiry, minute) would survive the upsert anyway
+        rows = list({row[:3]: row for row in rows}.values())
+        try:
+            written = insert_summaries(rows)
+        except Exception as e:
+            logging.error(f"Error writing {len(rows)} chain summaries: {str(e)}")
+            with self._lock:
+                self._rows = rows + self._rows
+                dropped = self._trim()
+            if dropped:
+                logging.warning(
+                    f"Chain summary queue over {self.max_pending} rows, dropped the {dropped} oldest "
+                    f"({self.dropped} since start)"
+                )
+            return 0
+        logging.info(f"Wrote {written} chain summaries to {SUMMARY_TABLE}")
+        return written
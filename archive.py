@@ -0,0 +1,246 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from config import ARCHIVE_CONFIG
+from database import KEYFRAME_TABLE, db_connection
+from normalized import list_per_expiry_tables
+from snapshot import BIGINT_COLUMNS, OPTION_CHAIN_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Archiving is optional; the collector runs without pyarrow
+    pa = None
+
+# Stored per file; Symbol and the trade date come from the directory partitions
+ARCHIVE_COLUMNS = [col for col in OPTION_CHAIN_COLUMNS if col != 'Symbol']
+# Whether the row's fetch was a delta-encoding keyframe (null when delta encoding was never on)
+KEYFRAME_COLUMN = 'is_keyframe'
+# Low-cardinality text columns, dictionary-encoded in the Parquet files
+DICTIONARY_COLUMNS = ['expiry_date', 'timestamp']
+SORT_COLUMNS = ('fetch_time', 'Strike Price')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet archives need pyarrow: pip install pyarrow")
+
+
+def archive_schema():
+    """Arrow schema of an archive file"""
+    _require_pyarrow()
+    fields = []
+    for col in ARCHIVE_COLUMNS:
+        if col in DICTIONARY_COLUMNS:
+            kind = pa.string()
+        elif col == 'fetch_time':
+            kind = pa.timestamp('us')
+        elif col in BIGINT_COLUMNS:
+            kind = pa.int64()
+        else:
+            kind = pa.float64()
+        fields.append(pa.field(col, kind))
+    fields.append(pa.field(KEYFRAME_COLUMN, pa.bool_()))
+    return pa.schema(fields)
+
+
+def partitioning():
+    """Hive layout: <directory>/trade_date=2024-06-20/symbol=NIFTY/<expiry>.parquet"""
+    _require_pyarrow()
+    return ds.partitioning(pa.schema([("trade_date", pa.date32()), ("symbol", pa.string())]), flavor="hive")
+
+
+def archive_path(directory, trade_date, symbol, expiry_label):
+    expiry_file = re.sub(r'[^A-Za-z0-9]+', '_', expiry_label).strip('_')
+    return os.path.join(directory, f"trade_date={trade_date.isoformat()}", f"symbol={symbol}", f"{expiry_file}.parquet")
+
+
+def _day_range(trade_date):
+    return trade_date, trade_date + timedelta(days=1)
+
+
+def _count_day_rows(source, trade_date):
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT \"Symbol\", \"expiry_date\", COUNT(*) FROM {source} "
+                f"WHERE fetch_time >= %s AND fetch_time < %s GROUP BY 1, 2",
+                _day_range(trade_date)
+            )
+            groups = cursor.fetchall()
+        conn.rollback()
+    return groups
+
+
+def _has_keyframe_table():
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (KEYFRAME_TABLE,))
+            exists = cursor.fetchone()[0] is not None
+        conn.rollback()
+    return exists
+
+
+def _write_day(source, symbol, expiry_label, trade_date, path, chunk_rows, keyframes):
+    """Stream one table's rows for a day into a Parquet file, sorted; returns rows written"""
+    schema = archive_schema()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    columns = ", ".join(f't."{col}"' for col in ARCHIVE_COLUMNS)
+    if keyframes:
+        # Keeps delta-encoded days reconstructable from the archive once the keyframe rows are pruned
+        columns += (
+            f", EXISTS (SELECT 1 FROM {KEYFRAME_TABLE} k WHERE k.symbol = t.\"Symbol\" "
+            f"AND k.expiry_date = t.\"expiry_date\" AND k.fetch_time = t.fetch_time)"
+        )
+    else:
+        columns += ", NULL::boolean"
+    order = ", ".join(f't."{col}"' for col in SORT_COLUMNS)
+    written = 0
+    writer = None
+    try:
+        with db_connection() as conn:
+            try:
+                # Named (server-side) cursor, so a day's rows are never all held in memory
+                with conn.cursor(name=f"archive_{os.getpid()}") as cursor:
+                    cursor.itersize = chunk_rows
+                    cursor.execute(
+                        f"SELECT {columns} FROM {source} t WHERE t.\"Symbol\" = %s AND t.\"expiry_date\" = %s "
+                        f"AND t.fetch_time >= %s AND t.fetch_time < %s ORDER BY {order}",
+                        (symbol, expiry_label) + _day_range(trade_date)
+                    )
+                    writer = pq.ParquetWriter(
+                        tmp_path, schema,
+                        compression=ARCHIVE_CONFIG['compression'],
+                        use_dictionary=DICTIONARY_COLUMNS
+                    )
+                    while True:
+                        rows = cursor.fetchmany(chunk_rows)
+                        if not rows:
+                            break
+                        frame = pd.DataFrame.from_records(rows, columns=ARCHIVE_COLUMNS + [KEYFRAME_COLUMN])
+                        writer.write_table(
+                            pa.Table.from_pandas(frame, schema=schema, preserve_index=False),
+                            row_group_size=ARCHIVE_CONFIG['row_group_rows']
+                        )
+                        written += len(rows)
+            finally:
+                # Ends the read transaction, also when the write fails midway
+                conn.rollback()
+        writer.close()
+        writer = None
+        os.replace(tmp_path, path)
+        return written
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _prune_day(source, symbol, expiry_label, trade_date, expected, keyframes):
+    """Delete archived rows, but only if the table still holds exactly what was archived
+
+    The day's delta keyframe marks go in the same transaction, so none is left pointing at
+    deleted rows. Keyframes restart every day, so later days never depend on a pruned one.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            where = "WHERE \"Symbol\" = %s AND \"expiry_date\" = %s AND fetch_time >= %s AND fetch_time < %s"
+            params = (symbol, expiry_label) + _day_range(trade_date)
+            cursor.execute(f"DELETE FROM {source} {where}", params)
+            if cursor.rowcount != expected:
+                conn.rollback()
+                raise RuntimeError(f"{source} has {cursor.rowcount} rows for {trade_date}, archived {expected}; not pruned")
+            if keyframes:
+                cursor.execute(
+                    f"DELETE FROM {KEYFRAME_TABLE} "
+                    f"WHERE symbol = %s AND expiry_date = %s AND fetch_time >= %s AND fetch_time < %s",
+                    params
+                )
+        conn.commit()
+    return expected
+
+
+def archive_day(trade_date, symbol=None, prune=None, dry_run=False, directory=None):
+    """Archive one trade date from every per-expiry table to Parquet; returns per-file results"""
+    _require_pyarrow()
+    directory = directory or ARCHIVE_CONFIG['directory']
+    prune = ARCHIVE_CONFIG['prune'] if prune is None else prune
+    tables = list_per_expiry_tables()
+    if symbol:
+        tables = [(schema, table) for schema, table in tables if schema == f"option_chain_{symbol.lower()}"]
+
+    results = []
+    keyframes = bool(tables) and _has_keyframe_table()
+    for schema_name, table_name in tables:
+        source = f"{schema_name}.{table_name}"
+        try:
+            groups = _count_day_rows(source, trade_date)
+        except Exception as e:
+            logging.error(f"Error counting {source} rows for {trade_date}: {str(e)}")
+            results.append({"source": source, "ok": False, "error": str(e)})
+            continue
+        for row_symbol, expiry_label, count in groups:
+            path = archive_path(directory, trade_date, row_symbol, expiry_label)
+            result = {"source": source, "path": path, "rows": count, "written": 0, "pruned": 0, "ok": False}
+            results.append(result)
+            if dry_run:
+                result["ok"] = True
+                continue
+            try:
+                result["written"] = _write_day(source, row_symbol, expiry_label, trade_date, path,
+                                               ARCHIVE_CONFIG['chunk_rows'], keyframes)
+                stored = pq.read_metadata(path).num_rows
+                if not result["written"] == stored == count:
+                    raise RuntimeError(f"row count mismatch: {count} in database, {stored} in {path}")
+                result["ok"] = True
+                if prune:
+                    result["pruned"] = _prune_day(source, row_symbol, expiry_label, trade_date, count, keyframes)
+                logging.info(
+                    f"Archived {count} rows of {source} for {trade_date} to {path}"
+                    + (", pruned from the database" if result["pruned"] else "")
+                )
+            except Exception as e:
+                result["error"] = str(e)
+                logging.error(f"Error archiving {source} for {trade_date}: {str(e)}")
+    return results
+
+
+def read_archive(symbol, expiry_date=None, start=None, end=None, columns=None, filters=None, directory=None):
+    """Load a (symbol, expiry, date range) slice of the archive as a DataFrame
+
+    Only the matching partitions and columns are read. `start`/`end` are inclusive dates, or
+    datetimes to also cut on fetch_time; `filters` is an extra pyarrow expression, e.g.
+    ds.field("Strike Price").isin([24000, 24100]), pushed down to the row-group statistics.
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(directory or ARCHIVE_CONFIG['directory'], format="parquet",
+                         partitioning=partitioning(), schema=archive_schema().append(pa.field("trade_date", pa.date32()))
+                         .append(pa.field("symbol", pa.string())))
+    expression = ds.field("symbol") == symbol.upper()
+    if expiry_date is not None:
+        expression &= ds.field("expiry_date") == expiry_date
+    if start is not None:
+        expression &= ds.field("trade_date") >= (start.date() if isinstance(start, datetime) else start)
+        if isinstance(start, datetime):
+            expression &= ds.field("fetch_time") >= pa.scalar(start, pa.timestamp('us'))
+    if end is not None:
+        expression &= ds.field("trade_date") <= (end.date() if isinstance(end, datetime) else end)
+        if isinstance(end, datetime):
+            expression &= ds.field("fetch_time") <= pa.scalar(end, pa.timestamp('us'))
+    if filters is not None:
+        expression &= filters
+
+    wanted = None
+    if columns is not None:
+        wanted = [("symbol" if col == 'Symbol' else col) for col in columns]
+    df = dataset.to_table(columns=wanted, filter=expression).to_pandas()
+    df = df.rename(columns={"symbol": "Symbol"})
+    sort = [col for col in ('trade_date',) + SORT_COLUMNS if col in df.columns]
+    return df.sort_values(sort, kind="stable").reset_index(drop=True) if sort else df
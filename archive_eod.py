@@ -0,0 +1,75 @@
+"""Archive finished trade dates from the per-expiry tables to Parquet files.
+
+Usage:
+    python archive_eod.py [--date 2024-06-20] [--until 2024-06-28] [--symbol NIFTY] [--prune] [--dry-run]
+
+--date defaults to the last trade date whose session has ended. Dates still in session
+(or in the future) are refused, so an early cron run cannot archive or prune a partial day.
+
+Safe to re-run: a day's file is rewritten from the database, and rows are only pruned
+after the file's row count matches the table.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from archive import archive_day
+from config import ALL_SYMBOLS, EXCHANGE_SESSIONS, TRADING_CALENDAR_FILE
+from trading_calendar import TradingCalendar, trading_exchange
+from utils import setup_logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive per-expiry table rows to Parquet")
+    parser.add_argument("--date", help="Trade date to archive (YYYY-MM-DD, default the last finished trade date)")
+    parser.add_argument("--until", help="Archive every date from --date through this one (YYYY-MM-DD)")
+    parser.add_argument("--symbol", help="Only archive this symbol (e.g. NIFTY)")
+    parser.add_argument("--prune", action="store_true", default=None,
+                        help="Delete archived rows from the database (default: ARCHIVE_CONFIG['prune'])")
+    parser.add_argument("--dry-run", action="store_true", help="Count rows without writing anything")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    calendar = TradingCalendar.load(TRADING_CALENDAR_FILE, EXCHANGE_SESSIONS)
+    if args.symbol and args.symbol.upper() in ALL_SYMBOLS:
+        exchanges = {trading_exchange(ALL_SYMBOLS[args.symbol.upper()])}
+    else:
+        exchanges = set(EXCHANGE_SESSIONS)
+    now = datetime.now()
+    if args.date:
+        first = datetime.strptime(args.date, "%Y-%m-%d").date()
+    else:
+        first = calendar.last_completed_trade_date(now, exchanges)
+        if first is None:
+            logger.error("No finished trade date in the last 30 days, pass --date")
+            sys.exit(1)
+        logger.info(f"Archiving the last finished trade date, {first}")
+    last = datetime.strptime(args.until, "%Y-%m-%d").date() if args.until else first
+
+    # A day is only complete once its last session has ended
+    end = calendar.day_end(last, exchanges)
+    if last > now.date() or (end is not None and end >= now):
+        logger.error(f"{last} is not a finished trade date yet; it can be archived after its session ends")
+        sys.exit(1)
+
+    total = 0
+    failed = []
+    day = first
+    while day <= last:
+        for result in archive_day(day, symbol=args.symbol, prune=args.prune, dry_run=args.dry_run):
+            if result["ok"]:
+                total += result["rows"]
+                if args.dry_run:
+                    logger.info(f"{result['source']}: {result['rows']} rows to archive to {result['path']}")
+            else:
+                failed.append(f"{result['source']} ({day})")
+        day += timedelta(days=1)
+
+    logger.info(f"Archive finished: {total} rows, {len(failed)} files failed")
+    if failed:
+        logger.error(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Check the vectorized IV/Greeks engine against scalar reference code and time both.
+
+Runs without a database or scipy. From the repository root:
+
+    python -m benchmarks.bench_greeks --strikes 101 --iterations 500
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from greeks import bs_greeks, bs_price, implied_vol
+
+SPOT = 24012.35
+STRIKE_GAP = 50
+T = 6.5 / 365
+RATE = 0.065
+DIVIDEND_YIELD = 0.0
+
+
+def ref_cdf(x):
+    return 0.5 * math.erfc(-x / math.sqrt(2))
+
+
+def ref_pdf(x):
+    return math.exp(-0.5 * x * x) / math.sqrt(2 * math.pi)
+
+
+def ref_price(spot, strike, t, rate, q, vol, is_call):
+    d1 = (math.log(spot / strike) + (rate - q + 0.5 * vol * vol) * t) / (vol * math.sqrt(t))
+    d2 = d1 - vol * math.sqrt(t)
+    if is_call:
+        return spot * math.exp(-q * t) * ref_cdf(d1) - strike * math.exp(-rate * t) * ref_cdf(d2)
+    return strike * math.exp(-rate * t) * ref_cdf(-d2) - spot * math.exp(-q * t) * ref_cdf(-d1)
+
+
+def ref_greeks(spot, strike, t, rate, q, vol, is_call):
+    sqrt_t = math.sqrt(t)
+    d1 = (math.log(spot / strike) + (rate - q + 0.5 * vol * vol) * t) / (vol * sqrt_t)
+    d2 = d1 - vol * sqrt_t
+    carry = math.exp(-q * t)
+    strike_df = strike * math.exp(-rate * t)
+    pdf = ref_pdf(d1)
+    decay = -spot * carry * pdf * vol / (2 * sqrt_t)
+    if is_call:
+        delta = carry * ref_cdf(d1)
+        theta = decay - rate * strike_df * ref_cdf(d2) + q * spot * carry * ref_cdf(d1)
+    else:
+        delta = -carry * ref_cdf(-d1)
+        theta = decay + rate * strike_df * ref_cdf(-d2) - q * spot * carry * ref_cdf(-d1)
+    return delta, theta / 365, carry * pdf / (spot * vol * sqrt_t), spot * carry * pdf * sqrt_t / 100
+
+
+def ref_implied_vol(price, spot, strike, t, rate, q, is_call, tol=1e-12):
+    """Scalar bisection reference, solved on the OTM side like the vectorized engine"""
+    spot_df, strike_df = spot * math.exp(-q * t), strike * math.exp(-rate * t)
+    intrinsic = max(spot_df - strike_df, 0) if is_call else max(strike_df - spot_df, 0)
+    if not intrinsic < price < (spot_df if is_call else strike_df):
+        return math.nan
+    otm_call = strike_df >= spot_df
+    if is_call != otm_call:
+        price += (spot_df - strike_df) if otm_call else (strike_df - spot_df)
+    lo, hi = 1e-4, 5.0
+    while hi - lo > tol:
+        mid = 0.5 * (lo + hi)
+        if ref_price(spot, strike, t, rate, q, mid, otm_call) > price:
+            hi = mid
+        else:
+            lo = mid
+    return 0.5 * (lo + hi)
+
+
+def make_chain(num_strikes, seed=0):
+    """Calls then puts across a strike ladder, priced from a smile, with ticks-rounded premiums"""
+    rng = np.random.default_rng(seed)
+    strikes = SPOT - SPOT % STRIKE_GAP + STRIKE_GAP * (np.arange(num_strikes) - num_strikes // 2)
+    moneyness = np.log(strikes / SPOT)
+    vols = 0.13 + 0.8 * moneyness ** 2 - 0.15 * moneyness + rng.normal(0, 0.005, num_strikes)
+    strike = np.concatenate([strikes, strikes])
+    vol = np.concatenate([vols, vols])
+    is_call = np.arange(2 * num_strikes) < num_strikes
+    price = np.round(bs_price(SPOT, strike, T, RATE, DIVIDEND_YIELD, vol, is_call) / 0.05) * 0.05
+    return price, strike, is_call
+
+
+def vectorized(price, strike, is_call):
+    vol = implied_vol(price, SPOT, strike, T, RATE, DIVIDEND_YIELD, is_call)
+    greeks = bs_greeks(SPOT, strike, T, RATE, DIVIDEND_YIELD, np.where(np.isnan(vol), 0.2, vol), is_call)
+    return vol, np.column_stack(greeks)
+
+
+def scalar(price, strike, is_call):
+    vols, greeks = [], []
+    for p, k, c in zip(price.tolist(), strike.tolist(), is_call.tolist()):
+        vol = ref_implied_vol(p, SPOT, k, T, RATE, DIVIDEND_YIELD, c)
+        vols.append(vol)
+        greeks.append(ref_greeks(SPOT, k, T, RATE, DIVIDEND_YIELD, 0.2 if math.isnan(vol) else vol, c))
+    return np.array(vols), np.array(greeks)
+
+
+def measure(func, args, iterations):
+    func(*args)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(*args)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strikes", type=int, default=101)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    chain = make_chain(args.strikes)
+    vol, greeks = vectorized(*chain)
+    ref_vol, ref_greek_values = scalar(*chain)
+
+    both = ~np.isnan(vol) & ~np.isnan(ref_vol)
+    assert np.array_equal(np.isnan(vol), np.isnan(ref_vol)), "solvable sets differ"
+    vol_error = np.max(np.abs(vol[both] - ref_vol[both]))
+    greek_error = np.max(np.abs(greeks[both] - ref_greek_values[both]) / np.maximum(np.abs(ref_greek_values[both]), 1e-6))
+    print(f"{2 * args.strikes} options, {both.sum()} solved")
+    print(f"max |IV - reference IV|          {vol_error * 100:.2e} vol points")
+    print(f"max relative Greek error         {greek_error:.2e}")
+    assert vol_error < 1e-4 and greek_error < 1e-3, "vectorized engine disagrees with the reference"
+
+    for name, func, iterations in (("vectorized", vectorized, args.iterations),
+                                   ("scalar", scalar, max(1, args.iterations // 50))):
+        per_chain = measure(func, chain, iterations)
+        print(f"{name:10s} {per_chain * 1e6:10.1f} us/chain")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare rows/sec of the COPY and executemany insert paths against a local Postgres.
+
+Run from the repository root with the DB_* variables pointing at a scratch database:
+
+    python -m benchmarks.bench_insert --strikes 51 --batches 200
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from database import (
+    OPTION_CHAIN_COLUMNS, BIGINT_COLUMNS,
+    get_db_connection, copy_option_chain_rows, executemany_option_chain_rows
+)
+
+BENCH_TABLE = "option_chain_bench.bench_insert"
+
+
+def make_chain(num_strikes, seed=0):
+    """Synthetic option chain shaped like the collector's DataFrame"""
+    rng = np.random.default_rng(seed)
+    strikes = 24000 + 50 * (np.arange(num_strikes) - num_strikes // 2)
+    df = pd.DataFrame({
+        col: (rng.integers(0, 5_000_000, num_strikes) if col in BIGINT_COLUMNS
+              else rng.random(num_strikes) * 100)
+        for col in OPTION_CHAIN_COLUMNS
+    })
+    df['Symbol'] = "NIFTY"
+    df['expiry_date'] = "26 JUN"
+    df['fetch_time'] = "2024-06-20 10:15:01"
+    df['Spot Price'] = 24012.35
+    df['ATM Strike'] = 24000.0
+    df['Strike Price'] = strikes.astype(float)
+    df['timestamp'] = "10:15:00"
+    return df
+
+
+def setup_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS option_chain_bench")
+        cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        columns = ",\n".join(
+            f'"{col}" ' + ("BIGINT" if col in BIGINT_COLUMNS
+                           else "VARCHAR(50)" if col in ('Symbol', 'expiry_date', 'timestamp')
+                           else "TIMESTAMP" if col == 'fetch_time' else "FLOAT")
+            for col in OPTION_CHAIN_COLUMNS
+        )
+        cursor.execute(f"CREATE TABLE {BENCH_TABLE} (id SERIAL PRIMARY KEY, {columns})")
+    conn.commit()
+
+
+def run(insert_rows, conn, chains):
+    start = time.perf_counter()
+    for df in chains:
+        with conn.cursor() as cursor:
+            insert_rows(cursor, BENCH_TABLE, df)
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strikes", type=int, default=51)
+    parser.add_argument("--batches", type=int, default=200)
+    args = parser.parse_args()
+
+    chains = [make_chain(args.strikes, seed) for seed in range(args.batches)]
+    total_rows = args.strikes * args.batches
+
+    conn = get_db_connection()
+    try:
+        setup_table(conn)
+        for name, insert_rows in (("executemany", executemany_option_chain_rows),
+                                  ("copy", copy_option_chain_rows)):
+            elapsed = run(insert_rows, conn, chains)
+            print(f"{name:12s} {total_rows} rows in {elapsed:.3f}s -> {total_rows / elapsed:,.0f} rows/sec")
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare time and allocations of the DataFrame shaping path and OptionChainSnapshot.
+
+Runs without a database. From the repository root:
+
+    python -m benchmarks.bench_snapshot --strikes 51 --iterations 2000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from snapshot import OptionChainSnapshot, OPTION_CHAIN_COLUMNS, QUOTE_COLUMNS, BIGINT_COLUMNS
+from database import build_copy_buffer
+
+SYMBOL = "NIFTY"
+EXPIRY = "26 JUN"
+FETCH_TIME = "2024-06-20 10:15:01"
+TIMESTAMP = "10:15:00"
+SPOT = 24012.35
+ATM = 24000.0
+
+
+def make_broker_frame(num_strikes, seed=0):
+    """DataFrame shaped like Tradehull get_option_chain output"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        col: (rng.integers(0, 5_000_000, num_strikes) if col in BIGINT_COLUMNS
+              else rng.random(num_strikes) * 100)
+        for col in QUOTE_COLUMNS
+    })
+    df['Strike Price'] = (24000 + 50 * (np.arange(num_strikes) - num_strikes // 2)).astype(float)
+    return df
+
+
+def dataframe_path(raw):
+    """The pre-snapshot pipeline: insert/assign columns, reindex, list-of-dicts and COPY buffer"""
+    df = raw.copy()
+    df.insert(0, 'Spot Price', SPOT)
+    df.insert(1, 'ATM Strike', ATM)
+    df['Symbol'] = SYMBOL
+    df['expiry_date'] = EXPIRY
+    df['fetch_time'] = FETCH_TIME
+    df['timestamp'] = TIMESTAMP
+    for col in OPTION_CHAIN_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[OPTION_CHAIN_COLUMNS]
+    df.to_dict('records')
+    return build_copy_buffer(df).getvalue()
+
+
+def snapshot_path(raw):
+    """Typed snapshot straight to the COPY buffer"""
+    snapshot = OptionChainSnapshot.from_frame(raw, SYMBOL, EXPIRY, FETCH_TIME, TIMESTAMP, SPOT, ATM)
+    return snapshot.to_copy_buffer().getvalue()
+
+
+def measure(func, raw, iterations):
+    func(raw)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(raw)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / iterations, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strikes", type=int, default=51)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    raw = make_broker_frame(args.strikes)
+    assert dataframe_path(raw) == snapshot_path(raw), "paths produce different COPY rows"
+
+    print(f"{args.strikes}-strike chain, {args.iterations} iterations")
+    for name, func in (("dataframe", dataframe_path), ("snapshot", snapshot_path)):
+        per_call, peak = measure(func, raw, args.iterations)
+        print(f"{name:10s} {per_call * 1e6:9.1f} us/snapshot   peak allocations {peak / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
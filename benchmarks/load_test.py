@@ -0,0 +1,163 @@
+"""Load-test the full fetch -> shape -> insert pipeline against the fake broker and a local Postgres.
+
+Run from the repository root with the DB_* variables pointing at a scratch database:
+
+    python -m benchmarks.load_test --symbols 20 --expiries 2 --strikes 25 --cycles 10
+    python -m benchmarks.load_test --source recordings/2025-06-20 --speed 60 --cycles 30
+
+Synthetic runs collect LOADTEST01, LOADTEST02, ...; replays use the recorded symbols as
+configured in config.py. Broker latency comes from BROKER_CONFIG["fake"] unless overridden,
+and the configured rate limits are bypassed unless --rate-limits is given. --no-db skips the
+database to measure the broker and shaping stages alone.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+import main as collector
+from analytics import SummaryCollector
+from broker import FakeBroker
+from config import ALL_SYMBOLS, ANALYTICS_CONFIG, BROKER_CONFIG, RATE_LIMITS, STORAGE_MODE, WRITE_BEHIND_CONFIG
+from database import db_connection
+from engine import CollectionEngine
+from metrics import metrics
+from rate_limiter import RequestScheduler
+from writer import WriteBehindWriter
+
+
+def synthetic_symbols(count, expiries, strikes):
+    # The fake broker lists max(3 * strikes, 60) strikes either side of spot: keep them all positive
+    low = 50 * (max(3 * strikes, 60) + 20)
+    return {
+        f"LOADTEST{i + 1:02d}": {
+            "exchange": "INDEX" if i % 2 == 0 else "NSE",
+            "num_expiries": expiries,
+            "num_strikes": strikes,
+            "strike_gap": 50,
+            "sim_price": low + 500 * i,
+        }
+        for i in range(count)
+    }
+
+
+def recorded_symbols(directory):
+    with open(os.path.join(directory, "chains.jsonl")) as f:
+        recorded = {json.loads(line)["symbol"] for line in f if line.strip()}
+    missing = sorted(recorded - set(ALL_SYMBOLS))
+    if missing:
+        logging.warning(f"Recorded symbols not in config.py are skipped: {', '.join(missing)}")
+    return {symbol: ALL_SYMBOLS[symbol] for symbol in sorted(recorded) if symbol in ALL_SYMBOLS}
+
+
+def create_symbol_schemas(symbols):
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            for symbol in symbols:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS option_chain_{symbol.lower()}")
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=10, help="Synthetic symbols to collect")
+    parser.add_argument("--expiries", type=int, default=2, help="Expiries per synthetic symbol")
+    parser.add_argument("--strikes", type=int, default=25, help="Strikes above and below ATM")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between cycle starts (0: back to back)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent symbol x expiry jobs")
+    parser.add_argument("--source", default="synthetic", help="'synthetic' or a recording directory")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated market seconds per real second")
+    parser.add_argument("--chain-latency", type=float, default=None, help="Mean option chain latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limits", action="store_true", help="Apply the configured RATE_LIMITS")
+    parser.add_argument("--write-behind", action="store_true", help="Insert through the write-behind queue")
+    parser.add_argument("--no-db", action="store_true", help="Skip all database writes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    collector.logger = logging.getLogger()
+
+    if args.source == "synthetic":
+        symbols = synthetic_symbols(args.symbols, args.expiries, args.strikes)
+    else:
+        symbols = recorded_symbols(args.source)
+    # The pipeline looks symbols up in config.ALL_SYMBOLS
+    ALL_SYMBOLS.clear()
+    ALL_SYMBOLS.update(symbols)
+
+    latency = dict(BROKER_CONFIG['fake'].get('latency', {}))
+    if args.chain_latency is not None:
+        latency['option_chain'] = {"mean": args.chain_latency, "jitter": args.chain_latency / 3}
+    broker = FakeBroker(symbols, source=args.source, speed=args.speed, latency=latency,
+                        error_rate=args.error_rate, seed=args.seed)
+    if not args.rate_limits:
+        collector.request_scheduler = RequestScheduler({
+            endpoint: {"rate": 1e6, "burst": 1e6} for endpoint in RATE_LIMITS
+        })
+    collector.init_broker(broker)
+
+    if args.no_db:
+        collector.store_snapshot = lambda symbol, expiry_date, snapshot: len(snapshot)
+    else:
+        collector.prepare_database()
+        if STORAGE_MODE != "normalized":
+            create_symbol_schemas(symbols)
+        if ANALYTICS_CONFIG['enabled']:
+            collector.summary_collector = SummaryCollector(ANALYTICS_CONFIG['max_pending_rows'])
+        if args.write_behind:
+            collector.writer = WriteBehindWriter(
+                collector.store_snapshot_batch,
+                collector.store_snapshot,
+                max_queue=WRITE_BEHIND_CONFIG['max_queue'],
+                workers=WRITE_BEHIND_CONFIG['workers'],
+                batch_size=WRITE_BEHIND_CONFIG['batch_size'],
+                linger=WRITE_BEHIND_CONFIG['linger'],
+                put_timeout=WRITE_BEHIND_CONFIG['put_timeout']
+            )
+
+    engine = CollectionEngine(args.workers)
+    names = list(symbols)
+    jobs = sum(config['num_expiries'] for config in symbols.values())
+    print(f"{len(names)} symbols, {jobs} jobs per cycle, {args.cycles} cycles, "
+          f"{args.workers} workers, source {args.source}, db {'off' if args.no_db else STORAGE_MODE}")
+
+    cycle_times, failures = [], 0
+    start = time.perf_counter()
+    for cycle in range(args.cycles):
+        cycle_start = time.perf_counter()
+        summary = collector.run_collection_cycle(engine, names)
+        if collector.writer is not None:
+            collector.writer.flush()
+        if collector.summary_collector is not None:
+            collector.summary_collector.flush()
+        elapsed = time.perf_counter() - cycle_start
+        cycle_times.append(elapsed)
+        failures += len(summary['failed'])
+        print(f"cycle {cycle + 1:3d}: {elapsed:7.3f}s, {len(summary['failed'])} failed")
+        if args.interval and cycle + 1 < args.cycles:
+            time.sleep(max(args.interval - elapsed, 0.0))
+    total = time.perf_counter() - start
+    engine.shutdown()
+    if collector.writer is not None:
+        collector.writer.stop()
+
+    cycle_times = np.array(cycle_times)
+    rows = metrics.counter_value("option_chain_rows_written_total")
+    print()
+    print(f"cycle time    avg {cycle_times.mean():.3f}s  p50 {np.percentile(cycle_times, 50):.3f}s  "
+          f"p95 {np.percentile(cycle_times, 95):.3f}s  max {cycle_times.max():.3f}s")
+    print(f"throughput    {jobs * args.cycles / total:.1f} chains/s, {failures} failed jobs")
+    if not args.no_db:
+        print(f"db writes     {rows} rows, {rows / total:.0f} rows/s")
+    print(f"broker calls  {broker.calls}")
+    print("stage totals (count, mean):")
+    for stage, (count, seconds) in sorted(metrics.histogram_totals("option_chain_stage_seconds", "stage").items()):
+        print(f"  {stage:20s} {count:7d} {seconds / count * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
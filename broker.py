@@ -0,0 +1,386 @@
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from greeks import bs_greeks, bs_price
+from snapshot import QUOTE_COLUMNS
+from trading_calendar import trading_exchange
+
+# Simulated market seconds in a trading year, for the synthetic spot random walk
+TRADING_YEAR_SECONDS = 252 * 6.25 * 3600
+
+
+class Broker(ABC):
+    """What the collector needs from a broker client; Dhan_Tradehull.Tradehull provides all of it
+
+      get_ltp_data(names)                                          -> {symbol: ltp}
+      ATM_Strike_Selection(Underlying, Expiry)                     -> (ce_name, pe_name, atm_strike)
+      get_option_chain(Underlying, exchange, expiry, num_strikes)  -> (atm_strike, DataFrame)
+      instrument_df                                                instrument master (SEM_* columns)
+      get_instrument_file()                                        -> today's instrument master, downloaded once a day
+    """
+    instrument_df = None
+
+    @abstractmethod
+    def get_ltp_data(self, names):
+        ...
+
+    @abstractmethod
+    def ATM_Strike_Selection(self, Underlying, Expiry):
+        ...
+
+    @abstractmethod
+    def get_option_chain(self, Underlying, exchange, expiry, num_strikes):
+        ...
+
+    def reload_instruments(self):
+        """Refresh instrument_df for a new trade date and return it"""
+        return self.instrument_df
+
+
+def reload_instruments(client):
+    """Today's instrument master from the broker, re-downloaded when the date changed"""
+    if isinstance(client, Broker):
+        return client.reload_instruments()
+    # Tradehull loads the file once at login; get_instrument_file() fetches the day's file
+    client.instrument_df = client.get_instrument_file()
+    return client.instrument_df
+
+
+def create_broker(config, symbols):
+    """Build the broker client selected by BROKER_CONFIG"""
+    kind = config.get('kind', 'dhan')
+    if kind == "dhan":
+        # Imported here so simulations and load tests run without the Dhan SDK or credentials
+        from Dhan_Tradehull import Tradehull
+        load_dotenv()
+        client = Tradehull(os.getenv('DHAN_CLIENT_CODE'), os.getenv('DHAN_TOKEN_ID'))
+    elif kind == "fake":
+        client = FakeBroker(symbols, **config.get('fake', {}))
+    else:
+        raise ValueError(f"Unknown broker kind: {kind}")
+    if config.get('record_dir'):
+        client = RecordingBroker(client, config['record_dir'])
+    logging.info(f"Using {kind} broker" + (f", recording to {config['record_dir']}" if config.get('record_dir') else ""))
+    return client
+
+
+def contract_name(symbol, expiry, strike, option_type):
+    """Contract name in the broker's custom-symbol form, e.g. 'NIFTY 26 JUN 24000 CALL'"""
+    strike_text = f"{strike:g}"
+    return f"{symbol} {expiry.day} {expiry.strftime('%b').upper()} {strike_text} {'CALL' if option_type == 'CE' else 'PUT'}"
+
+
+class RecordingBroker(Broker):
+    """Passes calls through to a broker and saves every LTP and option chain for FakeBroker replay
+
+    Layout: instruments.csv, ltp.jsonl and chains.jsonl (one line per chain) indexing
+    chains/<symbol>/<expiry index>/<time>.csv
+    """
+
+    def __init__(self, client, directory):
+        self.client = client
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "chains"), exist_ok=True)
+        self._save_instruments(getattr(client, 'instrument_df', None))
+
+    @property
+    def instrument_df(self):
+        return self.client.instrument_df
+
+    def _save_instruments(self, instrument_df):
+        if instrument_df is not None:
+            # Options plus the underlyings, whose security ids the streaming feed subscribes to
+            options = instrument_df[instrument_df['SEM_INSTRUMENT_NAME'].isin(("OPTIDX", "OPTSTK", "INDEX", "EQUITY"))]
+            options.to_csv(os.path.join(self.directory, "instruments.csv"), index=False)
+
+    def reload_instruments(self):
+        instrument_df = reload_instruments(self.client)
+        self._save_instruments(instrument_df)
+        return instrument_df
+
+    def _append(self, name, entry):
+        with self._lock:
+            with open(os.path.join(self.directory, name), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def get_ltp_data(self, names):
+        prices = self.client.get_ltp_data(names=names)
+        if isinstance(prices, dict):
+            self._append("ltp.jsonl", {"time": datetime.now().isoformat(), "prices": prices})
+        return prices
+
+    def ATM_Strike_Selection(self, Underlying, Expiry):
+        return self.client.ATM_Strike_Selection(Underlying=Underlying, Expiry=Expiry)
+
+    def get_option_chain(self, Underlying, exchange, expiry, num_strikes):
+        result = self.client.get_option_chain(
+            Underlying=Underlying, exchange=exchange, expiry=expiry, num_strikes=num_strikes
+        )
+        if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], pd.DataFrame):
+            now = datetime.now()
+            path = os.path.join("chains", Underlying, str(expiry), now.strftime("%Y%m%dT%H%M%S%f") + ".csv")
+            os.makedirs(os.path.join(self.directory, os.path.dirname(path)), exist_ok=True)
+            result[1].to_csv(os.path.join(self.directory, path), index=False)
+            metadata = result[0] if isinstance(result[0], (int, float, str)) else None
+            self._append("chains.jsonl", {
+                "time": now.isoformat(), "symbol": Underlying, "expiry": expiry,
+                "file": path, "metadata": metadata
+            })
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class FakeBroker(Broker):
+    """Local stand-in for Tradehull, for load tests and dry runs without a Dhan session
+
+    `source` is "synthetic" (random-walk spots, smile-priced chains with Greeks, growing OI
+    and volume) or a directory written by RecordingBroker, replayed on a loop. The simulated
+    market clock runs `speed` times faster than real time. Each call sleeps for the endpoint's
+    latency profile, {"mean": s, "jitter": s}, and fails with probability `error_rate`.
+    """
+
+    def __init__(self, symbols, source="synthetic", speed=1.0, latency=None, error_rate=0.0,
+                 seed=None, clock=time.time):
+        self.symbols = symbols
+        self.source = source
+        self.speed = speed
+        self.latency = latency or {}
+        self.error_rate = error_rate
+        self._clock = clock
+        self._random = random.Random(seed)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._started = clock()
+        self.calls = {"ltp": 0, "atm": 0, "option_chain": 0, "errors": 0}
+        self._listed_cache = {}  # (symbol, expiry index) -> (expiry date, listed strikes)
+        if source == "synthetic":
+            self._market_start = datetime.now()
+            self._spots = {}   # symbol -> (market time, spot)
+            self._books = {}   # (symbol, expiry index) -> {"oi": array, "volume": array}
+            self.instrument_df = self._synthetic_instruments()
+        else:
+            self._load_recording(source)
+
+    # -- shared -----------------------------------------------------------------------------
+
+    def market_time(self):
+        """Simulated market time"""
+        elapsed = (self._clock() - self._started) * self.speed
+        if self.source != "synthetic" and self._span > 0:
+            elapsed %= self._span  # Replay loops over the recording
+        return self._market_start + timedelta(seconds=elapsed)
+
+    def _call(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+            profile = self.latency.get(endpoint)
+            delay = max(self._random.gauss(profile['mean'], profile.get('jitter', 0.0)), 0.0) if profile else 0.0
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.calls["errors"] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise ConnectionError(f"Simulated {endpoint} failure")
+
+    def get_ltp_data(self, names):
+        self._call("ltp")
+        names = [names] if isinstance(names, str) else list(names)
+        if self.source == "synthetic":
+            return {name: self._spot(name) for name in names if name in self.symbols}
+        prices = self._recorded_prices()
+        return {name: prices[name] for name in names if name in prices}
+
+    def ATM_Strike_Selection(self, Underlying, Expiry):
+        self._call("atm")
+        expiry, strikes = self._listed(Underlying, Expiry)
+        spot = self._spot(Underlying) if self.source == "synthetic" else self._recorded_prices().get(Underlying)
+        atm = float(strikes[np.argmin(np.abs(strikes - spot))])
+        return contract_name(Underlying, expiry, atm, "CE"), contract_name(Underlying, expiry, atm, "PE"), atm
+
+    def get_option_chain(self, Underlying, exchange, expiry, num_strikes):
+        self._call("option_chain")
+        if self.source == "synthetic":
+            return self._synthetic_chain(Underlying, expiry, num_strikes)
+        chains = self._chains.get((Underlying, expiry))
+        if not chains:
+            raise ValueError(f"No recorded option chains for {Underlying} expiry {expiry}")
+        times, entries = chains
+        position = max(bisect.bisect_right(times, self.market_time()) - 1, 0)
+        entry = entries[position]
+        with self._lock:
+            if entry["file"] not in self._frames:
+                self._frames[entry["file"]] = pd.read_csv(os.path.join(self.source, entry["file"]))
+            df = self._frames[entry["file"]]
+        return entry.get("metadata"), df.copy()
+
+    def _recorded_prices(self):
+        position = bisect.bisect_right(self._ltp_times, self.market_time()) - 1
+        return self._ltp_prices[max(position, 0)]
+
+    def reload_instruments(self):
+        """Synthetic listings roll forward to the current date; a recording keeps its own file"""
+        if self.source == "synthetic":
+            with self._lock:
+                self.instrument_df = self._synthetic_instruments()
+                self._listed_cache = {}
+        return self.instrument_df
+
+    def _listed(self, symbol, expiry_index):
+        key = (symbol, expiry_index)
+        if key not in self._listed_cache:
+            self._listed_cache[key] = self._find_listed(symbol, expiry_index)
+        return self._listed_cache[key]
+
+    def _find_listed(self, symbol, expiry_index):
+        df = self.instrument_df
+        df = df[df['SEM_INSTRUMENT_NAME'].isin(("OPTIDX", "OPTSTK"))]
+        contracts = df[df['SEM_TRADING_SYMBOL'].str.split('-').str[0] == symbol]
+        expiries = sorted(pd.to_datetime(contracts['SEM_EXPIRY_DATE']).dt.date.unique())
+        if expiry_index >= len(expiries):
+            raise ValueError(f"{symbol} has no expiry index {expiry_index}")
+        expiry = expiries[expiry_index]
+        listed = contracts[pd.to_datetime(contracts['SEM_EXPIRY_DATE']).dt.date == expiry]
+        return expiry, np.unique(listed['SEM_STRIKE_PRICE'].to_numpy(dtype=np.float64))
+
+    # -- synthetic market --------------------------------------------------------------------
+
+    def _base_price(self, symbol):
+        config = self.symbols[symbol]
+        return float(config.get('sim_price', config['strike_gap'] * 400))
+
+    def _expiries(self, symbol):
+        """Weekly expiries (Thursdays) from today, enough for the configured expiry count"""
+        today = date.today()
+        first = today + timedelta(days=(3 - today.weekday()) % 7)
+        count = self.symbols[symbol].get('num_expiries', 1) + 2
+        return [first + timedelta(weeks=i) for i in range(count)]
+
+    def _synthetic_instruments(self):
+        rows = []
+        for symbol, config in self.symbols.items():
+            gap = config['strike_gap']
+            centre = round(self._base_price(symbol) / gap) * gap
+            listed = max(3 * config.get('num_strikes', 10), 60)
+            strikes = centre + gap * np.arange(-listed, listed + 1)
+            strikes = strikes[strikes > 0]  # Low-priced symbols list fewer strikes below spot
+            is_index = config.get('exchange') == "INDEX"
+            rows.append({
+                'SEM_EXM_EXCH_ID': trading_exchange(config),
+                'SEM_SMST_SECURITY_ID': len(rows) + 1,
+                'SEM_INSTRUMENT_NAME': "INDEX" if is_index else "EQUITY",
+                'SEM_TRADING_SYMBOL': symbol,
+                'SEM_CUSTOM_SYMBOL': symbol,
+                'SEM_SERIES': None if is_index else "EQ",
+            })
+            instrument = "OPTIDX" if is_index else "OPTSTK"
+            for expiry in self._expiries(symbol):
+                for strike in strikes.tolist():
+                    for option_type in ("CE", "PE"):
+                        rows.append({
+                            'SEM_EXM_EXCH_ID': trading_exchange(config),
+                            'SEM_SMST_SECURITY_ID': len(rows) + 1,
+                            'SEM_INSTRUMENT_NAME': instrument,
+                            'SEM_TRADING_SYMBOL': f"{symbol}-{expiry.strftime('%b%Y')}-{strike:g}-{option_type}",
+                            'SEM_CUSTOM_SYMBOL': contract_name(symbol, expiry, strike, option_type),
+                            'SEM_EXPIRY_DATE': f"{expiry.isoformat()} 14:30:00",
+                            'SEM_STRIKE_PRICE': float(strike),
+                            'SEM_OPTION_TYPE': option_type,
+                            'SEM_LOT_UNITS': float(config.get('lot_size', 75)),
+                        })
+        return pd.DataFrame(rows)
+
+    def _spot(self, symbol):
+        """Geometric random walk on the simulated clock (15% annualized vol)"""
+        now = self.market_time()
+        with self._lock:
+            last, spot = self._spots.get(symbol, (self._market_start, self._base_price(symbol)))
+            dt = max((now - last).total_seconds(), 0.0) / TRADING_YEAR_SECONDS
+            if dt > 0:
+                spot *= float(np.exp(0.15 * np.sqrt(dt) * self._rng.standard_normal() - 0.5 * 0.15 ** 2 * dt))
+            self._spots[symbol] = (now, spot)
+        return round(spot, 2)
+
+    def _synthetic_chain(self, symbol, expiry_index, num_strikes):
+        expiry, listed = self._listed(symbol, expiry_index)
+        spot = self._spot(symbol)
+        centre = int(np.argmin(np.abs(listed - spot)))
+        strikes = listed[max(centre - num_strikes, 0):centre + num_strikes + 1]
+        n = len(strikes)
+        now = self.market_time()
+        t = max((datetime.combine(expiry, datetime.min.time()) + timedelta(hours=15.5) - now).total_seconds(),
+                3600.0) / (365 * 24 * 3600)
+        moneyness = np.log(strikes / spot)
+        vol = 0.13 + 0.8 * moneyness ** 2 - 0.15 * moneyness
+
+        with self._lock:
+            book = self._books.get((symbol, expiry_index))
+            if book is None or len(book["strikes"]) != n or not np.array_equal(book["strikes"], strikes):
+                base_oi = self._rng.integers(50_000, 5_000_000, size=(2, n)).astype(np.float64)
+                book = {"strikes": strikes, "open_oi": base_oi, "oi": base_oi.copy(), "volume": np.zeros((2, n))}
+                self._books[(symbol, expiry_index)] = book
+            book["oi"] = np.maximum(book["oi"] + self._rng.normal(0, 20_000, size=(2, n)).round(), 0)
+            book["volume"] += self._rng.integers(0, 50_000, size=(2, n))
+            oi, open_oi, volume = book["oi"].copy(), book["open_oi"], book["volume"].copy()
+
+        frame = {'Strike Price': strikes}
+        for row, (side, is_call) in enumerate((("CE", True), ("PE", False))):
+            price = bs_price(spot, strikes, t, 0.065, 0.0, vol, is_call)
+            ltp = np.maximum(np.round(price / 0.05) * 0.05, 0.05)
+            delta, theta, gamma, vega = bs_greeks(spot, strikes, t, 0.065, 0.0, vol, is_call)
+            frame.update({
+                f'{side} OI': oi[row], f'{side} Chg in OI': oi[row] - open_oi[row],
+                f'{side} Volume': volume[row], f'{side} IV': np.round(vol * 100, 2), f'{side} LTP': ltp,
+                f'{side} Bid Qty': self._rng.integers(75, 7500, n), f'{side} Bid': np.maximum(ltp - 0.05, 0.0),
+                f'{side} Ask': ltp + 0.05, f'{side} Ask Qty': self._rng.integers(75, 7500, n),
+                f'{side} Delta': delta, f'{side} Theta': theta, f'{side} Gamma': gamma, f'{side} Vega': vega,
+            })
+        atm = float(strikes[np.argmin(np.abs(strikes - spot))])
+        return atm, pd.DataFrame(frame)[QUOTE_COLUMNS]
+
+    # -- replay ------------------------------------------------------------------------------
+
+    def _load_recording(self, directory):
+        def read_lines(name):
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                return []
+            with open(path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+
+        ltp = sorted(read_lines("ltp.jsonl"), key=lambda e: e["time"])
+        chains = sorted(read_lines("chains.jsonl"), key=lambda e: e["time"])
+        if not ltp or not chains:
+            raise ValueError(f"No recorded LTPs or option chains in {directory}")
+        self._ltp_times = [datetime.fromisoformat(e["time"]) for e in ltp]
+        self._ltp_prices = [e["prices"] for e in ltp]
+        self._chains = {}
+        for entry in chains:
+            times, entries = self._chains.setdefault((entry["symbol"], entry["expiry"]), ([], []))
+            times.append(datetime.fromisoformat(entry["time"]))
+            entries.append(entry)
+        self._frames = {}
+        first = min(self._ltp_times[0], datetime.fromisoformat(chains[0]["time"]))
+        last = max(self._ltp_times[-1], datetime.fromisoformat(chains[-1]["time"]))
+        self._market_start = first
+        self._span = (last - first).total_seconds()
+        instruments = os.path.join(directory, "instruments.csv")
+        self.instrument_df = pd.read_csv(instruments) if os.path.exists(instruments) else None
+        logging.info(
+            f"Replaying {len(chains)} option chains and {len(ltp)} LTP snapshots from {directory} "
+            f"({self._span / 60:.1f} min at {self.speed}x)"
+        )
@@ -0,0 +1,171 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from snapshot import BIGINT_COLUMNS, QUOTE_COLUMNS, QUOTE_INDEX
+
+
+def select_strikes(snapshot, min_strike=None, max_strike=None, around_atm=None):
+    """Row mask of the strikes in [min_strike, max_strike] and/or the `around_atm` nearest either side of ATM"""
+    strikes = snapshot.strikes
+    mask = np.ones(len(strikes), dtype=bool)
+    if min_strike is not None:
+        mask &= strikes >= min_strike
+    if max_strike is not None:
+        mask &= strikes <= max_strike
+    if around_atm is not None:
+        order = np.argsort(strikes)
+        atm_position = np.searchsorted(strikes[order], snapshot.atm_strike)
+        near = np.zeros(len(strikes), dtype=bool)
+        near[order[max(atm_position - around_atm, 0):atm_position + around_atm + 1]] = True
+        mask &= near
+    return mask
+
+
+def snapshot_payload(snapshot, mask=None, columns=None):
+    """JSON-ready dict of a snapshot: scalars plus column-wise strike rows (NaN as null)"""
+    columns = [col for col in (columns or QUOTE_COLUMNS) if col in QUOTE_INDEX]
+    values = snapshot.values if mask is None else snapshot.values[mask]
+    values = values[:, [QUOTE_INDEX[col] for col in columns]]
+    data = {}
+    for i, col in enumerate(columns):
+        as_integer = col in BIGINT_COLUMNS
+        data[col] = [None if value != value else (int(round(value)) if as_integer else value)
+                     for value in values[:, i].tolist()]
+    return {
+        "symbol": snapshot.symbol,
+        "expiry_date": snapshot.expiry_date,
+        "fetch_time": snapshot.fetch_time,
+        "timestamp": snapshot.timestamp,
+        "spot_price": snapshot.spot_price,
+        "atm_strike": snapshot.atm_strike,
+        "strikes": len(values),
+        "data": data,
+    }
+
+
+class ChainCache:
+    """Latest `depth` full-chain snapshots per (symbol, expiry), held in memory
+
+    Snapshots are immutable once shaped, so readers get references without copying.
+    """
+
+    def __init__(self, depth=30):
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._chains = {}
+
+    def put(self, snapshot):
+        key = (snapshot.symbol, snapshot.expiry_date)
+        with self._lock:
+            ring = self._chains.get(key)
+            if ring is None:
+                ring = self._chains[key] = deque(maxlen=self.depth)
+            ring.append(snapshot)
+
+    def keys(self):
+        """[(symbol, expiry_date, latest fetch_time, snapshots held)]"""
+        with self._lock:
+            return sorted((symbol, expiry, ring[-1].fetch_time, len(ring))
+                          for (symbol, expiry), ring in self._chains.items())
+
+    def latest(self, symbol, expiry_date):
+        with self._lock:
+            ring = self._chains.get((symbol, expiry_date))
+            return ring[-1] if ring else None
+
+    def history(self, symbol, expiry_date, n=None, since=None):
+        """Snapshots oldest first: the last `n`, and/or those fetched at or after `since` (a fetch_time string)"""
+        with self._lock:
+            snapshots = list(self._chains.get((symbol, expiry_date), ()))
+        if since is not None:
+            snapshots = [s for s in snapshots if s.fetch_time >= since]
+        if n is not None:
+            snapshots = snapshots[-n:] if n > 0 else []
+        return snapshots
+
+    def drop_symbols(self, symbols):
+        """Forget symbols that are no longer collected"""
+        with self._lock:
+            for key in [key for key in self._chains if key[0] in symbols]:
+                del self._chains[key]
+
+
+def _strike_query(params):
+    def number(name, kind=float):
+        return kind(params[name][0]) if name in params else None
+    columns = params["columns"][0].split(",") if "columns" in params else None
+    return dict(min_strike=number("min_strike"), max_strike=number("max_strike"),
+                around_atm=number("around_atm", int)), columns
+
+
+class _ChainHandler(BaseHTTPRequestHandler):
+    """GET /chains, /chains/<SYMBOL>/<EXPIRY>/latest and /chains/<SYMBOL>/<EXPIRY>/history"""
+    cache = None
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        params = parse_qs(url.query)
+        try:
+            if parts == ["chains"]:
+                body = [{"symbol": s, "expiry_date": e, "fetch_time": t, "snapshots": n}
+                        for s, e, t, n in self.cache.keys()]
+            elif len(parts) == 4 and parts[0] == "chains" and parts[3] in ("latest", "history"):
+                # Expiries may be given as "26 JUN", "26%20JUN" or "26_JUN"
+                symbol, expiry = parts[1].upper(), parts[2]
+                if self.cache.latest(symbol, expiry) is None:
+                    expiry = expiry.replace("_", " ").upper()
+                selection, columns = _strike_query(params)
+                if parts[3] == "latest":
+                    snapshots = [self.cache.latest(symbol, expiry)]
+                    if snapshots[0] is None:
+                        snapshots = []
+                else:
+                    snapshots = self.cache.history(
+                        symbol, expiry,
+                        n=int(params["n"][0]) if "n" in params else None,
+                        since=params["since"][0] if "since" in params else None
+                    )
+                if not snapshots:
+                    self._send(404, {"error": f"no cached chain for {symbol} {expiry}"})
+                    return
+                payloads = [snapshot_payload(s, select_strikes(s, **selection), columns) for s in snapshots]
+                body = payloads[0] if parts[3] == "latest" else payloads
+            else:
+                self._send(404, {"error": "unknown path"})
+                return
+        except (ValueError, KeyError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(200, body, started)
+
+    def _send(self, status, body, started=None):
+        data = json.dumps(body, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if started is not None:
+            self.send_header("Server-Timing", f"cache;dur={(time.perf_counter() - started) * 1000:.3f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Polling consumers would otherwise flood the collector log
+
+
+def start_chain_api(cache, port, host="127.0.0.1"):
+    """Serve the chain cache as JSON from a daemon thread"""
+    handler = type("ChainHandler", (_ChainHandler,), {"cache": cache})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="chain-api", daemon=True)
+    thread.start()
+    logging.info(f"Serving cached option chains on http://{host}:{port}/chains")
+    return server
@@ -1,98 +1,197 @@
+import os
 from typing import Dict, List
 
+from symbols import load_symbols
+
 # Market hours configuration
 MARKET_START_TIME = "09:15:01" # correct it later
 MARKET_END_TIME = "15:30:00"
-COLLECTION_INTERVAL = 60  # select the number of seconds 1 min so 60 seconds
-START_TIME_OFFSET = 1 # Number of seconds after each minute to start data collection
 
-#we can fetch option chain data in 3 seconds via APIs because it takes time to reflect the oi data
+# Regular session per exchange; a symbol follows its "trading_exchange" (default NSE)
+EXCHANGE_SESSIONS = {
+    "NSE": {"start": MARKET_START_TIME, "end": MARKET_END_TIME},
+    "BSE": {"start": MARKET_START_TIME, "end": MARKET_END_TIME},
+}
+# Exchange holidays and special sessions (e.g. muhurat trading); add each year's circular
+TRADING_CALENDAR_FILE = "trading_holidays.json"
+COLLECTION_INTERVAL = 60  # Seconds between snapshots; 15 or 30 for sub-minute sampling
+START_TIME_OFFSET = 1 # Number of seconds after each interval boundary to start data collection
+MAX_PARALLEL_JOBS = 8  # Max number of symbol x expiry jobs fetched at the same time
 
-# Index options configuration
-INDEX_OPTIONS = {
-    "NIFTY": {
-        "exchange": "INDEX",
-        "num_expiries": 2,
-        "num_strikes": 25,  # Number of strikes above and below ATM
-        "strike_gap": 50,  # Gap between strikes
-    },
-    # "BANKNIFTY": {
-    #     "exchange": "INDEX",
-    #     "num_expiries": 1,
-    #     "num_strikes": 20,  # Number of strikes above and below ATM
-    #     "strike_gap": 100,  # Gap between strikes
-    # },
-    "SENSEX": {
-        "exchange": "INDEX",
-        "num_expiries": 1,
-        "num_strikes": 20,  # Number of strikes above and below ATM
-        "strike_gap": 100,  # Gap between strikes
-    },
+# Timezone of the exchange clock, used for TIMESTAMPTZ columns
+MARKET_TIMEZONE = "Asia/Kolkata"
 
+# Storage layout: "per_expiry" (one table per symbol/expiry) or "normalized"
+# (option_chain.quotes fact table partitioned by trade date + option_chain.instruments)
+STORAGE_MODE = "per_expiry"
+NORMALIZED_STORAGE_CONFIG = {
+    "symbol_partitions": 0,  # >1 hash-partitions each trade date by instrument into this many tables
 }
 
-# Stock options configuration
-STOCK_OPTIONS = {
-    "RELIANCE": {
-        "exchange": "NSE",
-        "num_expiries": 1,
-        "num_strikes": 20,  # Number of strikes above and below ATM
-        "strike_gap": 10,  # Gap between strikes
-    },
-    # "KOTAKBANK": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 20,  # Number of strikes above and below ATM
-    #     "strike_gap": 20,  # Gap between strikes
-    # },
-    #     "INFY": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 50,
-    #     "num_strikes": 5,  # Number of strikes above and below ATM
-    #     "strike_gap": 20,  # Gap between strikes
-    # },
-    #     "SBIN": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 5,  # Number of strikes above and below ATM
-    #     "strike_gap": 10,  # Gap between strikes
-    # },
-    #     "HDFCBANK": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 5,  # Number of strikes above and below ATM
-    #     "strike_gap": 20,  # Gap between strikes
-    # },
-    #     "TATAMOTORS": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 5,  # Number of strikes above and below ATM
-    #     "strike_gap": 10,  # Gap between strikes
-    # },
-    #     "CANBK": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 10,  # Number of strikes above and below ATM
-    #     "strike_gap": 1,  # Gap between strikes
-    # },
-    #     "COALINDIA": {
-    #     "exchange": "NSE",
-    #     "num_expiries": 1,
-    #     "num_strikes": 5,  # Number of strikes above and below ATM
-    #     "strike_gap": 5,  # Gap between strikes
-    # },
-
-
-
-    # Add more stocks here as needed
-}
-
-# Combine all symbols
-ALL_SYMBOLS = {**INDEX_OPTIONS, **STOCK_OPTIONS}
+# Write only strikes whose quotes changed since the previous fetch, with a full
+# chain (keyframe) every `keyframe_interval` snapshots and at the start of each day
+DELTA_CONFIG = {
+    "enabled": False,
+    "keyframe_interval": 15,
+}
+
+# What to do with ticks missed while a cycle overran: "skip" (drop them; the current tick
+# still runs if at most `grace` seconds late, default half an interval), "catch_up" (run up
+# to max_catch_up missed ticks back to back) or "coalesce" (one immediate cycle for all of them)
+SCHEDULER_CONFIG = {
+    "missed_tick_policy": "skip",
+    "max_catch_up": 3,
+    "grace": None,
+}
+
+# Sharded mode (`python main.py --shards N`): a supervisor splits ALL_SYMBOLS over N worker
+# processes, each with its own broker client and DB pool, and restarts any that crash or hang
+SHARD_CONFIG = {
+    "shards": 1,  # Default for --shards; 1 runs everything in one process
+    "split_rate_limits": True,  # Give each shard 1/N of RATE_LIMITS (limits are per broker account)
+    "max_restarts": 5,  # Give up on a shard after this many restarts within restart_window
+    "restart_window": 600,
+    "restart_backoff": 5,  # Seconds before the first restart, doubling for each further one
+    "stale_after": 600,  # Restart a shard that reports nothing for this many seconds while in session
+}
+
+# Per-stage latency histograms, cycle overruns and schedule skew in Prometheus text
+# format: rewritten to `textfile` after every cycle and/or served on http_port
+METRICS_CONFIG = {
+    "textfile": "metrics/option_chain.prom",
+    "http_port": None,  # e.g. 9108 to serve http://127.0.0.1:9108/metrics
+    "http_host": "127.0.0.1",
+}
+
+# Local Black-Scholes IV/Greeks for strikes where the broker's values are missing.
+# mode "fill" only fills gaps; "replace" overwrites broker values wherever IV solves
+GREEKS_CONFIG = {
+    "enabled": True,
+    "mode": "fill",
+    "detect_stale": True,  # In fill mode, also re-solve Greeks the broker left unchanged while LTP moved
+    "risk_free_rate": 0.065,
+    "dividend_yield": 0.0,
+    "expiry_time": "15:30:00",  # Options expire at the session close
+}
+
+# Per-snapshot analytics (PCR, max pain, ATM straddle, IV skew, OI buildup)
+# written to option_chain.chain_summary, one row per symbol/expiry/minute
+ANALYTICS_CONFIG = {
+    "enabled": True,
+    "max_pending_rows": 50000,  # Summary rows held while the database is down; the oldest are dropped
+}
+
+# How option chain rows are written: "copy" (COPY FROM STDIN) or "executemany"
+INSERT_MODE = "copy"
+
+# Shared PostgreSQL connection pool
+DB_POOL_CONFIG = {
+    "min_size": 1,
+    "max_size": 10,  # Keep at or above MAX_PARALLEL_JOBS so writers never queue for a connection
+    "health_check_interval": 30,  # Ping connections idle for longer than this many seconds
+    "acquire_timeout": 30,  # Seconds to wait for a free connection before giving up
+}
+
+# Write-behind queue between broker fetches and database inserts
+WRITE_BEHIND_CONFIG = {
+    "enabled": True,
+    "max_queue": 200,  # Snapshots held before fetchers start blocking
+    "workers": 2,  # Writer threads draining the queue
+    "batch_size": 8,  # Max snapshots (tables) written per transaction
+    "linger": 0.2,  # Seconds to wait for more snapshots before writing a batch
+    "put_timeout": 10,  # Seconds a fetcher blocks on a full queue before dropping
+    "shutdown_timeout": 30,  # Seconds to drain the queue on SIGTERM/SIGINT
+}
+
+# Local durable spool: every snapshot is appended here before it is written to Postgres
+SPOOL_CONFIG = {
+    "enabled": True,
+    "directory": "spool",
+    "segment_max_bytes": 64 * 1024 * 1024,  # Roll to a new segment file after this size
+    "fsync": True,  # fsync each snapshot and acknowledgement to disk
+    "replay_interval": 30,  # Seconds between attempts to load unacknowledged snapshots
+    "replay_batch_size": 20,  # Spooled snapshots loaded per transaction
+    "replay_max_attempts": 3,  # Failed replay passes before a snapshot is moved to spool/dead-letter.spool
+}
 
+# Stable strike windows: each (symbol, expiry) keeps the same strikes from minute to minute and
+# only extends or shifts once ATM is within num_strikes - shift_after strikes of an edge. Only
+# the window's strikes are requested and stored.
+STRIKE_WINDOW_CONFIG = {
+    "enabled": True,
+    "shift_after": 2,  # Strikes ATM may drift towards an edge before the window moves
+    "max_extra_strikes": 10,  # Growth beyond 2 * num_strikes + 1 before far strikes are dropped
+}
 
+# Streaming mode: subscribe to the broker market feed for each chain's strike window
+# (STRIKE_WINDOW_CONFIG) and snapshot the tick-updated chains every `cadence` seconds instead of
+# polling full chains every COLLECTION_INTERVAL. IV/Greeks of repriced contracts are left to
+# GREEKS_CONFIG, so keep it enabled when streaming.
+STREAMING_CONFIG = {
+    "enabled": False,
+    "cadence": 5,  # Seconds between snapshots
+    "feed": "dhan",  # "dhan" (websocket, needs the dhanhq package) or "replay"
+    "replay": {"path": None, "speed": 1.0, "loop": True},  # A tick file written via record_path
+    "record_path": None,  # e.g. "recordings/ticks.jsonl" to save every tick for replay
+    "seed_from_rest": True,  # Start each chain from one REST option chain (IV, Greeks, change in OI)
+}
 
+# In-memory ring buffer of the latest full chains per (symbol, expiry), served as JSON at
+# http://<http_host>:<http_port>/chains so readers need not poll Postgres
+CHAIN_CACHE_CONFIG = {
+    "enabled": True,
+    "depth": 30,  # Snapshots kept per (symbol, expiry): 30 minutes at a 60s interval
+    "http_port": None,  # e.g. 9110; shard N of a sharded run serves on http_port + N
+    "http_host": "127.0.0.1",
+}
+
+# Publish every chain to a memory-mapped file per (symbol, expiry) for readers on this host
+# (shared_chains.ChainReader gives them zero-copy NumPy views)
+SHARED_MEMORY_CONFIG = {
+    "enabled": False,
+    "directory": "/dev/shm/option_chain",  # tmpfs, so segments live in RAM
+    "max_strikes": 256,  # Strikes per segment slot; larger chains are not published
+}
+
+# End-of-day Parquet archive of the per-expiry tables (archive_eod.py; needs pyarrow)
+ARCHIVE_CONFIG = {
+    "directory": "archive",  # <directory>/trade_date=YYYY-MM-DD/symbol=SYM/<expiry>.parquet
+    "chunk_rows": 100000,  # Rows streamed from Postgres per fetch (and per row group at most)
+    "row_group_rows": 100000,  # Parquet row group size; row groups are the unit of predicate pushdown
+    "compression": "zstd",
+    "prune": False,  # Delete archived rows from Postgres once the file is verified
+}
+
+# Broker client: "dhan" (Tradehull, credentials from .env) or "fake" (local simulator for
+# dry runs and load tests). record_dir saves every LTP and option chain for later replay.
+BROKER_CONFIG = {
+    "kind": "dhan",
+    "record_dir": None,
+    "fake": {
+        "source": "synthetic",  # Or a directory written via record_dir, replayed on a loop
+        "speed": 1.0,  # Simulated market seconds per real second
+        "latency": {  # Seconds per call: {"mean": .., "jitter": ..}
+            "ltp": {"mean": 0.05, "jitter": 0.02},
+            "atm": {"mean": 0.1, "jitter": 0.03},
+            "option_chain": {"mean": 0.3, "jitter": 0.1},
+        },
+        "error_rate": 0.0,  # Probability that a call raises
+        "seed": None,
+    },
+}
+
+# Broker rate limits per endpoint class (requests per second and burst size)
+RATE_LIMITS = {
+    "ltp": {"rate": 1, "burst": 1},
+    "atm": {"rate": 1, "burst": 1},  # ATM_Strike_Selection does an LTP lookup of its own
+    "option_chain": {"rate": 1 / 3, "burst": 1},  # 1 request per 3 seconds
+}
+
+#we can fetch option chain data in 3 seconds via APIs because it takes time to reflect the oi data
 
+# Symbols to collect, read from a TOML file that is reloaded between cycles when it changes
+SYMBOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.toml")
+ALL_SYMBOLS = load_symbols(SYMBOLS_FILE)
 
 # Logging configuration
 LOG_CONFIG = {
@@ -1,11 +1,21 @@
+import io
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
 import psycopg2
+import psycopg2.errors
 from psycopg2.extras import RealDictCursor
 from sqlalchemy import create_engine, text, MetaData, Table, Column, String, Float, Integer, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import logging
+from config import INSERT_MODE, DB_POOL_CONFIG
+from snapshot import OptionChainSnapshot, OPTION_CHAIN_COLUMNS, BIGINT_COLUMNS, FLOAT_COLUMNS
+from metrics import metrics
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +44,178 @@ def get_db_connection():
         logging.error(f"Error connecting to database: {str(e)}")
         raise
 
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived psycopg2 connections"""
+
+    def __init__(self, min_size=1, max_size=10, health_check_interval=30, acquire_timeout=30):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, last_used)
+        self._size = 0
+        self._in_use = 0
+        self._stats = {
+            "borrowed": 0, "created": 0, "discarded": 0,
+            "health_checks": 0, "failed_health_checks": 0,
+            "total_wait": 0.0, "max_wait": 0.0, "peak_in_use": 0,
+        }
+
+    def _is_healthy(self, conn, last_used):
+        """Ping connections that have been idle longer than the check interval"""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        with self._cond:
+            self._stats["health_checks"] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+            logging.warning(f"Discarding unhealthy database connection: {str(e)}")
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def warm(self):
+        """Open connections up to min_size"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = get_db_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """Borrow a healthy connection, reconnecting if a pooled one has gone bad"""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No database connection free after {self.acquire_timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = get_db_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif not self._is_healthy(conn, last_used):
+                self._close(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._stats["borrowed"] += 1
+                self._stats["total_wait"] += waited
+                self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+                self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken"""
+        with self._cond:
+            self._in_use -= 1
+        if not discard and not conn.closed:
+            try:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Connection-level failure, let the next borrower reconnect
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def get_stats(self):
+        """Pool size, usage and wait metrics"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self._size, in_use=self._in_use, idle=len(self._idle))
+        stats["avg_wait"] = stats["total_wait"] / stats["borrowed"] if stats["borrowed"] else 0.0
+        return stats
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._close(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the process-wide connection pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(**DB_POOL_CONFIG)
+        return _pool
+
+def db_connection():
+    """Borrow a pooled connection: `with db_connection() as conn: ...`"""
+    return get_pool().connection()
+
 def get_db_session():
     """Get SQLAlchemy session"""
     db = SessionLocal()
@@ -44,19 +226,19 @@ def get_db_session():
         logging.error(f"Error creating database session: {str(e)}")
         raise
 
-def create_tables():
-    """Create all necessary tables for option chain data"""
+def create_tables(symbols=()):
+    """Create the base schema and one schema per configured symbol"""
     try:
         # Create base schema for option chain data
-        with engine.connect() as conn:
-            # Create schema for option_chain if it doesn't exist
-            conn.execute(text("CREATE SCHEMA IF NOT EXISTS option_chain"))
-            
-            # Create individual symbol schemas (this is what we actually use)
-            symbols = ['nifty', 'banknifty', 'sensex', 'reliance', 'kotakbank', 'infy']
-            for symbol in symbols:
-                schema_name = f"option_chain_{symbol}"
-                conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema_name}"))
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Create schema for option_chain if it doesn't exist
+                cursor.execute("CREATE SCHEMA IF NOT EXISTS option_chain")
+                
+                # Create individual symbol schemas (symbols added later get theirs on first write)
+                for symbol in symbols:
+                    schema_name = f"option_chain_{symbol.lower()}"
+                    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
             
             conn.commit()
         
@@ -66,13 +248,151 @@ def create_tables():
         logging.error(f"Error creating database tables: {str(e)}")
         raise
 
+def tables_without_snapshot_key():
+    """Per-expiry tables created before the unique (fetch_time, Strike Price) index, as (schema, table)"""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT t.table_schema, t.table_name FROM information_schema.tables t "
+                "WHERE t.table_schema LIKE 'option\\_chain\\_%' AND t.table_type = 'BASE TABLE' "
+                "AND NOT EXISTS (SELECT 1 FROM pg_indexes i WHERE i.schemaname = t.table_schema "
+                "AND i.tablename = t.table_name "
+                "AND i.indexdef LIKE 'CREATE UNIQUE INDEX % (fetch_time, \"Strike Price\")') "
+                "ORDER BY 1, 2"
+            )
+            tables = cursor.fetchall()
+        conn.rollback()
+    return tables
+
+def add_snapshot_key(schema_name, table_name, dry_run=False):
+    """Delete duplicate (fetch_time, Strike Price) rows, keeping the lowest id, and add the unique index
+
+    Returns the number of duplicate rows (removed, or that would be removed with dry_run).
+    """
+    qualified_table = f'"{schema_name}"."{table_name}"'
+    # Every row after the first of its (fetch_time, Strike Price), in one pass over the table
+    duplicates = (
+        f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY "fetch_time", "Strike Price" ORDER BY id) AS n '
+        f'FROM {qualified_table} WHERE "fetch_time" IS NOT NULL AND "Strike Price" IS NOT NULL) d WHERE n > 1'
+    )
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            if dry_run:
+                cursor.execute(f"SELECT COUNT(*) FROM ({duplicates}) dup")
+                count = cursor.fetchone()[0]
+                conn.rollback()
+                return count
+            cursor.execute(f"DELETE FROM {qualified_table} WHERE id IN ({duplicates})")
+            count = cursor.rowcount
+            cursor.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_snapshot_key" '
+                f'ON {qualified_table} ("fetch_time", "Strike Price")'
+            )
+        conn.commit()
+    return count
+
+KEYFRAME_TABLE = "option_chain.delta_keyframes"
+
+def create_keyframe_table():
+    """Create the table recording when each delta-encoding keyframe was written"""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS option_chain")
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {KEYFRAME_TABLE} (
+                symbol VARCHAR(20) NOT NULL,
+                expiry_date VARCHAR(50) NOT NULL,
+                fetch_time TIMESTAMP NOT NULL,
+                PRIMARY KEY (symbol, expiry_date, fetch_time)
+            )
+            """)
+        conn.commit()
+
+def record_keyframes(cursor, snapshots):
+    """Mark delta-encoding keyframes inside the caller's transaction"""
+    rows = [
+        (s.symbol, s.expiry_date, s.fetch_time)
+        for s in snapshots if getattr(s, 'is_keyframe', None)
+    ]
+    if rows:
+        cursor.executemany(
+            f"INSERT INTO {KEYFRAME_TABLE} (symbol, expiry_date, fetch_time) "
+            f"VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+            rows
+        )
+
+class TableRegistry:
+    """In-process registry of option chain tables already known to exist"""
+
+    def __init__(self):
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(schema, table):
+        # Unquoted identifiers are folded to lower case by Postgres
+        return schema.lower(), table.lower()
+
+    def warm(self):
+        """Load every existing option chain table from information_schema"""
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT table_schema, table_name FROM information_schema.tables "
+                    "WHERE table_schema LIKE 'option\\_chain\\_%'"
+                )
+                rows = cursor.fetchall()
+            conn.rollback()
+        with self._lock:
+            self._tables = {self._key(schema, table) for schema, table in rows}
+        return len(rows)
+
+    def contains(self, schema, table):
+        with self._lock:
+            return self._key(schema, table) in self._tables
+
+    def add(self, schema, table):
+        with self._lock:
+            self._tables.add(self._key(schema, table))
+
+    def discard(self, schema, table):
+        with self._lock:
+            self._tables.discard(self._key(schema, table))
+
+
+table_registry = TableRegistry()
+
+def warm_table_registry():
+    """Warm the table registry at startup"""
+    try:
+        count = table_registry.warm()
+        logging.info(f"Table registry loaded with {count} existing tables")
+    except Exception as e:
+        # Tables will be registered lazily as they are first written
+        logging.warning(f"Could not warm table registry: {str(e)}")
+
+def symbol_table_name(symbol, expiry_date):
+    """Table name for a symbol and expiry date"""
+    return f"{symbol}_{expiry_date.replace(' ', '_').replace('-', '_')}"
+
+def ensure_symbol_table(symbol, expiry_date):
+    """Return the table for a symbol and expiry, running DDL only when it is not known to exist"""
+    table_name = symbol_table_name(symbol, expiry_date)
+    schema_name = f"option_chain_{symbol}"
+    if not table_registry.contains(schema_name, table_name):
+        with metrics.time("option_chain_stage_seconds", stage="ddl", symbol=symbol, expiry=expiry_date):
+            create_symbol_table(symbol, expiry_date)
+        table_registry.add(schema_name, table_name)
+    return table_name
+
 def create_symbol_table(symbol, expiry_date):
     """Create table for a specific symbol and expiry date"""
     try:
-        table_name = f"{symbol}_{expiry_date.replace(' ', '_').replace('-', '_')}"
+        table_name = symbol_table_name(symbol, expiry_date)
         
-        # Create table with exact same structure as CSV
+        # Create table with exact same structure as CSV (and the schema, for newly added symbols)
         create_table_sql = f"""
+        CREATE SCHEMA IF NOT EXISTS option_chain_{symbol};
         CREATE TABLE IF NOT EXISTS option_chain_{symbol}.{table_name} (
             id SERIAL PRIMARY KEY,
             "Symbol" VARCHAR(20),
@@ -110,10 +430,13 @@ def create_symbol_table(symbol, expiry_date):
             "timestamp" VARCHAR(10),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
+        CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_snapshot_key
+            ON option_chain_{symbol}.{table_name} ("fetch_time", "Strike Price");
         """
         
-        with engine.connect() as conn:
-            conn.execute(text(create_table_sql))
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(create_table_sql)
             conn.commit()
         
         logging.info(f"Table {table_name} created successfully in schema option_chain_{symbol}")
@@ -123,59 +446,152 @@ def create_symbol_table(symbol, expiry_date):
         logging.error(f"Error creating table for {symbol}_{expiry_date}: {str(e)}")
         raise
 
-def insert_option_chain_data(symbol, expiry_date, df):
-    """Insert option chain data into PostgreSQL table"""
+def _column_list(columns):
+    """Quote column names for use in SQL"""
+    return ", ".join(f'"{col}"' for col in columns)
+
+def build_copy_buffer(df, columns=OPTION_CHAIN_COLUMNS):
+    """Build an in-memory CSV buffer for COPY straight from the DataFrame columns"""
+    data = {}
+    for col in columns:
+        values = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if col in BIGINT_COLUMNS:
+            values = pd.to_numeric(values, errors='coerce').round().astype('Int64')
+        elif col in FLOAT_COLUMNS:
+            values = pd.to_numeric(values, errors='coerce')
+        data[col] = values
+    buffer = io.StringIO()
+    # Empty unquoted fields are read back as NULL by COPY ... (FORMAT csv)
+    pd.DataFrame(data, columns=columns).to_csv(buffer, header=False, index=False, na_rep='')
+    buffer.seek(0)
+    return buffer
+
+def copy_option_chain_rows(cursor, qualified_table, data):
+    """Stream a snapshot or DataFrame into a table with COPY ... FROM STDIN"""
+    if isinstance(data, OptionChainSnapshot):
+        buffer = data.to_copy_buffer()
+    else:
+        buffer = build_copy_buffer(data)
+    cursor.copy_expert(
+        f"COPY {qualified_table} ({_column_list(OPTION_CHAIN_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def executemany_option_chain_rows(cursor, qualified_table, data):
+    """Insert rows one INSERT statement per row (fallback path)"""
+    placeholders = ", ".join(f"%({col})s" for col in OPTION_CHAIN_COLUMNS)
+    insert_sql = f"""
+    INSERT INTO {qualified_table} ({_column_list(OPTION_CHAIN_COLUMNS)})
+    VALUES ({placeholders})
+    """
+    if isinstance(data, OptionChainSnapshot):
+        records = data.to_records()
+    else:
+        records = data.astype(object).where(pd.notna(data), None).to_dict('records')
+    cursor.executemany(insert_sql, records)
+
+def _write_rows(cursor, qualified_table, data, mode):
+    """Write a snapshot or DataFrame into one table with the chosen insert mode"""
+    if mode == "copy":
+        copy_option_chain_rows(cursor, qualified_table, data)
+    elif mode == "executemany":
+        executemany_option_chain_rows(cursor, qualified_table, data)
+    else:
+        raise ValueError(f"Unknown insert mode: {mode}")
+
+def insert_option_chain_data(symbol, expiry_date, data, mode=None):
+    """Insert an option chain snapshot (or DataFrame) into its PostgreSQL table"""
+    mode = mode or INSERT_MODE
     try:
-        table_name = create_symbol_table(symbol, expiry_date)
-        
-        # Insert data using SQLAlchemy
-        with engine.connect() as conn:
-            # Convert DataFrame to list of dictionaries for insertion
-            df_dict = df.to_dict('records')
-            
-            # Insert data using executemany for better performance
-            insert_sql = f"""
-            INSERT INTO option_chain_{symbol}.{table_name} (
-                "Symbol", "expiry_date", "fetch_time", "Spot Price", "ATM Strike",
-                "CE OI", "CE Chg in OI", "CE Volume", "CE IV", "CE LTP",
-                "CE Bid Qty", "CE Bid", "CE Ask", "CE Ask Qty",
-                "CE Delta", "CE Theta", "CE Gamma", "CE Vega",
-                "Strike Price",
-                "PE Bid Qty", "PE Bid", "PE Ask", "PE Ask Qty",
-                "PE LTP", "PE IV", "PE Volume", "PE Chg in OI", "PE OI",
-                "PE Delta", "PE Theta", "PE Gamma", "PE Vega",
-                "timestamp"
-            ) VALUES (
-                %(Symbol)s, %(expiry_date)s, %(fetch_time)s, %(Spot Price)s, %(ATM Strike)s,
-                %(CE OI)s, %(CE Chg in OI)s, %(CE Volume)s, %(CE IV)s, %(CE LTP)s,
-                %(CE Bid Qty)s, %(CE Bid)s, %(CE Ask)s, %(CE Ask Qty)s,
-                %(CE Delta)s, %(CE Theta)s, %(CE Gamma)s, %(CE Vega)s,
-                %(Strike Price)s,
-                %(PE Bid Qty)s, %(PE Bid)s, %(PE Ask)s, %(PE Ask Qty)s,
-                %(PE LTP)s, %(PE IV)s, %(PE Volume)s, %(PE Chg in OI)s, %(PE OI)s,
-                %(PE Delta)s, %(PE Theta)s, %(PE Gamma)s, %(PE Vega)s,
-                %(timestamp)s
-            )
-            """
-            
-            # Execute batch insert using psycopg2 for better performance
-            with get_db_connection() as pg_conn:
-                with pg_conn.cursor() as cursor:
-                    cursor.executemany(insert_sql, df_dict)
-                pg_conn.commit()
+        for attempt in range(2):
+            table_name = ensure_symbol_table(symbol, expiry_date)
+            qualified_table = f"option_chain_{symbol}.{table_name}"
+            try:
+                with db_connection() as pg_conn:
+                    with pg_conn.cursor() as cursor:
+                        _write_rows(cursor, qualified_table, data, mode)
+                        record_keyframes(cursor, [data])
+                    pg_conn.commit()
+                break
+            except psycopg2.errors.UndefinedTable:
+                # Table was dropped behind our back, forget it and recreate once
+                table_registry.discard(f"option_chain_{symbol}", table_name)
+                if attempt:
+                    raise
+                logging.warning(f"Table {qualified_table} is missing, recreating it")
         
-        logging.info(f"Successfully inserted {len(df)} records into {table_name}")
-        return len(df)
+        logging.info(f"Successfully inserted {len(data)} records into {table_name} ({mode})")
+        return len(data)
         
     except Exception as e:
         logging.error(f"Error inserting data for {symbol}_{expiry_date}: {str(e)}")
         raise
 
+def insert_option_chain_batch(batch, mode=None):
+    """Insert several (symbol, expiry_date, data) snapshots in a single transaction"""
+    mode = mode or INSERT_MODE
+    targets = []
+    for symbol, expiry_date, data in batch:
+        table_name = ensure_symbol_table(symbol, expiry_date)
+        targets.append((f"option_chain_{symbol}", table_name, data))
+    try:
+        with db_connection() as pg_conn:
+            with pg_conn.cursor() as cursor:
+                for schema_name, table_name, data in targets:
+                    _write_rows(cursor, f"{schema_name}.{table_name}", data, mode)
+                record_keyframes(cursor, [data for _, _, data in targets])
+            pg_conn.commit()
+    except psycopg2.errors.UndefinedTable:
+        # We cannot tell which table went missing, so re-check all of them next time
+        for schema_name, table_name, _ in targets:
+            table_registry.discard(schema_name, table_name)
+        raise
+    rows = sum(len(data) for _, _, data in targets)
+    logging.info(f"Successfully inserted {rows} records into {len(targets)} tables in one transaction ({mode})")
+    return rows
+
+def replay_option_chain_batch(records, keyframes=()):
+    """Idempotently load spooled (symbol, expiry_date, csv_body) snapshots in one transaction"""
+    targets = []
+    for symbol, expiry_date, body in records:
+        table_name = ensure_symbol_table(symbol, expiry_date)
+        targets.append((f"option_chain_{symbol}", table_name, body))
+    columns = _column_list(OPTION_CHAIN_COLUMNS)
+    try:
+        with db_connection() as pg_conn:
+            with pg_conn.cursor() as cursor:
+                for i, (schema_name, table_name, body) in enumerate(targets):
+                    qualified_table = f"{schema_name}.{table_name}"
+                    stage = f"spool_stage_{i}"
+                    # Stage through COPY, then skip rows already stored under the snapshot key
+                    cursor.execute(
+                        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+                        f"SELECT {columns} FROM {qualified_table} WITH NO DATA"
+                    )
+                    cursor.copy_expert(
+                        f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                        io.BytesIO(body)
+                    )
+                    cursor.execute(
+                        f"INSERT INTO {qualified_table} ({columns}) "
+                        f"SELECT {columns} FROM {stage} ON CONFLICT DO NOTHING"
+                    )
+                record_keyframes(cursor, keyframes)
+            pg_conn.commit()
+    except psycopg2.errors.UndefinedTable:
+        for schema_name, table_name, _ in targets:
+            table_registry.discard(schema_name, table_name)
+        raise
+    logging.info(f"Replayed {len(targets)} spooled snapshots")
+    return len(targets)
+
 def test_database_connection():
     """Test database connection"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT 1"))
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
             logging.info("Database connection successful")
             return True
     except Exception as e:
@@ -0,0 +1,112 @@
+import logging
+import threading
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from config import STORAGE_MODE
+from database import db_connection, symbol_table_name, KEYFRAME_TABLE
+from normalized import reconstruct_normalized_chain
+from snapshot import OPTION_CHAIN_COLUMNS
+
+
+class ChangeDetector:
+    """Keeps the last written chain per (symbol, expiry) and emits only strikes whose quotes changed"""
+
+    def __init__(self, keyframe_interval=15):
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()
+        self._last = {}  # (symbol, expiry_date) -> (strike -> row, snapshots since keyframe, trade date)
+        self.stats = {"snapshots": 0, "keyframes": 0, "rows_in": 0, "rows_out": 0}
+
+    def filter(self, snapshot):
+        """Return the snapshot to write: a full keyframe or only the changed strikes"""
+        key = (snapshot.symbol, snapshot.expiry_date)
+        strikes = snapshot.strikes
+        current = {strike: row for strike, row in zip(strikes.tolist(), snapshot.values) if strike == strike}
+        trade_date = snapshot.fetch_time[:10]
+
+        with self._lock:
+            previous, since_keyframe, previous_date = self._last.get(key, (None, 0, None))
+            # Each trading day starts with a keyframe, and a dropped strike would otherwise
+            # look frozen on the read side
+            keyframe = (
+                previous is None
+                or previous_date != trade_date
+                or since_keyframe + 1 >= self.keyframe_interval
+                or not previous.keys() <= current.keys()
+            )
+            if keyframe:
+                result = replace(snapshot, is_keyframe=True)
+                self._last[key] = (current, 0, trade_date)
+            else:
+                changed = np.zeros(len(strikes), dtype=bool)
+                for i, strike in enumerate(strikes.tolist()):
+                    before = previous.get(strike)
+                    if before is None:
+                        changed[i] = True
+                    else:
+                        now = snapshot.values[i]
+                        same = (now == before) | (np.isnan(now) & np.isnan(before))
+                        changed[i] = not same.all()
+                # The strike nearest ATM always goes out so every minute keeps its spot and ATM
+                if not np.isnan(strikes).all():
+                    changed[np.nanargmin(np.abs(strikes - snapshot.atm_strike))] = True
+                result = replace(snapshot, values=snapshot.values[changed], is_keyframe=False)
+                self._last[key] = (current, since_keyframe + 1, trade_date)
+
+            self.stats["snapshots"] += 1
+            self.stats["keyframes"] += int(keyframe)
+            self.stats["rows_in"] += len(snapshot)
+            self.stats["rows_out"] += len(result)
+        return result
+
+    def reset(self, symbol=None, expiry_date=None):
+        """Forget state so the next snapshot is written as a keyframe"""
+        with self._lock:
+            if symbol is None:
+                self._last.clear()
+            else:
+                self._last.pop((symbol, expiry_date), None)
+
+
+def reconstruct_chain(symbol, expiry_date, at_time):
+    """Rebuild the full chain as it stood at `at_time` from a keyframe plus later changed rows"""
+    if STORAGE_MODE == "normalized":
+        return reconstruct_normalized_chain(symbol, expiry_date, at_time)
+    table = f"option_chain_{symbol}.{symbol_table_name(symbol, expiry_date)}"
+    columns = ", ".join(f'"{col}"' for col in OPTION_CHAIN_COLUMNS)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT MAX(fetch_time) FROM {table} WHERE fetch_time <= %s", (at_time,)
+            )
+            latest = cursor.fetchone()[0]
+            if latest is None:
+                conn.rollback()
+                return pd.DataFrame(columns=OPTION_CHAIN_COLUMNS)
+            cursor.execute(
+                f"SELECT MAX(fetch_time) FROM {KEYFRAME_TABLE} "
+                f"WHERE symbol = %s AND expiry_date = %s AND fetch_time <= %s",
+                (symbol, expiry_date, latest)
+            )
+            # Without a keyframe (delta never enabled) the latest snapshot is already complete
+            keyframe = cursor.fetchone()[0] or latest
+            cursor.execute(
+                f'SELECT DISTINCT ON ("Strike Price") {columns} FROM {table} '
+                f'WHERE fetch_time >= %s AND fetch_time <= %s '
+                f'ORDER BY "Strike Price", fetch_time DESC',
+                (keyframe, latest)
+            )
+            rows = cursor.fetchall()
+        conn.rollback()
+
+    df = pd.DataFrame(rows, columns=OPTION_CHAIN_COLUMNS)
+    # Per-snapshot fields come from the snapshot being reconstructed
+    current = df[df['fetch_time'] == latest].iloc[0]
+    for col in ('Spot Price', 'ATM Strike', 'fetch_time', 'timestamp'):
+        df[col] = current[col]
+    logging.debug(f"Reconstructed {symbol}_{expiry_date} at {latest} from keyframe {keyframe}")
+    return df.reset_index(drop=True)
+
@@ -0,0 +1,70 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+
+@dataclass
+class JobResult:
+    """Outcome of a single collection job"""
+    name: str
+    ok: bool
+    duration: float
+    result: Any = None
+    error: Optional[str] = None
+
+
+class CollectionEngine:
+    """Run collection jobs concurrently with a bounded number of workers"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="collector"
+        )
+
+    def resize(self, max_workers):
+        """Swap in a pool of a different size between cycles"""
+        if max_workers == self.max_workers:
+            return
+        old = self._executor
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="collector"
+        )
+        old.shutdown(wait=False)
+
+    def _run_job(self, name, func, args):
+        """Run one job, isolating any error it raises"""
+        start_time = time.monotonic()
+        try:
+            result = func(*args)
+            ok = result is not False
+            return JobResult(name, ok, time.monotonic() - start_time, result)
+        except Exception as e:
+            logging.error(f"Job {name} failed: {str(e)}", exc_info=True)
+            return JobResult(name, False, time.monotonic() - start_time, error=str(e))
+
+    def run_jobs(self, jobs: List[Tuple[str, Callable, tuple]]) -> List[JobResult]:
+        """Run (name, func, args) jobs in parallel and wait for all of them"""
+        futures = [self._executor.submit(self._run_job, name, func, args) for name, func, args in jobs]
+        return [future.result() for future in as_completed(futures)]
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=wait)
+
+
+def summarize_results(results: List[JobResult]):
+    """Summarize job results for cycle logging"""
+    failed = [r.name for r in results if not r.ok]
+    slowest = max(results, key=lambda r: r.duration, default=None)
+    return {
+        "jobs": len(results),
+        "failed": failed,
+        "slowest": slowest.name if slowest else None,
+        "slowest_duration": slowest.duration if slowest else 0.0,
+    }
@@ -0,0 +1,277 @@
+import math
+import threading
+from dataclasses import replace
+from datetime import datetime
+
+import numpy as np
+
+from snapshot import QUOTE_INDEX
+from utils import parse_expiry_date
+
+try:
+    from scipy.special import ndtr as norm_cdf
+except ImportError:  # scipy is optional
+    norm_cdf = None
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+_SQRT_2PI = math.sqrt(2 * math.pi)
+
+
+def _norm_cdf(x):
+    """Standard normal CDF, absolute error below 1e-14 (Hart's rational approximation, per West 2005)"""
+    z = np.abs(x)
+    numerator = ((((((3.52624965998911e-02 * z + 0.700383064443688) * z + 6.37396220353165) * z
+                    + 33.912866078383) * z + 112.079291497871) * z + 221.213596169931) * z
+                 + 220.206867912376)
+    denominator = (((((((8.83883476483184e-02 * z + 1.75566716318264) * z + 16.064177579207) * z
+                      + 86.7807322029461) * z + 296.564248779674) * z + 637.333633378831) * z
+                    + 793.826512519948) * z + 440.413735824752)
+    # Hart switches to a continued fraction beyond |x| = 7.07, where the tail is already < 1e-12
+    tail = np.exp(-0.5 * z * z) * numerator / denominator
+    return np.where(x > 0, 1 - tail, tail)
+
+
+if norm_cdf is None:
+    norm_cdf = _norm_cdf
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def _d1_d2(spot, strike, t, rate, dividend_yield, vol):
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate - dividend_yield + 0.5 * vol * vol) * t) / (vol * sqrt_t)
+    return d1, d1 - vol * sqrt_t
+
+
+def _price_and_vega(log_moneyness, drift, sqrt_t, spot_df, strike_df, vol, is_call):
+    """Price and vega (per unit vol) with a single CDF evaluation over d1 and d2
+
+    Takes the vol-independent terms precomputed so the IV solver only redoes the vol-dependent
+    ones each iteration.
+    """
+    vol_sqrt_t = vol * sqrt_t
+    d1 = (log_moneyness + drift) / vol_sqrt_t + 0.5 * vol_sqrt_t
+    n = len(d1)
+    cdf = norm_cdf(np.concatenate([d1, d1 - vol_sqrt_t]))
+    call = spot_df * cdf[:n] - strike_df * cdf[n:]
+    # Puts by put-call parity
+    price = np.where(is_call, call, call - spot_df + strike_df)
+    return price, spot_df * norm_pdf(d1) * sqrt_t
+
+
+def bs_price(spot, strike, t, rate, dividend_yield, vol, is_call):
+    """Black-Scholes(-Merton) price for arrays of calls (is_call True) and puts"""
+    spot, strike, t, vol, is_call = (
+        a.ravel() for a in np.broadcast_arrays(np.asarray(spot, dtype=np.float64), strike, t, vol, is_call)
+    )
+    price, _ = _price_and_vega(
+        np.log(spot / strike), (rate - dividend_yield) * t, np.sqrt(t),
+        spot * np.exp(-dividend_yield * t), strike * np.exp(-rate * t), vol, is_call
+    )
+    return price
+
+
+def bs_greeks(spot, strike, t, rate, dividend_yield, vol, is_call):
+    """Delta, theta (per calendar day), gamma and vega (per vol point), matching broker units"""
+    d1, d2 = _d1_d2(spot, strike, t, rate, dividend_yield, vol)
+    sqrt_t = np.sqrt(t)
+    carry = np.exp(-dividend_yield * t)
+    strike_df = strike * np.exp(-rate * t)
+    pdf = norm_pdf(d1)
+    n_d1, n_d2 = np.split(norm_cdf(np.concatenate([d1, d2])), 2)
+
+    delta = np.where(is_call, carry * n_d1, carry * (n_d1 - 1))
+    gamma = carry * pdf / (spot * vol * sqrt_t)
+    vega = spot * carry * pdf * sqrt_t / 100
+    decay = -spot * carry * pdf * vol / (2 * sqrt_t)
+    theta_call = decay - rate * strike_df * n_d2 + dividend_yield * spot * carry * n_d1
+    theta_put = decay + rate * strike_df * (1 - n_d2) - dividend_yield * spot * carry * (1 - n_d1)
+    theta = np.where(is_call, theta_call, theta_put) / 365
+    return delta, theta, gamma, vega
+
+
+def implied_vol(price, spot, strike, t, rate, dividend_yield, is_call, tol=1e-6, max_iter=100):
+    """Vectorized implied volatility: Newton steps kept inside a shrinking bisection bracket
+
+    Only options that have not converged are re-priced each iteration. Prices outside the
+    no-arbitrage bounds (or non-positive) give NaN.
+    """
+    price, spot, strike, t, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=np.float64), spot, strike, t, is_call
+    )
+    price, spot, strike, t, is_call = (a.ravel() for a in (price, spot, strike, t, is_call))
+    spot_df = spot * np.exp(-dividend_yield * t)
+    strike_df = strike * np.exp(-rate * t)
+    lower = np.where(is_call, np.maximum(spot_df - strike_df, 0), np.maximum(strike_df - spot_df, 0))
+    upper = np.where(is_call, spot_df, strike_df)
+    with np.errstate(invalid='ignore'):
+        valid = (price > lower) & (price < upper) & (t > 0) & (strike > 0) & (spot > 0)
+
+    vol = np.full(price.shape, np.nan)
+    idx = np.flatnonzero(valid)
+    spot_df, strike_df = spot_df[idx], strike_df[idx]
+    # Solve every strike on its out-of-the-money side (same vol by put-call parity): ITM
+    # premiums are almost all intrinsic value and pin down vol poorly
+    call = strike_df >= spot_df
+    p = price[idx] + np.where(is_call[idx] == call, 0, np.where(call, spot_df - strike_df, strike_df - spot_df))
+    lo = np.full(p.shape, MIN_VOL)
+    hi = np.full(p.shape, MAX_VOL)
+    # Corrado-Miller closed-form estimate (on the call price) as the starting point
+    call_price = np.where(call, p, p + spot_df - strike_df)
+    half = call_price - 0.5 * (spot_df - strike_df)
+    root = np.sqrt(np.maximum(half * half - (spot_df - strike_df) ** 2 / np.pi, 0))
+    sqrt_t = np.sqrt(t[idx])
+    sigma = np.clip(_SQRT_2PI / (sqrt_t * (spot_df + strike_df)) * (half + root), 0.05, 2.0)
+    log_moneyness, drift = np.log(spot[idx] / strike[idx]), (rate - dividend_yield) * t[idx]
+
+    for _ in range(max_iter):
+        if not len(idx):
+            break
+        model, vega = _price_and_vega(log_moneyness, drift, sqrt_t, spot_df, strike_df, sigma, call)
+        diff = model - p
+        # Done once the next Newton step would move vol by less than tol (or the price is exact)
+        active = (np.abs(diff) > np.maximum(tol * vega, 1e-12 * spot_df)) & (hi - lo > 1e-12)
+        vol[idx[~active]] = sigma[~active]
+        if not active.all():
+            (idx, p, call, lo, hi, sigma, model, diff, vega,
+             log_moneyness, drift, sqrt_t, spot_df, strike_df) = (
+                a[active] for a in (idx, p, call, lo, hi, sigma, model, diff, vega,
+                                    log_moneyness, drift, sqrt_t, spot_df, strike_df)
+            )
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+        # Newton on log price, which is close to linear in vol for OTM options; a step may at
+        # most halve or double vol, since log price falls away steeply at low vol
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = np.clip(sigma - np.log(model / p) * model / vega, 0.5 * sigma, 2 * sigma)
+        inside = (newton > lo) & (newton < hi)
+        sigma = np.where(inside, newton, 0.5 * (lo + hi))
+    # Anything left did not converge within max_iter and stays NaN
+    return vol.reshape(np.shape(price))
+
+
+def time_to_expiry(fetch_time, expiry, expiry_time="15:30:00"):
+    """Year fraction from fetch_time to the expiry session close (at least one minute)"""
+    expires_at = datetime.combine(expiry, datetime.strptime(expiry_time, "%H:%M:%S").time())
+    seconds = (expires_at - fetch_time).total_seconds()
+    return max(seconds, 60.0) / SECONDS_PER_YEAR
+
+
+def _option_price(values, side):
+    """Bid/ask mid where both sides are quoted, otherwise the last traded price"""
+    bid = values[:, QUOTE_INDEX[f'{side} Bid']]
+    ask = values[:, QUOTE_INDEX[f'{side} Ask']]
+    ltp = values[:, QUOTE_INDEX[f'{side} LTP']]
+    with np.errstate(invalid='ignore'):
+        quoted = (bid > 0) & (ask >= bid)
+    return np.where(quoted, 0.5 * (bid + ask), ltp)
+
+
+GREEK_FIELDS = ('IV', 'Delta', 'Theta', 'Gamma', 'Vega')
+
+
+class StaleGreeksDetector:
+    """Remembers each (symbol, expiry)'s broker quotes to spot IV/Greeks left stale by the broker
+
+    An option is stale when its LTP moved since the previous snapshot but the broker's IV and
+    every Greek are exactly unchanged, i.e. they were not recomputed for the new price. It stays
+    stale until the broker's values change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}  # (symbol, expiry) -> (broker values, stale mask) of the previous snapshot
+
+    def stale(self, snapshot):
+        """(2 x strikes) mask, CE rows then PE rows, of options with stale broker Greeks"""
+        values = snapshot.values
+        key = (snapshot.symbol, snapshot.expiry_date)
+        n = len(values)
+        mask = np.zeros(2 * n, dtype=bool)
+        with self._lock:
+            previous = self._last.get(key)
+            self._last[key] = (values, mask)
+        if previous is None:
+            return mask
+        before_values, before_mask = previous
+        m = len(before_values)
+        strike = QUOTE_INDEX['Strike Price']
+        _, rows, prev_rows = np.intersect1d(values[:, strike], before_values[:, strike], return_indices=True)
+        now, before = values[rows], before_values[prev_rows]
+        for offset, prev_offset, side in ((0, 0, 'CE'), (n, m, 'PE')):
+            ltp = QUOTE_INDEX[f'{side} LTP']
+            greeks = [QUOTE_INDEX[f'{side} {field}'] for field in GREEK_FIELDS]
+            with np.errstate(invalid='ignore'):
+                moved = np.abs(now[:, ltp] - before[:, ltp]) > 0
+                unchanged = (now[:, greeks] == before[:, greeks]).all(axis=1)
+            was_stale = before_mask[prev_offset + prev_rows]
+            mask[offset + rows[(moved | was_stale) & unchanged]] = True
+        return mask
+
+    def reset(self):
+        with self._lock:
+            self._last = {}
+
+
+def fill_greeks(snapshot, rate=0.065, dividend_yield=0.0, mode="fill", expiry_time="15:30:00", stale=None):
+    """Compute IV and Greeks for a snapshot and merge them into its array
+
+    mode "fill" only solves strikes whose broker values are missing (any field NaN, or IV <= 0)
+    or flagged in `stale` (see StaleGreeksDetector), and replaces just those values; "replace"
+    overwrites every value the model can solve. Returns (snapshot, number of values written).
+    """
+    fetched = datetime.strptime(snapshot.fetch_time, '%Y-%m-%d %H:%M:%S')
+    try:
+        expiry = parse_expiry_date(snapshot.expiry_date, fetched.date())
+    except ValueError:
+        return snapshot, 0  # Expiry unknown (e.g. Expiry_0 fallback label)
+
+    values = snapshot.values
+    strikes = values[:, QUOTE_INDEX['Strike Price']]
+    # Calls and puts solved together as one vector: rows [0, n) are CE, [n, 2n) are PE
+    broker = {field: np.concatenate([values[:, QUOTE_INDEX[f'CE {field}']], values[:, QUOTE_INDEX[f'PE {field}']]])
+              for field in GREEK_FIELDS}
+    if mode == "replace":
+        needed = np.ones(2 * len(strikes), dtype=bool)
+    else:
+        with np.errstate(invalid='ignore'):
+            iv_missing = ~(broker['IV'] > 0)
+        if stale is not None:
+            # Stale broker values are replaced in full, like a missing IV
+            iv_missing |= stale
+        needed = iv_missing | np.isnan(np.column_stack(list(broker.values()))).any(axis=1)
+    rows = np.flatnonzero(needed)
+    if not len(rows):
+        return snapshot, 0
+
+    price = np.concatenate([_option_price(values, 'CE'), _option_price(values, 'PE')])[rows]
+    strike = np.concatenate([strikes, strikes])[rows]
+    is_call = rows < len(strikes)
+    t = time_to_expiry(fetched, expiry, expiry_time)
+    vol = implied_vol(price, snapshot.spot_price, strike, t, rate, dividend_yield, is_call)
+    solved = ~np.isnan(vol)
+    if not solved.any():
+        return snapshot, 0
+    rows, strike, is_call, vol = rows[solved], strike[solved], is_call[solved], vol[solved]
+    model = dict(zip(GREEK_FIELDS, (vol * 100,) + bs_greeks(snapshot.spot_price, strike, t, rate,
+                                                           dividend_yield, vol, is_call)))
+
+    values = values.copy()
+    n = len(strikes)
+    side = np.where(is_call, 0, 1)
+    row_in_side = rows - n * side
+    written = 0
+    for field in GREEK_FIELDS:
+        if mode == "replace":
+            target = np.ones(len(rows), dtype=bool)
+        else:
+            # A missing IV means the broker's Greeks for that option are unusable too
+            target = iv_missing[rows] | np.isnan(broker[field][rows])
+        cols = np.where(is_call, QUOTE_INDEX[f'CE {field}'], QUOTE_INDEX[f'PE {field}'])
+        values[row_in_side[target], cols[target]] = model[field][target]
+        written += int(target.sum())
+    return replace(snapshot, values=values), written
@@ -0,0 +1,167 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from trading_calendar import trading_exchange
+from utils import parse_expiry_date
+
+OPTION_INSTRUMENTS = ("OPTIDX", "OPTSTK")
+
+
+@dataclass
+class ExpiryInfo:
+    """One listed expiry of an underlying"""
+    expiry_date: date
+    label: str            # e.g. "26 JUN", the form used in table names and snapshots
+    strikes: np.ndarray   # Sorted listed strikes
+    lot_size: int
+    exchange: str
+    contracts: dict = field(default_factory=dict)  # (strike, "CE"/"PE") -> security id, for the market feed
+
+    @property
+    def feed_segment(self):
+        """Market feed segment of the expiry's contracts, e.g. NSE_FNO"""
+        return f"{self.exchange}_FNO"
+
+
+def expiry_label(expiry_date, custom_symbol=None):
+    """Label for an expiry, kept identical to the contract name when that agrees with the date"""
+    if custom_symbol:
+        parts = str(custom_symbol).split()
+        if len(parts) >= 4:
+            candidate = ' '.join(parts[1:3])
+            try:
+                if parse_expiry_date(candidate, expiry_date) == expiry_date:
+                    return candidate
+            except ValueError:
+                pass
+    return expiry_date.strftime('%d %b').upper()
+
+
+def build_expiry_index(instrument_df, symbols, trade_date):
+    """{(symbol, expiry_index): ExpiryInfo} from the broker's instrument master (SEM_* columns)
+
+    Expiry indices count the listed expiries on or after trade_date, nearest first, matching
+    the broker's own `expiry` argument.
+    """
+    df = instrument_df[instrument_df['SEM_INSTRUMENT_NAME'].isin(OPTION_INSTRUMENTS)]
+    df = df.assign(
+        underlying=df['SEM_TRADING_SYMBOL'].astype(str).str.split('-').str[0],
+        expiry=pd.to_datetime(df['SEM_EXPIRY_DATE']).dt.date
+    )
+    df = df[df['expiry'] >= trade_date]
+
+    index = {}
+    for symbol, config in symbols.items():
+        exchange = trading_exchange(config)
+        contracts = df[(df['underlying'] == symbol) & (df['SEM_EXM_EXCH_ID'] == exchange)]
+        if contracts.empty:
+            logging.warning(f"No option contracts for {symbol} on {exchange} in the instrument master")
+            continue
+        for expiry_index, (expiry, group) in enumerate(sorted(contracts.groupby('expiry'), key=lambda g: g[0])):
+            security_ids = {}
+            if 'SEM_SMST_SECURITY_ID' in group and 'SEM_OPTION_TYPE' in group:
+                security_ids = {
+                    (float(strike), option_type): str(int(security_id))
+                    for strike, option_type, security_id in zip(
+                        group['SEM_STRIKE_PRICE'], group['SEM_OPTION_TYPE'], group['SEM_SMST_SECURITY_ID']
+                    )
+                }
+            index[(symbol, expiry_index)] = ExpiryInfo(
+                expiry_date=expiry,
+                label=expiry_label(expiry, group['SEM_CUSTOM_SYMBOL'].iloc[0] if 'SEM_CUSTOM_SYMBOL' in group else None),
+                strikes=np.unique(group['SEM_STRIKE_PRICE'].to_numpy(dtype=np.float64)),
+                lot_size=int(group['SEM_LOT_UNITS'].iloc[0]) if 'SEM_LOT_UNITS' in group else 0,
+                exchange=exchange,
+                contracts=security_ids
+            )
+    return index
+
+
+def build_underlying_index(instrument_df, symbols):
+    """{symbol: (feed segment, security id)} of each underlying index or stock, where listed"""
+    if 'SEM_SMST_SECURITY_ID' not in instrument_df:
+        return {}
+    index = {}
+    for symbol, config in symbols.items():
+        exchange = trading_exchange(config)
+        if config.get('exchange') == "INDEX":
+            rows = instrument_df[(instrument_df['SEM_INSTRUMENT_NAME'] == "INDEX")
+                                 & (instrument_df['SEM_TRADING_SYMBOL'] == symbol)]
+            segment = "IDX_I"
+        else:
+            rows = instrument_df[(instrument_df['SEM_INSTRUMENT_NAME'] == "EQUITY")
+                                 & (instrument_df['SEM_TRADING_SYMBOL'] == symbol)]
+            if 'SEM_SERIES' in rows:
+                rows = rows[rows['SEM_SERIES'].isin(("EQ", "A"))]
+            segment = f"{exchange}_EQ"
+        rows = rows[rows['SEM_EXM_EXCH_ID'] == exchange]
+        if not rows.empty:
+            index[symbol] = (segment, str(int(rows['SEM_SMST_SECURITY_ID'].iloc[0])))
+    return index
+
+
+class InstrumentMaster:
+    """Expiry and strike metadata held in memory, rebuilt once per trade date
+
+    `loader` returns the broker's current instrument master DataFrame (see broker.reload_instruments);
+    it is called once per trade date so new expiries and strikes are picked up on multi-day runs.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._index = {}
+        self._underlyings = {}
+        self._trade_date = None
+        self._symbols = frozenset()
+        self._instrument_df = None
+        self._downloaded_for = None  # Trade date of _instrument_df
+
+    def ensure_loaded(self, symbols, trade_date=None):
+        """Rebuild the index on a new trade date or when symbols were added"""
+        trade_date = trade_date or date.today()
+        with self._lock:
+            if self._trade_date == trade_date and self._symbols >= set(symbols):
+                return False
+            if self._downloaded_for != trade_date:
+                # A failed download leaves the old index in place and is retried on the next call
+                self._instrument_df = self._loader()
+                self._downloaded_for = trade_date
+            instrument_df = self._instrument_df
+            self._index = build_expiry_index(instrument_df, symbols, trade_date)
+            self._underlyings = build_underlying_index(instrument_df, symbols)
+            self._trade_date = trade_date
+            self._symbols = frozenset(symbols)
+            logging.info(
+                f"Instrument master loaded for {trade_date}: "
+                f"{len(self._index)} expiries across {len(symbols)} symbols"
+            )
+            return True
+
+    def invalidate(self):
+        """Rebuild on the next ensure_loaded(), e.g. after symbol settings changed"""
+        with self._lock:
+            self._trade_date = None
+
+    def expiry(self, symbol, expiry_index):
+        """ExpiryInfo for the n-th listed expiry of a symbol, or None"""
+        return self._index.get((symbol, expiry_index))
+
+    def underlying(self, symbol):
+        """(feed segment, security id) of a symbol's index or stock, or None"""
+        return self._underlyings.get(symbol)
+
+    def atm_strike(self, symbol, expiry_index, spot_price, strike_gap):
+        """Listed strike nearest the spot price (grid rounding when the expiry is unknown)"""
+        info = self.expiry(symbol, expiry_index)
+        if info is None or not len(info.strikes):
+            return round(spot_price / strike_gap) * strike_gap
+        position = np.searchsorted(info.strikes, spot_price)
+        candidates = info.strikes[max(position - 1, 0):position + 1]
+        strike = candidates[np.argmin(np.abs(candidates - spot_price))]
+        return int(strike) if float(strike).is_integer() else float(strike)
@@ -1,5 +1,4 @@
 import asyncio
-from Dhan_Tradehull import Tradehull
 import pandas as pd
 import time
 from datetime import datetime, timedelta
@@ -10,18 +9,48 @@ import traceback
 from dotenv import load_dotenv
 import signal
 import sys
+import argparse
 from config import (
-    ALL_SYMBOLS, MARKET_START_TIME,
-    MARKET_END_TIME, COLLECTION_INTERVAL,
-    START_TIME_OFFSET
+    ALL_SYMBOLS, EXCHANGE_SESSIONS,
+    TRADING_CALENDAR_FILE, COLLECTION_INTERVAL,
+    START_TIME_OFFSET, MAX_PARALLEL_JOBS, RATE_LIMITS,
+    WRITE_BEHIND_CONFIG, SPOOL_CONFIG, STORAGE_MODE, DELTA_CONFIG,
+    ANALYTICS_CONFIG, GREEKS_CONFIG, METRICS_CONFIG,
+    SCHEDULER_CONFIG, SHARD_CONFIG, LOG_CONFIG, BROKER_CONFIG,
+    SYMBOLS_FILE, CHAIN_CACHE_CONFIG, SHARED_MEMORY_CONFIG, STREAMING_CONFIG,
+    STRIKE_WINDOW_CONFIG
 )
 from utils import (
     setup_logging,
-    round_to_minute, get_current_time,
-    calculate_next_run_time
+    round_to_minute, get_current_time, parse_expiry_date
 )
 from database import (
-    create_tables, insert_option_chain_data
+    create_tables, insert_option_chain_data, insert_option_chain_batch,
+    replay_option_chain_batch, test_database_connection,
+    get_pool, warm_table_registry, create_keyframe_table
+)
+from engine import CollectionEngine, summarize_results
+from rate_limiter import RequestScheduler, RateLimitedClient, priority_for, PRIORITY_INDEX
+from writer import WriteBehindWriter
+from spool import Spool, SpoolReplayer
+from snapshot import OptionChainSnapshot
+from delta import ChangeDetector
+from analytics import SummaryCollector, create_summary_table
+from greeks import fill_greeks, StaleGreeksDetector
+from metrics import metrics, StageTimer, start_http_server
+from scheduler import TickScheduler
+from supervisor import ShardSupervisor, split_symbols, shard_path
+from trading_calendar import TradingCalendar, trading_exchange
+from instruments import InstrumentMaster
+from broker import create_broker, reload_instruments
+from symbols import SymbolConfigWatcher, plan_capacity
+from chain_cache import ChainCache, start_chain_api
+from shared_chains import SharedChainPublisher
+from streaming import StreamingCollector, create_feed
+from strike_window import StrikeWindowManager, restrict_snapshot
+from normalized import (
+    create_normalized_schema, insert_normalized_data,
+    insert_normalized_batch, replay_normalized_batch
 )
 
 # Load environment variables
@@ -31,64 +60,117 @@ load_dotenv()
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 ssl._create_default_https_context = lambda: ssl_context
 
-# Initialize Tradehull client with environment variables
-client_code = os.getenv('DHAN_CLIENT_CODE')
-token_id = os.getenv('DHAN_TOKEN_ID')
-tsl = Tradehull(client_code, token_id)
+# Every broker call is queued through per-endpoint token buckets; the client itself is
+# built in main() (see init_broker) so importing this module needs no broker session
+request_scheduler = RequestScheduler(RATE_LIMITS)
+tsl = None
+# Expiries and strikes from the broker's instrument file, rebuilt once per trade date
+instrument_master = InstrumentMaster(lambda: reload_instruments(tsl))
+
+# Write-behind queue and durable spool, started in main() when enabled
+writer = None
+spool = None
+replayer = None
+change_detector = None
+summary_collector = None
+stale_greeks = None
+# Latest full chains per (symbol, expiry) for local readers, started in main() when enabled
+chain_cache = None
+shared_publisher = None
+# Market feed driven chains in streaming mode (STREAMING_CONFIG)
+streamer = None
+# Stable per-expiry strike sets shared by fetching, storage and the feed (STRIKE_WINDOW_CONFIG)
+strike_windows = None
+
+def store_snapshot(symbol, expiry_date, snapshot):
+    """Write one snapshot with the configured storage layout"""
+    with metrics.time("option_chain_stage_seconds", stage="insert", symbol=symbol, expiry=expiry_date):
+        if STORAGE_MODE == "normalized":
+            rows = insert_normalized_data(symbol, expiry_date, snapshot)
+        else:
+            rows = insert_option_chain_data(symbol, expiry_date, snapshot)
+    metrics.inc("option_chain_rows_written_total", rows or 0)
+    return rows
+
+def store_snapshot_batch(batch):
+    """Write several snapshots in one transaction with the configured storage layout"""
+    with metrics.time("option_chain_stage_seconds", stage="insert", symbol="batch", expiry=""):
+        if STORAGE_MODE == "normalized":
+            rows = insert_normalized_batch(batch)
+        else:
+            rows = insert_option_chain_batch(batch)
+    metrics.inc("option_chain_rows_written_total", rows or 0)
+    return rows
 
-def save_option_chain_data(df, expiry_date, fetch_time, symbol):
-    """Save option chain data to PostgreSQL database organized by expiry date"""
+def save_option_chain_data(snapshot):
+    """Save an option chain snapshot to PostgreSQL database organized by expiry date"""
+    symbol, expiry_date = snapshot.symbol, snapshot.expiry_date
     try:
-        # Add required columns if they don't exist
-        df['Symbol'] = symbol
-        df['expiry_date'] = expiry_date
-        df['fetch_time'] = fetch_time
-        
-        # Ensure timestamp is rounded to minute
-        current_time = datetime.now()
-        df['timestamp'] = round_to_minute(current_time).strftime('%H:%M:00')
+        # Normalized rows are keyed by expiry date, so a placeholder label such as Expiry_1 can never be stored
+        if STORAGE_MODE == "normalized":
+            try:
+                parse_expiry_date(expiry_date, datetime.now().date())
+            except ValueError:
+                logger.error(f"{symbol} - Expiry {expiry_date} could not be resolved, snapshot not saved")
+                return
         
-        # Define the exact column order we want
-        column_order = [
-            'Symbol', 'expiry_date', 'fetch_time', 'Spot Price', 'ATM Strike',
-            'CE OI', 'CE Chg in OI', 'CE Volume', 'CE IV', 'CE LTP',
-            'CE Bid Qty', 'CE Bid', 'CE Ask', 'CE Ask Qty',
-            'CE Delta', 'CE Theta', 'CE Gamma', 'CE Vega',
-            'Strike Price',
-            'PE Bid Qty', 'PE Bid', 'PE Ask', 'PE Ask Qty',
-            'PE LTP', 'PE IV', 'PE Volume', 'PE Chg in OI', 'PE OI',
-            'PE Delta', 'PE Theta', 'PE Gamma', 'PE Vega',
-            'timestamp'
-        ]
+        # Only strikes that changed since the last write, with a full keyframe every few minutes
+        if change_detector is not None:
+            snapshot = change_detector.filter(snapshot)
         
-        # Reorder columns and ensure all required columns exist
-        for col in column_order:
-            if col not in df.columns:
-                df[col] = None  # Fill missing columns with None
+        # Spool the snapshot first so a database outage cannot lose it
+        spool_id = None
+        if spool is not None:
+            try:
+                body = snapshot.to_copy_buffer().getvalue().encode('utf-8')
+                spool_id = spool.append(symbol, expiry_date, snapshot.fetch_time, len(snapshot), body,
+                                        is_keyframe=snapshot.is_keyframe)
+            except Exception as e:
+                logger.error(f"Error spooling {symbol}_{expiry_date}: {str(e)}")
         
-        # Reorder columns to match the required order
-        df = df[column_order]
+        # Hand off to the write-behind queue, or insert directly when it is disabled
+        if writer is not None:
+            if writer.submit(symbol, expiry_date, snapshot, token=spool_id):
+                logger.info(f"Queued {len(snapshot)} records for {symbol}_{expiry_date}")
+            return
         
-        # Insert data into PostgreSQL
-        records_inserted = insert_option_chain_data(symbol, expiry_date, df)
+        try:
+            records_inserted = store_snapshot(symbol, expiry_date, snapshot)
+        except Exception:
+            if spool_id is not None:
+                spool.release([spool_id])
+            elif change_detector is not None:
+                # Nothing will replay this write, so the next snapshot must be complete
+                change_detector.reset(symbol, expiry_date)
+            raise
+        if spool_id is not None:
+            spool.ack([spool_id])
         
         print(f"Successfully inserted {records_inserted} records to PostgreSQL for {symbol}_{expiry_date}")
-        print(f"Number of strikes saved: {len(df)}")
+        print(f"Number of strikes saved: {len(snapshot)}")
         
     except Exception as e:
         print(f"Error saving data to PostgreSQL: {str(e)}")
         print("Full error details:", e.__class__.__name__)
         print("Traceback:", traceback.format_exc())
 
+def write_failed(requests):
+    """Failed or dropped queued writes: replay them from the spool, or make the next snapshot complete"""
+    spooled = [r.token for r in requests if r.token is not None]
+    if spooled:
+        spool.release(spooled)
+    if change_detector is not None:
+        for request in requests:
+            if request.token is None:
+                # Nothing will replay this write, so the next snapshot must be complete
+                change_detector.reset(request.symbol, request.expiry_date)
+
 def get_initial_data(symbol):
-    """Get LTP only"""
+    """Get LTP for a single symbol"""
     try:
         # Get LTP
-        start_time = time.time()
-        ltp = tsl.get_ltp_data(names=symbol)
-        end_time = time.time()
-        # print(f"LTP API call took: {end_time - start_time:.3f} seconds")
-        time.sleep(0)  # No delay after LTP
+        with metrics.time("option_chain_stage_seconds", stage="ltp", symbol=symbol, expiry=""):
+            ltp = tsl.get_ltp_data(names=symbol, priority=priority_for(ALL_SYMBOLS[symbol]))
         
         spot_price = None
         if ltp and isinstance(ltp, dict):
@@ -111,236 +193,602 @@ def get_initial_data(symbol):
         # print(msg)
         return None
 
-def fetch_symbol_data(symbol):
-    """Fetch and save option chain data for a given symbol"""
+def fetch_expiry_data(symbol, expiry_index, spot_price, tick=None):
+    """Fetch and save option chain data for one expiry of a symbol"""
+    # Stage timings are labelled with the expiry date once it is known
+    timer = StageTimer(symbol)
+    expiry_label = f"Expiry_{expiry_index}"
     try:
         symbol_config = ALL_SYMBOLS[symbol]
-        msg = f"Starting data fetch for {symbol}"
-        logger.info(msg)
-        # print(msg)
-        
-        # Get LTP only once
-        spot_price = get_initial_data(symbol)
-        if spot_price is None:
-            return
+        priority = priority_for(symbol_config)
 
-        # Process each expiry
-        for expiry_index in range(symbol_config['num_expiries']):
+        # Expiry and ATM strike from the cached instrument master
+        expiry_info = instrument_master.expiry(symbol, expiry_index)
+        if expiry_info is not None:
+            expiry_date = expiry_info.label
+            with timer.stage("atm"):
+                atm_strike = instrument_master.atm_strike(
+                    symbol, expiry_index, spot_price, symbol_config['strike_gap']
+                )
+            logger.info(f"\n{symbol} - ATM Strike for expiry {expiry_date}: {atm_strike}")
+        else:
+            # Not in the instrument master: ask the broker, as before the cache existed
+            expiry_date = f"Expiry_{expiry_index}"
             try:
-                # Add delay between expiries (except for first expiry)
-                if expiry_index > 0:
-                    time.sleep(0)  # No delay between expiries
-                    
-                # Get ATM strike for this expiry
-                try:
-                    start_time = time.time()
+                with timer.stage("atm"):
                     ce_name, pe_name, atm_strike = tsl.ATM_Strike_Selection(
                         Underlying=symbol,
-                        Expiry=expiry_index
-                    )
-                    end_time = time.time()
-                    # print(f"ATM API call took: {end_time - start_time:.3f} seconds")
-                    time.sleep(0)  # No delay after ATM
-                    
-                    msg = f"\n{symbol} - ATM Strike for expiry {expiry_index}: {atm_strike}"
-                    logger.info(msg)
-                    # print(msg)
-                except Exception as e:
-                    msg = f"{symbol} - ATM_Strike_Selection failed for expiry {expiry_index}: {str(e)}"
-                    logger.warning(msg)
-                    # print(msg)
-                    # Calculate ATM strike based on symbol type
-                    if symbol in ["NIFTY", "BANKNIFTY"]:
-                        strike_gap = ALL_SYMBOLS[symbol]['strike_gap']
-                        atm_strike = round(spot_price / strike_gap) * strike_gap
-                    else:
-                        strike_gap = ALL_SYMBOLS[symbol]['strike_gap']
-                        atm_strike = round(spot_price / strike_gap) * strike_gap
-                    msg = f"{symbol} - Using fallback ATM Strike: {atm_strike}"
-                    logger.info(msg)
-                    # print(msg)
-                
-                msg = f"\n{symbol} - Processing expiry index: {expiry_index}"
-                logger.info(msg)
-                # print(msg)
-                msg = f"{symbol} - Using spot price: {spot_price}, ATM Strike: {atm_strike}"
-                logger.info(msg)
-                # print(msg)
-                
-                # Get option chain data
-                start_time = time.time()
-                option_chain = tsl.get_option_chain(
-                    Underlying=symbol,
-                    exchange=symbol_config['exchange'],
-                    expiry=expiry_index,
-                    num_strikes=symbol_config['num_strikes']
-                )
-                end_time = time.time()
-                # print(f"Option Chain API call took: {end_time - start_time:.3f} seconds")
-                time.sleep(0)  # No delay after option chain
-                
-                if option_chain is not None and isinstance(option_chain, tuple) and len(option_chain) > 1:
-                    metadata, df = option_chain
-                    
-                    # Add spot price and ATM strike
-                    df.insert(0, 'Spot Price', spot_price)
-                    df.insert(1, 'ATM Strike', atm_strike)
-                    
-                    # Add timestamp
-                    current_time = datetime.now()
-                    df['timestamp'] = round_to_minute(current_time).strftime('%H:%M:00')
-                    
-                    # Extract expiry date from option names
-                    expiry_date = None
-                    try:
-                        parts = ce_name.split()
-                        if len(parts) >= 4:
-                            expiry_date = ' '.join(parts[1:3])
-                    except Exception as e:
-                        msg = f"{symbol} - Error parsing expiry date: {e}"
-                        logger.error(msg)
-                        # print(msg)
-                        expiry_date = f"Expiry_{expiry_index}"
-                    
-                    # Save to PostgreSQL
-                    save_option_chain_data(
-                        df, 
-                        expiry_date, 
-                        current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                        symbol
+                        Expiry=expiry_index,
+                        priority=priority
                     )
-                    msg = f"{symbol} - Data saved for expiry: {expiry_date}"
-                    logger.info(msg)
-                    # print(msg)
-                    msg = f"{symbol} - Number of strikes saved: {len(df)}"
-                    logger.info(msg)
-                    # print(msg)
-                else:
-                    msg = f"{symbol} - Failed to fetch option chain data for expiry index {expiry_index}"
-                    logger.error(msg)
-                    # print(msg)
-                    
+                timer.record("atm_queue", request_scheduler.last_wait())
+                parts = ce_name.split()
+                if len(parts) >= 4:
+                    expiry_date = ' '.join(parts[1:3])
+                logger.info(f"\n{symbol} - ATM Strike for expiry {expiry_index}: {atm_strike}")
             except Exception as e:
-                msg = f"{symbol} - Error processing expiry index {expiry_index}: {str(e)}"
-                logger.error(msg)
-                # print(msg)
-                logger.error(f"{symbol} - Full error details:", exc_info=True)
-                
+                logger.warning(f"{symbol} - ATM_Strike_Selection failed for expiry {expiry_index}: {str(e)}")
+                # Calculate ATM strike from the spot price
+                strike_gap = symbol_config['strike_gap']
+                atm_strike = round(spot_price / strike_gap) * strike_gap
+                logger.info(f"{symbol} - Using fallback ATM Strike: {atm_strike}")
+        expiry_label = expiry_date
+        
+        # Request just enough strikes to cover the expiry's strike window, then keep only those
+        window = None
+        num_strikes = symbol_config['num_strikes']
+        if strike_windows is not None and expiry_info is not None:
+            window = strike_windows.update(symbol, expiry_date, expiry_info.strikes, spot_price, num_strikes)
+            # One spare strike either side in case the broker's ATM is a strike away from ours
+            num_strikes = window.span + 1
+            if window.changed:
+                logger.info(
+                    f"{symbol} - Strike window for {expiry_date}: {window.strikes[0]:g}-{window.strikes[-1]:g}, "
+                    f"+{len(window.added)} -{len(window.removed)} strikes"
+                )
+        
+        msg = f"\n{symbol} - Processing expiry index: {expiry_index}"
+        logger.info(msg)
+        # print(msg)
+        msg = f"{symbol} - Using spot price: {spot_price}, ATM Strike: {atm_strike}"
+        logger.info(msg)
+        # print(msg)
+        
+        # Get option chain data
+        with timer.stage("option_chain"):
+            option_chain = tsl.get_option_chain(
+                Underlying=symbol,
+                exchange=symbol_config['exchange'],
+                expiry=expiry_index,
+                num_strikes=num_strikes,
+                priority=priority
+            )
+        timer.record("option_chain_queue", request_scheduler.last_wait())
+        logger.info(
+            f"{symbol} - Option chain for expiry {expiry_index} waited "
+            f"{request_scheduler.last_wait():.2f}s in queue"
+        )
+        
+        if option_chain is not None and isinstance(option_chain, tuple) and len(option_chain) > 1:
+            metadata, df = option_chain
+            current_time = datetime.now()
+            if tick is not None:
+                metrics.observe("option_chain_snapshot_skew_seconds",
+                                (current_time - tick.scheduled_at).total_seconds(), symbol=symbol)
+            
+            # Typed snapshot with spot price, ATM strike and minute timestamp as scalars
+            with timer.stage("shape"):
+                snapshot = OptionChainSnapshot.from_frame(
+                    df,
+                    symbol=symbol,
+                    expiry_date=expiry_date,
+                    fetch_time=current_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    # The scheduled slot, so timestamps stay on the grid at any interval
+                    timestamp=(tick.slot if tick else round_to_minute(current_time)).strftime('%H:%M:%S'),
+                    spot_price=spot_price,
+                    atm_strike=atm_strike
+                )
+                if window is not None:
+                    snapshot = restrict_snapshot(snapshot, window.strikes)
+            
+            process_snapshot(snapshot, timer)
+            msg = f"{symbol} - Data saved for expiry: {expiry_date}"
+            logger.info(msg)
+            # print(msg)
+            msg = f"{symbol} - Number of strikes saved: {len(snapshot)}"
+            logger.info(msg)
+            # print(msg)
+            return True
+        else:
+            msg = f"{symbol} - Failed to fetch option chain data for expiry index {expiry_index}"
+            logger.error(msg)
+            # print(msg)
+            return False
+            
     except Exception as e:
-        msg = f"{symbol} - Error occurred: {str(e)}"
+        msg = f"{symbol} - Error processing expiry index {expiry_index}: {str(e)}"
         logger.error(msg)
         # print(msg)
         logger.error(f"{symbol} - Full error details:", exc_info=True)
+        return False
+    finally:
+        timer.commit(expiry_label)
+
+def process_snapshot(snapshot, timer):
+    """Greeks, in-memory publication, analytics and storage for one shaped snapshot"""
+    symbol = snapshot.symbol
+    # Fill IV/Greeks the broker left out with the local Black-Scholes engine
+    if GREEKS_CONFIG['enabled']:
+        try:
+            with timer.stage("greeks"):
+                stale = stale_greeks.stale(snapshot) if stale_greeks is not None else None
+                snapshot, filled = fill_greeks(
+                    snapshot,
+                    rate=GREEKS_CONFIG['risk_free_rate'],
+                    dividend_yield=GREEKS_CONFIG['dividend_yield'],
+                    mode=GREEKS_CONFIG['mode'],
+                    expiry_time=GREEKS_CONFIG['expiry_time'],
+                    stale=stale
+                )
+            if filled:
+                logger.info(f"{symbol} - Computed {filled} IV/Greek values for expiry: {snapshot.expiry_date}")
+        except Exception as e:
+            logger.error(f"{symbol} - Error computing Greeks for expiry {snapshot.expiry_date}: {str(e)}")
+    
+    # Latest chains for the local API, also before delta filtering
+    if chain_cache is not None:
+        chain_cache.put(snapshot)
+    
+    # Memory-mapped copy for co-located readers (see shared_chains.ChainReader)
+    if shared_publisher is not None:
+        try:
+            with timer.stage("publish"):
+                shared_publisher.publish(snapshot)
+        except Exception as e:
+            logger.error(f"{symbol} - Error publishing shared memory chain for {snapshot.expiry_date}: {str(e)}")
+    
+    # Per-minute analytics from the full chain, before any delta filtering
+    if summary_collector is not None:
+        with timer.stage("analytics"):
+            summary_collector.add(snapshot)
+    
+    # Save to PostgreSQL (or hand off to the spool and write queue)
+    with timer.stage("save"):
+        save_option_chain_data(snapshot)
+    return snapshot
+
+def prefetch_spot_prices(engine, symbols):
+    """Get spot prices for all symbols in one batched LTP call"""
+    spot_prices = {}
+    try:
+        with metrics.time("option_chain_stage_seconds", stage="ltp", symbol="batch", expiry=""):
+            ltp = tsl.get_ltp_data(names=list(symbols), priority=PRIORITY_INDEX)
+        if ltp and isinstance(ltp, dict):
+            spot_prices = {symbol: ltp[symbol] for symbol in symbols if ltp.get(symbol) is not None}
+    except Exception as e:
+        logger.error(f"Batched LTP call failed: {str(e)}")
+
+    # Fall back to single-symbol calls only for the names that came back empty
+    missing = [symbol for symbol in symbols if symbol not in spot_prices]
+    if missing:
+        logger.warning(f"Batched LTP missing {', '.join(missing)}, fetching individually")
+        results = engine.run_jobs([
+            (symbol, get_initial_data, (symbol,)) for symbol in missing
+        ])
+        spot_prices.update({r.name: r.result for r in results if r.ok and r.result is not None})
+
+    return spot_prices
+
+def run_collection_cycle(engine, symbols, tick=None):
+    """Fetch all symbol x expiry jobs for one cycle concurrently"""
+    # Once per trade date; on failure the jobs fall back to ATM_Strike_Selection
+    try:
+        with metrics.time("option_chain_stage_seconds", stage="instruments", symbol="batch", expiry=""):
+            reloaded = instrument_master.ensure_loaded({symbol: ALL_SYMBOLS[symbol] for symbol in symbols})
+        if reloaded and strike_windows is not None:
+            strike_windows.reset()
+    except Exception as e:
+        logger.error(f"Error loading instrument master: {str(e)}")
+    
+    # One spot snapshot for every symbol, taken at the same instant
+    spot_prices = prefetch_spot_prices(engine, symbols)
+
+    # Then every expiry of every symbol with a spot price
+    jobs = []
+    for symbol in symbols:
+        if symbol not in spot_prices:
+            continue
+        for expiry_index in range(ALL_SYMBOLS[symbol]['num_expiries']):
+            jobs.append((
+                f"{symbol}[{expiry_index}]",
+                fetch_expiry_data,
+                (symbol, expiry_index, spot_prices[symbol], tick)
+            ))
+    
+    results = engine.run_jobs(jobs)
+    return summarize_results(results)
+
+def seed_streaming_chain(symbol, expiry_index, num_strikes):
+    """One REST option chain to start a live chain from"""
+    option_chain = tsl.get_option_chain(
+        Underlying=symbol,
+        exchange=ALL_SYMBOLS[symbol]['exchange'],
+        expiry=expiry_index,
+        num_strikes=num_strikes,
+        priority=priority_for(ALL_SYMBOLS[symbol])
+    )
+    if option_chain is not None and isinstance(option_chain, tuple) and len(option_chain) > 1:
+        return option_chain[1]
+    return None
+
+def stream_expiry_data(symbol, expiry_index, tick):
+    """Snapshot one live chain and save it like a polled one"""
+    timer = StageTimer(symbol)
+    expiry_label = f"Expiry_{expiry_index}"
+    try:
+        current_time = datetime.now()
+        with timer.stage("shape"):
+            snapshot = streamer.snapshot(
+                symbol, expiry_index,
+                fetch_time=current_time.strftime('%Y-%m-%d %H:%M:%S'),
+                timestamp=tick.slot.strftime('%H:%M:%S')
+            )
+        if snapshot is None:
+            logger.warning(f"{symbol} - No streamed quotes yet for expiry index {expiry_index}")
+            return False
+        expiry_label = snapshot.expiry_date
+        metrics.observe("option_chain_snapshot_skew_seconds",
+                        (current_time - tick.scheduled_at).total_seconds(), symbol=symbol)
+        process_snapshot(snapshot, timer)
+        logger.info(f"{symbol} - Streamed snapshot saved for expiry: {expiry_label} ({len(snapshot)} strikes)")
+        return True
+    except Exception as e:
+        logger.error(f"{symbol} - Error saving streamed snapshot for expiry index {expiry_index}: {str(e)}")
+        logger.error(f"{symbol} - Full error details:", exc_info=True)
+        return False
+    finally:
+        timer.commit(expiry_label)
+
+def run_streaming_cycle(engine, symbols, open_symbols, tick):
+    """Snapshot the live chains of open_symbols; the feed is started on the first tick of a session"""
+    if not streamer.running:
+        with metrics.time("option_chain_stage_seconds", stage="instruments", symbol="batch", expiry=""):
+            if instrument_master.ensure_loaded({symbol: ALL_SYMBOLS[symbol] for symbol in symbols}):
+                strike_windows.reset()
+        streamer.start(symbols, prefetch_spot_prices(engine, symbols))
+    
+    # Symbols whose underlying is not on the feed keep using REST LTPs
+    polled = streamer.symbols_without_spot_feed(open_symbols)
+    if polled:
+        for symbol, price in prefetch_spot_prices(engine, polled).items():
+            streamer.set_spot(symbol, price)
+    
+    jobs = [
+        (f"{symbol}[{expiry_index}]", stream_expiry_data, (symbol, expiry_index, tick))
+        for symbol, expiry_index in streamer.chains(open_symbols)
+    ]
+    results = engine.run_jobs(jobs)
+    return summarize_results(results)
+
+def replay_spool_records(records):
+    """Load spooled snapshots into the database"""
+    if STORAGE_MODE == "normalized":
+        return replay_normalized_batch([(r.symbol, r.expiry_date, r.fetch_time, r.body) for r in records],
+                                       keyframes=records)
+    return replay_option_chain_batch([(r.symbol, r.expiry_date, r.body) for r in records], keyframes=records)
+
+def shutdown_writer():
+    """Flush queued snapshots to the database before exiting"""
+    if writer is not None:
+        stats = writer.get_stats()
+        print(f"Flushing {stats['depth']} queued snapshots to the database...")
+        if writer.stop(timeout=WRITE_BEHIND_CONFIG['shutdown_timeout']):
+            print("Write queue flushed")
+    if replayer is not None:
+        replayer.stop()
+    if spool is not None:
+        # Anything still unacknowledged is replayed on the next start
+        spool.close()
 
 def signal_handler(signum, frame):
     print("Received signal to stop. Cleaning up...")
+    shutdown_writer()
     sys.exit(0)
 
-def main():
+def init_broker(client=None):
+    """Route broker calls through the rate limiter; builds the BROKER_CONFIG client by default"""
+    global tsl
+    tsl = RateLimitedClient(client or create_broker(BROKER_CONFIG, ALL_SYMBOLS), request_scheduler)
+    return tsl
+
+def prepare_database():
+    """Create the schemas and shared tables, once per run"""
+    if STORAGE_MODE == "normalized":
+        create_normalized_schema()
+    else:
+        create_tables(ALL_SYMBOLS)
+    if DELTA_CONFIG['enabled']:
+        create_keyframe_table()
+    if ANALYTICS_CONFIG['enabled']:
+        create_summary_table()
+
+def plan_cycle(engine, symbols, rate_share=1.0):
+    """Size the worker pool for a symbol set and check its broker budget fits the interval"""
+    plan = plan_capacity(
+        {symbol: ALL_SYMBOLS[symbol] for symbol in symbols},
+        COLLECTION_INTERVAL, RATE_LIMITS, MAX_PARALLEL_JOBS, rate_share
+    )
+    engine.resize(plan['workers'])
+    logger.info(
+        f"Cycle plan: {plan['symbols']} symbols, {plan['jobs']} jobs, {plan['workers']} workers, "
+        f"{plan['option_chain_seconds']:.0f}s of option chain rate budget per cycle"
+    )
+    # Streaming makes REST option chain calls only when a session starts
+    if not plan['fits'] and not STREAMING_CONFIG['enabled']:
+        logger.warning(
+            f"Option chain requests need {plan['option_chain_seconds']:.0f}s per cycle at the configured "
+            f"rate limits, longer than the {COLLECTION_INTERVAL}s interval; cycles will overrun"
+        )
+    return plan
+
+def main(symbols=None, shard=None, status_queue=None, num_shards=1):
+    """Collect `symbols` (default: all) until stopped; `shard` is set when running under the supervisor"""
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
     # Set up logging first
     global logger
-    logger = setup_logging()
-    logger.info("Starting option chain data collection...")
+    if shard is None:
+        logger = setup_logging()
+        symbols = list(ALL_SYMBOLS) if symbols is None else symbols
+    else:
+        logger = setup_logging(shard_path(LOG_CONFIG['log_file'], shard))
+        metrics.const_labels = {"shard": str(shard)}
+    logger.info(f"Starting option chain data collection for {', '.join(symbols)}...")
+    
+    if tsl is None:
+        init_broker()
     
-    # Create database tables and schemas
+    # Create database tables and schemas (the supervisor has already done so for shards)
     try:
-        create_tables()
+        get_pool().warm()
+        if shard is None:
+            prepare_database()
+        if STORAGE_MODE != "normalized":
+            warm_table_registry()
         logger.info("Database tables and schemas created successfully")
     except Exception as e:
         logger.error(f"Error creating database tables: {str(e)}")
         sys.exit(1)
     
-    # Convert market times to datetime.time objects
-    market_start = datetime.strptime(MARKET_START_TIME, "%H:%M:%S").time()
-    market_end = datetime.strptime(MARKET_END_TIME, "%H:%M:%S").time()
+    # Worker pool for concurrent symbol x expiry jobs, re-planned whenever the symbols file changes
+    engine = CollectionEngine(MAX_PARALLEL_JOBS)
+    rate_share = 1 / num_shards if SHARD_CONFIG['split_rate_limits'] else 1.0
+    plan_cycle(engine, symbols, rate_share)
+    watcher = SymbolConfigWatcher(SYMBOLS_FILE, ALL_SYMBOLS)
     
-    # Wait until the next minute's specified second before starting
-    current_time = datetime.now()
-    next_minute = (current_time + timedelta(minutes=1)).replace(second=START_TIME_OFFSET, microsecond=0)
-    initial_wait = (next_minute - current_time).total_seconds()
-    if initial_wait > 0:
-        logger.info(f"Waiting {initial_wait:.2f} seconds until first data collection at {next_minute.strftime('%H:%M:%S')}")
-        time.sleep(initial_wait)
+    # Prometheus-style metrics endpoint for a local scraper (served by the supervisor when sharded)
+    metrics_textfile = METRICS_CONFIG['textfile']
+    if shard is not None and metrics_textfile:
+        metrics_textfile = shard_path(metrics_textfile, shard)
+    if METRICS_CONFIG['http_port'] and shard is None:
+        start_http_server(METRICS_CONFIG['http_port'], METRICS_CONFIG['http_host'])
+    
+    # Durable local spool, replayed into the database whenever it is reachable
+    global writer, spool, replayer, change_detector, summary_collector, chain_cache, shared_publisher, streamer
+    global strike_windows, stale_greeks
+    if STRIKE_WINDOW_CONFIG['enabled'] or STREAMING_CONFIG['enabled']:
+        # Streaming always needs a window to know which contracts to subscribe to
+        strike_windows = StrikeWindowManager(STRIKE_WINDOW_CONFIG['shift_after'],
+                                             STRIKE_WINDOW_CONFIG['max_extra_strikes'])
+    if STREAMING_CONFIG['enabled']:
+        streamer = StreamingCollector(
+            create_feed(STREAMING_CONFIG), instrument_master, ALL_SYMBOLS, strike_windows,
+            seed=seed_streaming_chain if STREAMING_CONFIG['seed_from_rest'] else None
+        )
+    if SHARED_MEMORY_CONFIG['enabled']:
+        shared_publisher = SharedChainPublisher(SHARED_MEMORY_CONFIG['directory'],
+                                                SHARED_MEMORY_CONFIG['max_strikes'])
+    if CHAIN_CACHE_CONFIG['enabled']:
+        chain_cache = ChainCache(CHAIN_CACHE_CONFIG['depth'])
+        if CHAIN_CACHE_CONFIG['http_port']:
+            # Each shard caches its own symbols, so shard N serves on http_port + N
+            start_chain_api(chain_cache, CHAIN_CACHE_CONFIG['http_port'] + (shard or 0),
+                            CHAIN_CACHE_CONFIG['http_host'])
+    if GREEKS_CONFIG['detect_stale'] and GREEKS_CONFIG['mode'] == "fill" and not STREAMING_CONFIG['enabled']:
+        # Streamed chains already clear the Greeks of repriced contracts
+        stale_greeks = StaleGreeksDetector()
+    if ANALYTICS_CONFIG['enabled']:
+        summary_collector = SummaryCollector(ANALYTICS_CONFIG['max_pending_rows'])
+    if DELTA_CONFIG['enabled']:
+        change_detector = ChangeDetector(DELTA_CONFIG['keyframe_interval'])
+    if SPOOL_CONFIG['enabled']:
+        spool = Spool(
+            SPOOL_CONFIG['directory'] if shard is None else os.path.join(SPOOL_CONFIG['directory'], f"shard-{shard}"),
+            segment_max_bytes=SPOOL_CONFIG['segment_max_bytes'],
+            fsync=SPOOL_CONFIG['fsync']
+        )
+        replayer = SpoolReplayer(
+            spool,
+            replay_spool_records,
+            test_database_connection,
+            interval=SPOOL_CONFIG['replay_interval'],
+            batch_size=SPOOL_CONFIG['replay_batch_size'],
+            max_attempts=SPOOL_CONFIG['replay_max_attempts']
+        )
+        replayer.start()
+    
+    # Decouple database writes from broker fetches
+    if WRITE_BEHIND_CONFIG['enabled']:
+        writer = WriteBehindWriter(
+            store_snapshot_batch,
+            store_snapshot,
+            max_queue=WRITE_BEHIND_CONFIG['max_queue'],
+            workers=WRITE_BEHIND_CONFIG['workers'],
+            batch_size=WRITE_BEHIND_CONFIG['batch_size'],
+            linger=WRITE_BEHIND_CONFIG['linger'],
+            put_timeout=WRITE_BEHIND_CONFIG['put_timeout'],
+            on_written=spool.ack if spool is not None else None,
+            on_failed=write_failed
+        )
+    
+    # Exchange sessions, holidays and special sessions
+    calendar = TradingCalendar.load(TRADING_CALENDAR_FILE, EXCHANGE_SESSIONS)
+    exchanges = {trading_exchange(ALL_SYMBOLS[symbol]) for symbol in symbols}
+    calendar_year = datetime.now().year
+    try:
+        calendar.require_year(exchanges, calendar_year)
+    except ValueError as e:
+        logger.error(f"{TRADING_CALENDAR_FILE}: {str(e)}")
+        sys.exit(1)
+    
+    # Collection ticks every COLLECTION_INTERVAL seconds (the snapshot cadence when streaming),
+    # START_TIME_OFFSET seconds into each slot
+    scheduler = TickScheduler(
+        STREAMING_CONFIG['cadence'] if streamer is not None else COLLECTION_INTERVAL,
+        offset=START_TIME_OFFSET,
+        policy=SCHEDULER_CONFIG['missed_tick_policy'],
+        max_catch_up=SCHEDULER_CONFIG['max_catch_up'],
+        grace=SCHEDULER_CONFIG['grace']
+    )
     
     while True:
         try:
-            current_time = datetime.now()
-            current_time_str = current_time.strftime("%H:%M:%S")
+            # Symbol file edits are applied here, between cycles
+            change = watcher.poll()
+            if change:
+                if chain_cache is not None and change[1]:
+                    chain_cache.drop_symbols(change[1])
+                if shard is None:
+                    symbols = list(ALL_SYMBOLS)
+                else:
+                    # Added symbols reach a shard when the supervisor reassigns it
+                    symbols = [symbol for symbol in symbols if symbol in ALL_SYMBOLS]
+                exchanges = {trading_exchange(ALL_SYMBOLS[symbol]) for symbol in symbols}
+                calendar_year = None  # Check the holidays of any newly collected exchange
+                instrument_master.invalidate()
+                if streamer is not None:
+                    # Resubscribed for the new symbol set on the next tick
+                    streamer.stop()
+                plan_cycle(engine, symbols, rate_share)
             
-            # Check if it's weekend
-            if current_time.weekday() >= 5:  # 5 is Saturday, 6 is Sunday
-                logger.info(f"Market closed: Weekend - {current_time_str}")
-                next_day = current_time + timedelta(days=1)
-                next_day = next_day.replace(
-                    hour=int(MARKET_START_TIME[:2]),
-                    minute=int(MARKET_START_TIME[3:5]),
-                    second=int(MARKET_START_TIME[6:8]),
-                    microsecond=0
-                )
-                sleep_seconds = (next_day - current_time).total_seconds()
-                logger.info(f"Sleeping until next trading day: {next_day.strftime('%Y-%m-%d %H:%M:%S')}")
-                time.sleep(sleep_seconds)
-                continue
+            current_time = datetime.now()
+            if current_time.year != calendar_year:
+                # New year or exchanges: still collect, but make missing holidays hard to miss
+                calendar_year = current_time.year
+                try:
+                    calendar.require_year(exchanges, calendar_year)
+                except ValueError as e:
+                    logger.error(f"{TRADING_CALENDAR_FILE}: {str(e)}; only weekends will be skipped until restarted")
             
-            # If before market open, sleep until market open
-            if current_time.time() < market_start:
-                next_run = current_time.replace(
-                    hour=int(MARKET_START_TIME[:2]),
-                    minute=int(MARKET_START_TIME[3:5]),
-                    second=int(MARKET_START_TIME[6:8]),
-                    microsecond=0
+            # Nothing in session: sleep straight to the next session on any exchange
+            if not calendar.open_exchanges(current_time, exchanges):
+                reasons = ", ".join(
+                    sorted({calendar.closed_reason(exchange, current_time) for exchange in exchanges})
                 )
-                sleep_seconds = (next_run - current_time).total_seconds()
-                logger.info(f"Market not open yet. Sleeping until market open: {next_run.strftime('%H:%M:%S')}")
+                logger.info(f"Market closed: {reasons} - {current_time.strftime('%H:%M:%S')}")
+                next_session = calendar.next_session_start(current_time, exchanges)
+                if next_session is None:
+                    logger.warning("No trading session in the next 30 days, checking again tomorrow")
+                    next_session = current_time + timedelta(days=1)
+                sleep_seconds = (next_session - current_time).total_seconds()
+                logger.info(f"Sleeping until next session: {next_session.strftime('%Y-%m-%d %H:%M:%S')}")
+                if streamer is not None:
+                    streamer.stop()
+                if status_queue is not None:
+                    status_queue.put({"shard": shard, "event": "sleeping", "until": next_session})
                 time.sleep(sleep_seconds)
+                scheduler.reset()
                 continue
             
-            # If after market close, sleep until next trading day
-            if current_time.time() > market_end:
-                next_day = current_time + timedelta(days=1)
-                next_day = next_day.replace(
-                    hour=int(MARKET_START_TIME[:2]),
-                    minute=int(MARKET_START_TIME[3:5]),
-                    second=int(MARKET_START_TIME[6:8]),
-                    microsecond=0
-                )
-                sleep_seconds = (next_day - current_time).total_seconds()
-                logger.info(f"Market closed for today. Sleeping until next trading day: {next_day.strftime('%Y-%m-%d %H:%M:%S')}")
-                time.sleep(sleep_seconds)
+            # Market is open: wait for the next tick on the collection grid
+            tick = scheduler.wait_next()
+            if tick is None:
+                break
+            open_exchanges = calendar.open_exchanges(tick.scheduled_at, exchanges)
+            if not open_exchanges:
                 continue
+            current_time = datetime.now()
+            logger.info(
+                f"Starting new cycle at: {current_time.strftime('%H:%M:%S')} "
+                f"(slot {tick.slot.strftime('%H:%M:%S')}, {tick.lateness:.2f}s late)"
+            )
             
-            # Market is open, proceed with data collection
-            logger.info(f"Starting new cycle at: {current_time_str}")
-            
-            # Process symbols sequentially
-            symbols = list(ALL_SYMBOLS.keys())
-            for symbol in symbols:
-                msg = f"Processing symbol: {symbol}"
-                logger.info(msg)
-                # print(msg)
-                fetch_symbol_data(symbol)
-                time.sleep(0)  # No delay between symbols
+            # Process all symbol x expiry jobs concurrently
+            open_symbols = [
+                symbol for symbol in symbols
+                if trading_exchange(ALL_SYMBOLS[symbol]) in open_exchanges
+            ]
+            if streamer is not None:
+                summary = run_streaming_cycle(engine, symbols, open_symbols, tick)
+            else:
+                summary = run_collection_cycle(engine, open_symbols, tick)
+            if summary_collector is not None:
+                summary_collector.flush()
             
             # Calculate time taken for this cycle
             cycle_end_time = datetime.now()
             time_taken = (cycle_end_time - current_time).total_seconds()
-            logger.info(f"Cycle completed in {time_taken:.2f} seconds")
-            
-            # Calculate next run time using COLLECTION_INTERVAL from config
-            next_minute = (cycle_end_time + timedelta(seconds=COLLECTION_INTERVAL))
-            next_run = next_minute.replace(second=START_TIME_OFFSET, microsecond=0)
-            wait_time = (next_run - cycle_end_time).total_seconds()
-            
-            if wait_time > 0:
-                logger.info(f"Waiting {wait_time:.2f} seconds until next cycle at {next_run.strftime('%H:%M:%S')}")
-                time.sleep(wait_time)
+            logger.info(
+                f"Cycle completed in {time_taken:.2f} seconds - "
+                f"{summary['jobs']} jobs, {len(summary['failed'])} failed, "
+                f"slowest {summary['slowest']} ({summary['slowest_duration']:.2f}s)"
+            )
+            if summary['failed']:
+                logger.warning(f"Failed jobs: {', '.join(summary['failed'])}")
+            metrics.observe("option_chain_cycle_seconds", time_taken)
+            metrics.inc("option_chain_cycles_total")
+            metrics.inc("option_chain_job_failures_total", len(summary['failed']))
+            if time_taken > scheduler.interval:
+                metrics.inc("option_chain_cycle_overruns_total")
+                logger.warning(f"Cycle overran the {scheduler.interval}s interval by {time_taken - scheduler.interval:.2f}s")
+            for endpoint, stats in request_scheduler.get_stats(reset=True).items():
+                logger.info(
+                    f"Rate limiter {endpoint}: {stats['calls']} calls, "
+                    f"avg wait {stats['avg_wait']:.2f}s, max wait {stats['max_wait']:.2f}s"
+                )
+            if writer is not None:
+                writer_stats = writer.get_stats()
+                metrics.set_gauge("option_chain_write_queue_depth", writer_stats['depth'])
+                logger.info(
+                    f"Write queue: depth {writer_stats['depth']}/{writer_stats['capacity']}, "
+                    f"max depth {writer_stats['max_depth']}, {writer_stats['written']} written, "
+                    f"{writer_stats['failed']} failed, {writer_stats['dropped']} dropped, "
+                    f"{writer_stats['blocked_puts']} blocked puts (max wait {writer_stats['max_put_wait']:.2f}s)"
+                )
+            if change_detector is not None:
+                delta_stats = change_detector.stats
+                logger.info(
+                    f"Delta encoding: {delta_stats['rows_out']}/{delta_stats['rows_in']} rows written, "
+                    f"{delta_stats['keyframes']} keyframes in {delta_stats['snapshots']} snapshots"
+                )
+            pool_stats = get_pool().get_stats()
+            logger.info(
+                f"DB pool: {pool_stats['in_use']} in use, {pool_stats['idle']} idle, "
+                f"peak {pool_stats['peak_in_use']}/{pool_stats['size']}, "
+                f"avg wait {pool_stats['avg_wait']:.3f}s, {pool_stats['discarded']} discarded"
+            )
+            metrics.set_gauge("option_chain_db_connections_in_use", pool_stats['in_use'])
+            if status_queue is not None:
+                status_queue.put({
+                    "shard": shard, "event": "cycle", "cycle_seconds": time_taken,
+                    "jobs": summary['jobs'], "failed": len(summary['failed'])
+                })
+            if metrics_textfile:
+                try:
+                    metrics.write_textfile(metrics_textfile)
+                except Exception as e:
+                    logger.error(f"Error writing metrics file: {str(e)}")
+            logger.info(f"Next cycle in {scheduler.seconds_until_next():.2f} seconds")
             
         except KeyboardInterrupt:
             logger.info("Stopping data collection...")
+            if streamer is not None:
+                streamer.stop()
+            engine.shutdown()
+            shutdown_writer()
+            get_pool().close_all()
             break
         except Exception as e:
             logger.error(f"Error in main loop: {str(e)}")
@@ -348,5 +796,70 @@ def main():
             # Sleep for 1 minute before retrying
             time.sleep(60)
 
+def run_shard(shard, symbols, num_shards, status_queue):
+    """Entry point of a shard worker process"""
+    if SHARD_CONFIG['split_rate_limits']:
+        # The broker limits apply to the whole account, so every shard gets an equal share
+        request_scheduler.scale(1 / num_shards)
+    status_queue.put({"shard": shard, "event": "started"})
+    main(symbols, shard=shard, status_queue=status_queue, num_shards=num_shards)
+
+def run_sharded(num_shards):
+    """Split the symbols over worker processes and supervise them"""
+    global logger
+    logger = setup_logging()
+    try:
+        prepare_database()
+    except Exception as e:
+        logger.error(f"Error creating database tables: {str(e)}")
+        sys.exit(1)
+    
+    try:
+        TradingCalendar.load(TRADING_CALENDAR_FILE, EXCHANGE_SESSIONS).require_year(
+            {trading_exchange(config) for config in ALL_SYMBOLS.values()}, datetime.now().year
+        )
+    except ValueError as e:
+        # Every shard would exit on the same check and be restarted over and over
+        logger.error(f"{TRADING_CALENDAR_FILE}: {str(e)}")
+        sys.exit(1)
+    
+    shards = split_symbols(ALL_SYMBOLS, num_shards)
+    supervisor = ShardSupervisor(
+        run_shard,
+        shards,
+        max_restarts=SHARD_CONFIG['max_restarts'],
+        restart_window=SHARD_CONFIG['restart_window'],
+        backoff=SHARD_CONFIG['restart_backoff'],
+        stale_after=SHARD_CONFIG['stale_after']
+    )
+    signal.signal(signal.SIGINT, lambda signum, frame: supervisor.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop())
+    if METRICS_CONFIG['http_port']:
+        start_http_server(METRICS_CONFIG['http_port'], METRICS_CONFIG['http_host'])
+    
+    watcher = SymbolConfigWatcher(SYMBOLS_FILE, ALL_SYMBOLS)
+    
+    def housekeeping(stats):
+        # Shards apply setting changes themselves; added or removed symbols need a new split
+        change = watcher.poll()
+        if change and (change[0] or change[1]):
+            supervisor.reassign(split_symbols(ALL_SYMBOLS, num_shards))
+        if METRICS_CONFIG['textfile']:
+            try:
+                metrics.write_textfile(shard_path(METRICS_CONFIG['textfile'], "supervisor"))
+            except Exception as e:
+                logger.error(f"Error writing metrics file: {str(e)}")
+    
+    logger.info(f"Starting {len(shards)} collector shards")
+    supervisor.run(on_stats=housekeeping)
+    logger.info("All shards stopped")
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Collect option chain snapshots into PostgreSQL")
+    parser.add_argument("--shards", type=int, default=SHARD_CONFIG['shards'],
+                        help="Worker processes to split the symbols over (1 runs in-process)")
+    args = parser.parse_args()
+    if args.shards > 1:
+        run_sharded(args.shards)
+    else:
+        main()
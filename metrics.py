@@ -0,0 +1,198 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "option_chain_stage_seconds": "Latency of each collection stage by symbol and expiry",
+    "option_chain_cycle_seconds": "Wall time of a full collection cycle",
+    "option_chain_snapshot_skew_seconds": "Delay between a snapshot's scheduled tick and its fetch time",
+    "option_chain_cycle_overruns_total": "Cycles that took longer than the collection interval",
+    "option_chain_cycles_total": "Collection cycles run",
+    "option_chain_missed_ticks_total": "Collection ticks skipped or coalesced after an overrun, by scheduler policy",
+    "option_chain_job_failures_total": "Symbol x expiry jobs that failed",
+    "option_chain_write_queue_depth": "Snapshots waiting in the write-behind queue",
+    "option_chain_db_connections_in_use": "Pooled database connections checked out",
+    "option_chain_rows_written_total": "Option chain rows written to the database",
+    "option_chain_shard_up": "Whether a shard worker process is running",
+    "option_chain_shard_restarts_total": "Shard worker processes restarted by the supervisor",
+    "option_chain_shard_cycle_seconds": "Duration of the last collection cycle reported by a shard",
+    "option_chain_shard_cycles_total": "Collection cycles reported by a shard",
+    "option_chain_shard_failed_jobs_total": "Failed jobs reported by a shard",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram for one label set"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe histograms, counters and gauges rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> label key -> Histogram
+        self._counters = {}    # name -> label key -> value
+        self._gauges = {}      # name -> label key -> value
+        self.const_labels = {}  # Added to every rendered series, e.g. {"shard": "0"}
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def histogram_totals(self, name, by):
+        """{value of label `by`: (count, sum)} summed over the other labels of a histogram"""
+        totals = {}
+        with self._lock:
+            for key, hist in self._histograms.get(name, {}).items():
+                value = dict(key).get(by)
+                count, total = totals.get(value, (0, 0.0))
+                totals[value] = (count + hist.count, total + hist.sum)
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        const = _label_key(self.const_labels)
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                for key, hist in sorted(series.items()):
+                    key = const + key
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} {kind}"]
+                    for key, value in sorted(series.items()):
+                        key = const + key
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically write the metrics for a node_exporter textfile collector (or any scraper)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class StageTimer:
+    """Times the stages of one symbol x expiry job; labels are applied once the expiry is known"""
+
+    def __init__(self, symbol, registry=None):
+        self.symbol = symbol
+        self.registry = registry or metrics
+        self.durations = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations.append((name, time.perf_counter() - start))
+
+    def record(self, name, seconds):
+        self.durations.append((name, seconds))
+
+    def commit(self, expiry):
+        for name, seconds in self.durations:
+            self.registry.observe("option_chain_stage_seconds", seconds,
+                                  stage=name, symbol=self.symbol, expiry=expiry)
+        self.durations = []
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood the collector log
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
@@ -0,0 +1,53 @@
+"""Backfill the normalized option_chain.quotes table from the per-expiry tables.
+
+Usage:
+    python migrate_normalized.py [--symbol NIFTY] [--since 2024-06-01] [--dry-run]
+
+Safe to re-run: rows already in the fact table are skipped by primary key.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from utils import setup_logging
+from normalized import create_normalized_schema, list_per_expiry_tables, backfill_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill option_chain.quotes from per-expiry tables")
+    parser.add_argument("--symbol", help="Only migrate this symbol (e.g. NIFTY)")
+    parser.add_argument("--since", help="Only migrate rows fetched on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--dry-run", action="store_true", help="Count rows without writing anything")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    since = datetime.strptime(args.since, "%Y-%m-%d").date() if args.since else None
+
+    if not args.dry_run:
+        create_normalized_schema()
+
+    tables = list_per_expiry_tables()
+    if args.symbol:
+        tables = [(schema, table) for schema, table in tables
+                  if schema == f"option_chain_{args.symbol.lower()}"]
+    logger.info(f"Migrating {len(tables)} per-expiry tables")
+
+    total = 0
+    failed = []
+    for schema_name, table_name in tables:
+        try:
+            copied = backfill_table(schema_name, table_name, since=since, dry_run=args.dry_run)
+            total += copied
+            logger.info(f"{schema_name}.{table_name}: {copied} rows {'to copy' if args.dry_run else 'copied'}")
+        except Exception as e:
+            failed.append(f"{schema_name}.{table_name}")
+            logger.error(f"Error migrating {schema_name}.{table_name}: {str(e)}")
+
+    logger.info(f"Migration finished: {total} rows, {len(failed)} tables failed")
+    if failed:
+        logger.error(f"Failed tables: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
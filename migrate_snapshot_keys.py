@@ -0,0 +1,51 @@
+"""Add the unique (fetch_time, Strike Price) snapshot key to per-expiry tables created before it.
+
+Usage:
+    python migrate_snapshot_keys.py --dry-run
+    python migrate_snapshot_keys.py [--symbol NIFTY]
+
+Spool replay skips rows that are already stored by this key, so without it a replay after
+a crash can write duplicates. Duplicate rows are deleted (keeping the lowest id) before the
+index is built: run --dry-run first, back up the tables it reports, and run it while the
+collector is stopped. Tables created by the collector already have the key.
+"""
+import argparse
+import sys
+
+from utils import setup_logging
+from database import tables_without_snapshot_key, add_snapshot_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the snapshot key to older per-expiry tables")
+    parser.add_argument("--symbol", help="Only migrate this symbol (e.g. NIFTY)")
+    parser.add_argument("--dry-run", action="store_true", help="Report duplicate rows without changing anything")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    tables = tables_without_snapshot_key()
+    if args.symbol:
+        tables = [(schema, table) for schema, table in tables
+                  if schema == f"option_chain_{args.symbol.lower()}"]
+    logger.info(f"{len(tables)} per-expiry tables without a snapshot key")
+
+    total = 0
+    failed = []
+    for schema_name, table_name in tables:
+        try:
+            duplicates = add_snapshot_key(schema_name, table_name, dry_run=args.dry_run)
+            total += duplicates
+            logger.info(f"{schema_name}.{table_name}: {duplicates} duplicate rows "
+                        f"{'to remove' if args.dry_run else 'removed, snapshot key added'}")
+        except Exception as e:
+            failed.append(f"{schema_name}.{table_name}")
+            logger.error(f"Error migrating {schema_name}.{table_name}: {str(e)}")
+
+    logger.info(f"Migration finished: {total} duplicate rows, {len(failed)} tables failed")
+    if failed:
+        logger.error(f"Failed tables: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import io
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytz
+
+from config import ALL_SYMBOLS, MARKET_TIMEZONE, NORMALIZED_STORAGE_CONFIG
+from database import db_connection, record_keyframes, KEYFRAME_TABLE
+from metrics import metrics
+from snapshot import OPTION_CHAIN_COLUMNS, QUOTE_COLUMNS, BIGINT_COLUMNS
+from utils import parse_expiry_date
+
+INSTRUMENT_TABLE = "option_chain.instruments"
+QUOTE_TABLE = "option_chain.quotes"
+
+PRICE_TYPE = "NUMERIC(12, 2)"
+
+# Fact table quote columns: (column, source column in the per-expiry tables, type)
+QUOTE_FIELDS = [
+    (col.lower().replace(' chg in oi', '_oi_change').replace(' ', '_'), col,
+     "BIGINT" if col in BIGINT_COLUMNS
+     else PRICE_TYPE if col.split(' ', 1)[1] in ('LTP', 'Bid', 'Ask')
+     else "REAL")
+    for col in QUOTE_COLUMNS if col != 'Strike Price'
+]
+
+# Every fact table column, in table order
+FACT_COLUMNS = (
+    ["trade_date", "instrument_id", "fetch_time", "strike", "spot_price", "atm_strike"]
+    + [name for name, _, _ in QUOTE_FIELDS]
+)
+
+_tz = pytz.timezone(MARKET_TIMEZONE)
+_lock = threading.Lock()
+_ddl_lock = threading.Lock()
+_instrument_ids = {}
+_partitions = set()
+
+
+def create_normalized_schema():
+    """Create the instrument dimension, the partitioned quote fact table and a readable view"""
+    quote_columns = ",\n".join(f"            {name} {sql_type}" for name, _, sql_type in QUOTE_FIELDS)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS option_chain")
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {INSTRUMENT_TABLE} (
+                instrument_id SERIAL PRIMARY KEY,
+                symbol VARCHAR(20) NOT NULL,
+                exchange VARCHAR(10),
+                expiry DATE NOT NULL,
+                expiry_label VARCHAR(50),
+                UNIQUE (symbol, expiry)
+            )
+            """)
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {QUOTE_TABLE} (
+            trade_date DATE NOT NULL,
+            instrument_id INTEGER NOT NULL REFERENCES {INSTRUMENT_TABLE} (instrument_id),
+            fetch_time TIMESTAMPTZ NOT NULL,
+            strike {PRICE_TYPE} NOT NULL,
+            spot_price {PRICE_TYPE},
+            atm_strike {PRICE_TYPE},
+{quote_columns},
+            PRIMARY KEY (trade_date, instrument_id, fetch_time, strike)
+            ) PARTITION BY RANGE (trade_date)
+            """)
+            cursor.execute(f"""
+            CREATE OR REPLACE VIEW option_chain.quotes_view AS
+            SELECT i.symbol, i.expiry, q.*
+            FROM {QUOTE_TABLE} q JOIN {INSTRUMENT_TABLE} i USING (instrument_id)
+            """)
+        conn.commit()
+    logging.info("Normalized option chain schema created successfully")
+
+
+def ensure_partition(trade_date):
+    """Create the daily partition (and optional per-instrument hash sub-partitions) once"""
+    with _lock:
+        if trade_date in _partitions:
+            return
+    name = f"{QUOTE_TABLE}_{trade_date:%Y%m%d}"
+    modulus = NORMALIZED_STORAGE_CONFIG.get('symbol_partitions', 0)
+    sub_partition = " PARTITION BY HASH (instrument_id)" if modulus > 1 else ""
+    # Concurrent CREATE TABLE IF NOT EXISTS can still collide, so serialize partition DDL
+    with _ddl_lock, db_connection() as conn, \
+            metrics.time("option_chain_stage_seconds", stage="ddl", symbol="", expiry=""):
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {QUOTE_TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s){sub_partition}",
+                (trade_date, trade_date + timedelta(days=1))
+            )
+            for remainder in range(modulus if modulus > 1 else 0):
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name}_h{remainder} PARTITION OF {name} "
+                    f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})"
+                )
+        conn.commit()
+    with _lock:
+        _partitions.add(trade_date)
+
+
+def resolve_instrument(symbol, expiry_label, trade_date):
+    """Get (creating if needed) the instrument id for a symbol and expiry label"""
+    expiry = parse_expiry_date(expiry_label, trade_date)
+    key = (symbol, expiry)
+    with _lock:
+        if key in _instrument_ids:
+            return _instrument_ids[key]
+    exchange = ALL_SYMBOLS.get(symbol, {}).get('exchange')
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {INSTRUMENT_TABLE} (symbol, exchange, expiry, expiry_label) "
+                f"VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (symbol, expiry) DO UPDATE SET expiry_label = EXCLUDED.expiry_label "
+                f"RETURNING instrument_id",
+                (symbol, exchange, expiry, expiry_label)
+            )
+            instrument_id = cursor.fetchone()[0]
+        conn.commit()
+    with _lock:
+        _instrument_ids[key] = instrument_id
+    return instrument_id
+
+
+def _prepare(symbol, expiry_date, fetch_time):
+    """Instrument id, trade date and zone-aware fetch time for a snapshot"""
+    fetched = datetime.strptime(fetch_time, '%Y-%m-%d %H:%M:%S')
+    trade_date = fetched.date()
+    ensure_partition(trade_date)
+    instrument_id = resolve_instrument(symbol, expiry_date, trade_date)
+    return instrument_id, trade_date, _tz.localize(fetched)
+
+
+def write_normalized_csv(buffer, snapshot, instrument_id, trade_date, fetched_at):
+    """Write fact table CSV rows straight from a snapshot's arrays"""
+    strike_index = QUOTE_COLUMNS.index('Strike Price')
+    prefix = f"{trade_date.isoformat()},{instrument_id},{fetched_at.isoformat(sep=' ')},"
+    spot_atm = f"{snapshot.spot_price!r},{snapshot.atm_strike!r}"
+    integer_mask = [col in BIGINT_COLUMNS for col in QUOTE_COLUMNS]
+    for row in snapshot.values.tolist():
+        strike = row[strike_index]
+        if strike != strike:
+            continue  # No strike, no key
+        fields = []
+        for i, (value, as_integer) in enumerate(zip(row, integer_mask)):
+            if i == strike_index:
+                continue
+            if value != value:
+                fields.append("")
+            elif as_integer:
+                fields.append(str(round(value)))
+            else:
+                fields.append(repr(value))
+        buffer.write(f"{prefix}{strike!r},{spot_atm},{','.join(fields)}\n")
+
+
+def insert_normalized_batch(batch):
+    """Insert several (symbol, expiry_date, snapshot) entries into the fact table in one transaction"""
+    # Resolve instruments and partitions before taking the connection for the COPY
+    buffer = io.StringIO()
+    for _, _, snapshot in batch:
+        instrument_id, trade_date, fetched_at = _prepare(
+            snapshot.symbol, snapshot.expiry_date, snapshot.fetch_time
+        )
+        write_normalized_csv(buffer, snapshot, instrument_id, trade_date, fetched_at)
+    buffer.seek(0)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {QUOTE_TABLE} ({', '.join(FACT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            record_keyframes(cursor, [snapshot for _, _, snapshot in batch])
+        conn.commit()
+    rows = sum(len(snapshot) for _, _, snapshot in batch)
+    logging.info(f"Successfully inserted {rows} records into {QUOTE_TABLE} for {len(batch)} snapshots")
+    return rows
+
+
+def insert_normalized_data(symbol, expiry_date, snapshot):
+    """Insert one snapshot into the fact table"""
+    try:
+        return insert_normalized_batch([(symbol, expiry_date, snapshot)])
+    except Exception as e:
+        logging.error(f"Error inserting normalized data for {symbol}_{expiry_date}: {str(e)}")
+        raise
+
+
+def _select_from_wide(source, instrument_param, trade_date_param):
+    """SELECT converting per-expiry (wide) rows into fact table rows"""
+    quote_sources = ", ".join(f'"{src}"' for _, src, _ in QUOTE_FIELDS)
+    return (
+        f"SELECT {trade_date_param}, {instrument_param}, "
+        f"fetch_time AT TIME ZONE '{MARKET_TIMEZONE}', \"Strike Price\", \"Spot Price\", \"ATM Strike\", "
+        f"{quote_sources} FROM {source} WHERE \"Strike Price\" IS NOT NULL"
+    )
+
+
+def replay_normalized_batch(records, keyframes=()):
+    """Idempotently load spooled (symbol, expiry_date, fetch_time, csv_body) snapshots"""
+    prepared = [(_prepare(symbol, expiry_date, fetch_time), body)
+                for symbol, expiry_date, fetch_time, body in records]
+    columns = ", ".join(f'"{col}"' for col in OPTION_CHAIN_COLUMNS)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            for i, ((instrument_id, trade_date, _), body) in enumerate(prepared):
+                stage = f"spool_stage_{i}"
+                # Stage the per-expiry CSV as text, then convert and skip rows already stored
+                cursor.execute(
+                    f"CREATE TEMP TABLE {stage} ("
+                    + ", ".join(f'"{col}" TEXT' for col in OPTION_CHAIN_COLUMNS)
+                    + ") ON COMMIT DROP"
+                )
+                cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv)", io.BytesIO(body))
+                cursor.execute(
+                    f"INSERT INTO {QUOTE_TABLE} ({', '.join(FACT_COLUMNS)}) "
+                    + _select_from_wide(_typed_stage(stage), "%s", "%s")
+                    + " ON CONFLICT DO NOTHING",
+                    (trade_date, instrument_id)
+                )
+            record_keyframes(cursor, keyframes)
+        conn.commit()
+    logging.info(f"Replayed {len(prepared)} spooled snapshots into {QUOTE_TABLE}")
+    return len(prepared)
+
+
+def _typed_stage(stage):
+    """Subquery casting a text staging table back to the per-expiry column types"""
+    casts = ['"fetch_time"::timestamp AS "fetch_time"']
+    for src in ['Strike Price', 'Spot Price', 'ATM Strike'] + [src for _, src, _ in QUOTE_FIELDS]:
+        sql_type = "NUMERIC" if src in BIGINT_COLUMNS else "DOUBLE PRECISION"
+        casts.append(f'NULLIF("{src}", \'\')::{sql_type} AS "{src}"')
+    return f"(SELECT {', '.join(casts)} FROM {stage}) AS staged"
+
+
+def reconstruct_normalized_chain(symbol, expiry_date, at_time):
+    """Rebuild the fact table rows for one chain as it stood at `at_time` (keyframe plus changes)"""
+    fetched_at = _tz.localize(at_time) if at_time.tzinfo is None else at_time
+    expiry = parse_expiry_date(expiry_date, fetched_at.astimezone(_tz).date())
+    columns = ", ".join(f"q.{col}" for col in FACT_COLUMNS)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT instrument_id FROM {INSTRUMENT_TABLE} WHERE symbol = %s AND expiry = %s",
+                (symbol, expiry)
+            )
+            found = cursor.fetchone()
+            latest = None
+            if found:
+                instrument_id = found[0]
+                cursor.execute(
+                    f"SELECT MAX(fetch_time) FROM {QUOTE_TABLE} "
+                    f"WHERE instrument_id = %s AND trade_date = %s AND fetch_time <= %s",
+                    (instrument_id, fetched_at.astimezone(_tz).date(), fetched_at)
+                )
+                latest = cursor.fetchone()[0]
+            if latest is None:
+                conn.rollback()
+                return pd.DataFrame(columns=FACT_COLUMNS)
+            # Keyframes are recorded in market-local wall time, like the per-expiry tables
+            cursor.execute(
+                f"SELECT MAX(fetch_time) AT TIME ZONE '{MARKET_TIMEZONE}' FROM {KEYFRAME_TABLE} "
+                f"WHERE symbol = %s AND expiry_date = %s AND fetch_time <= %s AT TIME ZONE '{MARKET_TIMEZONE}'",
+                (symbol, expiry_date, latest)
+            )
+            keyframe = cursor.fetchone()[0] or latest
+            cursor.execute(
+                f"SELECT DISTINCT ON (q.strike) {columns} FROM {QUOTE_TABLE} q "
+                f"WHERE q.instrument_id = %s AND q.trade_date = %s "
+                f"AND q.fetch_time >= %s AND q.fetch_time <= %s "
+                f"ORDER BY q.strike, q.fetch_time DESC",
+                (instrument_id, latest.astimezone(_tz).date(), keyframe, latest)
+            )
+            rows = cursor.fetchall()
+        conn.rollback()
+
+    df = pd.DataFrame(rows, columns=FACT_COLUMNS)
+    current = df[df['fetch_time'] == latest].iloc[0]
+    for col in ('spot_price', 'atm_strike', 'fetch_time'):
+        df[col] = current[col]
+    return df.reset_index(drop=True)
+
+
+def backfill_table(schema_name, table_name, since=None, dry_run=False):
+    """Copy one per-expiry table into the fact table, one trade date at a time"""
+    source = f"{schema_name}.{table_name}"
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'SELECT "Symbol", "expiry_date", fetch_time::date AS trade_date, COUNT(*) '
+                f'FROM {source} WHERE fetch_time IS NOT NULL '
+                + ("AND fetch_time >= %s " if since else "")
+                + 'GROUP BY 1, 2, 3 ORDER BY 3',
+                (since,) if since else None
+            )
+            groups = cursor.fetchall()
+        conn.rollback()
+
+    copied = 0
+    for symbol, expiry_label, trade_date, count in groups:
+        try:
+            parse_expiry_date(expiry_label, trade_date)
+        except ValueError:
+            logging.warning(f"Skipping {count} rows in {source}: cannot parse expiry '{expiry_label}'")
+            continue
+        if dry_run:
+            copied += count
+            continue
+        ensure_partition(trade_date)
+        instrument_id = resolve_instrument(symbol, expiry_label, trade_date)
+        day_rows = (
+            f"(SELECT * FROM {source} WHERE \"Symbol\" = %s AND \"expiry_date\" = %s "
+            f"AND fetch_time >= %s AND fetch_time < %s) AS day_rows"
+        )
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {QUOTE_TABLE} ({', '.join(FACT_COLUMNS)}) "
+                    + _select_from_wide(day_rows, "%s", "%s")
+                    + " ON CONFLICT DO NOTHING",
+                    (trade_date, instrument_id, symbol, expiry_label,
+                     trade_date, trade_date + timedelta(days=1))
+                )
+                copied += cursor.rowcount
+            conn.commit()
+    return copied
+
+
+def list_per_expiry_tables():
+    """All per-expiry option chain tables as (schema, table)"""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_schema, table_name FROM information_schema.tables "
+                "WHERE table_schema LIKE 'option\\_chain\\_%' AND table_type = 'BASE TABLE' "
+                "ORDER BY 1, 2"
+            )
+            tables = cursor.fetchall()
+        conn.rollback()
+    return tables
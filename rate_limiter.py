@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# Queue priorities, lower values are served first
+PRIORITY_INDEX = 0
+PRIORITY_STOCK = 1
+
+
+def priority_for(symbol_config):
+    """Index symbols go ahead of stocks in the request queues"""
+    return PRIORITY_INDEX if symbol_config.get('exchange') == "INDEX" else PRIORITY_STOCK
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def time_until_available(self, now):
+        """Seconds until one token can be taken (0 if one is available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RequestScheduler:
+    """Priority queue per endpoint class, released at the pace of its token bucket"""
+
+    def __init__(self, limits):
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._buckets = {}
+        self._queues = {}
+        self._stats = {}
+        self._local = threading.local()
+        for endpoint, limit in limits.items():
+            self._buckets[endpoint] = TokenBucket(limit['rate'], limit.get('burst', 1))
+            self._queues[endpoint] = []
+            self._stats[endpoint] = {"calls": 0, "total_wait": 0.0, "max_wait": 0.0, "queued": 0}
+
+    def acquire(self, endpoint, priority=PRIORITY_STOCK):
+        """Block until this caller may send a request to `endpoint`, returns the queue wait"""
+        bucket = self._buckets[endpoint]
+        queue = self._queues[endpoint]
+        ticket = (priority, next(self._sequence))
+        enqueued_at = time.monotonic()
+
+        with self._cond:
+            heapq.heappush(queue, ticket)
+            self._stats[endpoint]["queued"] = len(queue)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if queue[0] == ticket:
+                        delay = bucket.time_until_available(time.monotonic())
+                        if delay <= 0:
+                            bucket.take()
+                            heapq.heappop(queue)
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                raise
+            finally:
+                self._stats[endpoint]["queued"] = len(queue)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - enqueued_at
+            stats = self._stats[endpoint]
+            stats["calls"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+        self._local.last_wait = waited
+        if waited > 1:
+            logging.debug(f"{endpoint} request waited {waited:.3f} seconds in queue")
+        return waited
+
+    def scale(self, factor):
+        """Scale every bucket, e.g. to share one broker account's limits between processes"""
+        with self._cond:
+            for bucket in self._buckets.values():
+                bucket.rate *= factor
+                bucket.capacity = max(1.0, bucket.capacity * factor)
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+            self._cond.notify_all()
+
+    def call(self, endpoint, priority, func, *args, **kwargs):
+        """Run `func` once the scheduler releases a slot for `endpoint`"""
+        self.acquire(endpoint, priority)
+        return func(*args, **kwargs)
+
+    def last_wait(self):
+        """Queue wait of the most recent request made by the calling thread"""
+        return getattr(self._local, 'last_wait', 0.0)
+
+    def get_stats(self, reset=False):
+        """Per-endpoint call counts and queue wait times"""
+        with self._cond:
+            snapshot = {}
+            for endpoint, stats in self._stats.items():
+                snapshot[endpoint] = dict(stats)
+                snapshot[endpoint]["avg_wait"] = stats["total_wait"] / stats["calls"] if stats["calls"] else 0.0
+                if reset:
+                    stats.update(calls=0, total_wait=0.0, max_wait=0.0)
+            return snapshot
+
+
+class RateLimitedClient:
+    """Tradehull client wrapper that routes broker calls through a RequestScheduler"""
+
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+
+    def get_ltp_data(self, names, priority=PRIORITY_STOCK):
+        return self.scheduler.call("ltp", priority, self.client.get_ltp_data, names=names)
+
+    def ATM_Strike_Selection(self, Underlying, Expiry, priority=PRIORITY_STOCK):
+        return self.scheduler.call(
+            "atm", priority, self.client.ATM_Strike_Selection,
+            Underlying=Underlying, Expiry=Expiry
+        )
+
+    def get_option_chain(self, Underlying, exchange, expiry, num_strikes, priority=PRIORITY_STOCK):
+        return self.scheduler.call(
+            "option_chain", priority, self.client.get_option_chain,
+            Underlying=Underlying, exchange=exchange, expiry=expiry, num_strikes=num_strikes
+        )
+
+    def __getattr__(self, name):
+        # Anything else goes straight to the underlying client
+        return getattr(self.client, name)
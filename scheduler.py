@@ -0,0 +1,160 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+from metrics import metrics
+
+MISSED_TICK_POLICIES = ("skip", "catch_up", "coalesce")
+
+
+@dataclass
+class Tick:
+    """One scheduled collection slot"""
+    index: int               # Slot number since the epoch (slot * interval = slot start)
+    slot: datetime           # Start of the sampling slot, e.g. 10:15:00 or 10:15:30
+    scheduled_at: datetime   # When the cycle was due to start (slot + offset)
+    lateness: float          # Seconds between scheduled_at and release
+    missed: int = 0          # Earlier ticks skipped or folded into this one
+
+
+class TickScheduler:
+    """Releases collection ticks on a fixed wall-clock grid without drift
+
+    Ticks fall on multiples of `interval` seconds (so 15, 30 and 60 second intervals line up
+    with minute boundaries) plus `offset`. Sleeping is done against the monotonic clock, so
+    cycle durations never accumulate into the schedule; the wall/monotonic mapping is re-synced
+    if the system clock is stepped.
+
+    When a cycle overruns past later ticks the missed-tick policy decides what happens:
+      skip      drop ticks more than one interval overdue; run the current one if it is no
+                more than `grace` seconds late, otherwise wait for the next
+      catch_up  run up to `max_catch_up` overdue ticks back to back, dropping older ones
+      coalesce  run once immediately in place of every overdue tick
+    Every dropped tick is logged, counted and kept in `skipped`.
+    """
+
+    def __init__(self, interval, offset=0.0, policy="skip", max_catch_up=3, grace=None,
+                 clock=time.monotonic, wall_clock=time.time):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if policy not in MISSED_TICK_POLICIES:
+            raise ValueError(f"Unknown missed-tick policy: {policy}")
+        self.interval = interval
+        self.offset = offset
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.grace = interval / 2 if grace is None else grace
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._stop = threading.Event()
+        self._pending = deque()  # Overdue ticks queued by catch_up
+        self.skipped = deque(maxlen=1000)  # Recently dropped tick slots
+        self.stats = {"ticks": 0, "skipped": 0, "caught_up": 0, "coalesced": 0, "resyncs": 0}
+        self.reset()
+
+    def reset(self):
+        """Forget overdue ticks and start from the next tick on the grid (e.g. after a market break)"""
+        self._sync()
+        self._pending.clear()
+        # A tick that fell due within the last second (e.g. woken right at market open) still runs
+        self._next = self._index_at(self._wall_clock() - min(self.grace, 1.0), ceil=True)
+
+    def stop(self):
+        """Wake a waiting wait_next(), which then returns None"""
+        self._stop.set()
+
+    def _sync(self):
+        self._mono_base = self._clock()
+        self._wall_base = self._wall_clock()
+
+    def _index_at(self, wall, ceil=False):
+        position = (wall - self.offset) / self.interval
+        return math.ceil(position) if ceil else math.floor(position)
+
+    def _due_wall(self, index):
+        return index * self.interval + self.offset
+
+    def _now_wall(self):
+        """Current wall time measured on the monotonic clock"""
+        return self._wall_base + (self._clock() - self._mono_base)
+
+    def _make_tick(self, index, missed=0):
+        slot_start = index * self.interval
+        due = self._due_wall(index)
+        return Tick(
+            index=index,
+            slot=datetime.fromtimestamp(slot_start),
+            scheduled_at=datetime.fromtimestamp(due),
+            lateness=max(self._now_wall() - due, 0.0),
+            missed=missed
+        )
+
+    def _drop(self, indices, reason):
+        if not indices:
+            return
+        for index in indices:
+            self.skipped.append(datetime.fromtimestamp(index * self.interval))
+        self.stats["skipped"] += len(indices)
+        metrics.inc("option_chain_missed_ticks_total", len(indices), policy=self.policy)
+        first = datetime.fromtimestamp(indices[0] * self.interval).strftime('%H:%M:%S')
+        last = datetime.fromtimestamp(indices[-1] * self.interval).strftime('%H:%M:%S')
+        logging.warning(f"Skipped {len(indices)} collection ticks ({first} - {last}): {reason}")
+
+    def wait_next(self):
+        """Block until the next tick is due and return it (None once stopped)"""
+        if self._pending:
+            return self._release(self._make_tick(self._pending.popleft()))
+
+        # A stepped system clock moves the grid; re-map before deciding what is overdue
+        drift = (self._wall_clock() - self._wall_base) - (self._clock() - self._mono_base)
+        if abs(drift) > 0.5:
+            logging.warning(f"System clock moved {drift:+.2f}s, re-syncing the scheduler")
+            self.stats["resyncs"] += 1
+            self._sync()
+
+        now = self._now_wall()
+        current = self._index_at(now)  # Latest tick whose due time has passed
+        if current >= self._next:
+            overdue = list(range(self._next, current))
+            lateness = now - self._due_wall(current)
+            if self.policy == "coalesce":
+                self.stats["coalesced"] += len(overdue)
+                if overdue:
+                    metrics.inc("option_chain_missed_ticks_total", len(overdue), policy=self.policy)
+                    logging.warning(f"Coalescing {len(overdue)} missed ticks into one cycle")
+                return self._release(self._make_tick(current, missed=len(overdue)))
+            if self.policy == "catch_up":
+                keep = overdue[-self.max_catch_up:] if self.max_catch_up > 0 else []
+                self._drop(overdue[:len(overdue) - len(keep)], "beyond catch-up limit")
+                self.stats["caught_up"] += len(keep)
+                self._pending.extend(keep + [current])
+                return self._release(self._make_tick(self._pending.popleft()))
+            # skip
+            if lateness <= self.grace:
+                self._drop(overdue, "previous cycle overran")
+                return self._release(self._make_tick(current, missed=len(overdue)))
+            self._drop(overdue + [current], "previous cycle overran")
+            self._next = current + 1
+
+        # Sleep on the monotonic clock until the next tick is due
+        due_mono = self._mono_base + (self._due_wall(self._next) - self._wall_base)
+        while True:
+            remaining = due_mono - self._clock()
+            if remaining <= 0:
+                break
+            if self._stop.wait(remaining):
+                return None
+        return self._release(self._make_tick(self._next))
+
+    def _release(self, tick):
+        self._next = max(self._next, tick.index + 1)
+        self.stats["ticks"] += 1
+        return tick
+
+    def seconds_until_next(self):
+        """Seconds until the next tick is due (0 if it already is)"""
+        return max(self._due_wall(self._next) - self._now_wall(), 0.0)
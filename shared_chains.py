@@ -0,0 +1,274 @@
+"""Publish live snapshots to memory-mapped segments, and read them from other processes.
+
+Each (symbol, expiry) gets one file, <directory>/<SYMBOL>/<expiry>.chain (directory defaults
+to /dev/shm, i.e. RAM). A file is a fixed header followed by two slots, each holding one
+snapshot's scalars and its (strikes x QUOTE_COLUMNS) float64 array:
+
+    header   magic, layout, n_columns, max_strikes, sequence
+    slot 0   n_strikes, spot_price, atm_strike, fetch_time, timestamp, values
+    slot 1   same
+
+`sequence` is a seqlock counter: the writer makes it odd while writing and even when done,
+and publish number k = sequence // 2 lives in slot k % 2. A reader's view of publish k
+stays intact until publish k + 2 starts writing into the same slot (sequence 2k + 3),
+so consumers can work on zero-copy NumPy views and call SharedChain.is_valid() afterwards.
+
+    from shared_chains import ChainReader
+    reader = ChainReader("NIFTY", "26 JUN")
+    chain = reader.wait_next(timeout=60)
+    ce_oi, pe_oi = chain.column("CE OI"), chain.column("PE OI")   # views, no copies
+    if not chain.is_valid():
+        ...  # overwritten while in use: read again
+"""
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from snapshot import QUOTE_COLUMNS, QUOTE_INDEX
+
+MAGIC = b"OCCHAIN1"
+LAYOUT_VERSION = 1
+DEFAULT_DIRECTORY = "/dev/shm/option_chain" if os.path.isdir("/dev/shm") else "shm"
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"), ("layout", "<u4"), ("n_columns", "<u4"),
+    ("max_strikes", "<u4"), ("_pad", "<u4"), ("sequence", "<u8"),
+    ("_reserved", "S32"),
+])
+SLOT_META_DTYPE = np.dtype([
+    ("n_strikes", "<u4"), ("_pad", "<u4"), ("spot_price", "<f8"), ("atm_strike", "<f8"),
+    ("fetch_time", "S19"), ("timestamp", "S8"), ("_reserved", "S21"),
+])
+N_COLUMNS = len(QUOTE_COLUMNS)
+# QUOTE_COLUMNS is CE columns, Strike Price, PE columns: each side is a contiguous block
+STRIKE_INDEX = QUOTE_INDEX['Strike Price']
+CE_COLUMNS = QUOTE_COLUMNS[:STRIKE_INDEX]
+PE_COLUMNS = QUOTE_COLUMNS[STRIKE_INDEX + 1:]
+
+
+def segment_path(directory, symbol, expiry_date):
+    expiry_file = re.sub(r'[^A-Za-z0-9]+', '_', expiry_date).strip('_')
+    return os.path.join(directory, symbol.upper(), f"{expiry_file}.chain")
+
+
+def _slot_bytes(max_strikes):
+    return SLOT_META_DTYPE.itemsize + max_strikes * N_COLUMNS * 8
+
+
+def _segment_bytes(max_strikes):
+    return HEADER_DTYPE.itemsize + 2 * _slot_bytes(max_strikes)
+
+
+class _Segment:
+    """Structured views over one mapped file"""
+
+    def __init__(self, buffer, max_strikes):
+        self.header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)
+        self.slots = []
+        for slot in range(2):
+            offset = HEADER_DTYPE.itemsize + slot * _slot_bytes(max_strikes)
+            meta = np.frombuffer(buffer, dtype=SLOT_META_DTYPE, count=1, offset=offset)
+            values = np.frombuffer(buffer, dtype=np.float64, count=max_strikes * N_COLUMNS,
+                                   offset=offset + SLOT_META_DTYPE.itemsize).reshape(max_strikes, N_COLUMNS)
+            self.slots.append((meta, values))
+
+    @property
+    def sequence(self):
+        return int(self.header["sequence"][0])
+
+
+class _SegmentWriter:
+    def __init__(self, path, max_strikes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = _segment_bytes(max_strikes)
+        if not self._compatible(path, size, max_strikes):
+            # Build the file aside and rename it into place, so readers never map a half-made one
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.truncate(size)
+                header = np.zeros(1, dtype=HEADER_DTYPE)
+                header["magic"], header["layout"] = MAGIC, LAYOUT_VERSION
+                header["n_columns"], header["max_strikes"] = N_COLUMNS, max_strikes
+                f.write(header.tobytes())
+            os.replace(tmp_path, path)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self.segment = _Segment(self._map, max_strikes)
+        # A writer that died mid-publish leaves an odd sequence: that slot is simply rewritten
+        self.segment.header["sequence"] = self.segment.sequence // 2 * 2
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _compatible(path, size, max_strikes):
+        """An existing segment of the same layout is reused, keeping its last snapshot and sequence"""
+        try:
+            if os.path.getsize(path) != size:
+                return False
+            with open(path, "rb") as f:
+                header = np.frombuffer(f.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)[0]
+        except (OSError, ValueError, IndexError):
+            return False
+        return (header["magic"] == MAGIC and header["layout"] == LAYOUT_VERSION
+                and header["n_columns"] == N_COLUMNS and header["max_strikes"] == max_strikes)
+
+    def write(self, snapshot):
+        n = len(snapshot)
+        with self.lock:
+            header = self.segment.header
+            sequence = self.segment.sequence
+            meta, values = self.segment.slots[(sequence // 2 + 1) % 2]
+            header["sequence"] = sequence + 1  # Odd: writing
+            meta["n_strikes"] = n
+            meta["spot_price"], meta["atm_strike"] = snapshot.spot_price, snapshot.atm_strike
+            meta["fetch_time"] = snapshot.fetch_time.encode("ascii")
+            meta["timestamp"] = snapshot.timestamp.encode("ascii")
+            values[:n] = snapshot.values
+            header["sequence"] = sequence + 2  # Even: publish complete
+            return sequence + 2
+
+    def close(self):
+        self.segment = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # Views still referenced; the mapping is released with them
+        self._file.close()
+
+
+class SharedChainPublisher:
+    """Writes each snapshot into its (symbol, expiry) segment; safe to call from worker threads"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_strikes=256):
+        self.directory = directory
+        self.max_strikes = max_strikes
+        self._lock = threading.Lock()
+        self._writers = {}
+
+    def publish(self, snapshot):
+        """Returns the new sequence number, or None if the chain does not fit the segment"""
+        if len(snapshot) > self.max_strikes:
+            logging.error(
+                f"{snapshot.symbol} {snapshot.expiry_date}: {len(snapshot)} strikes exceed the "
+                f"shared memory segment ({self.max_strikes}), not published"
+            )
+            return None
+        key = (snapshot.symbol, snapshot.expiry_date)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                writer = self._writers[key] = _SegmentWriter(
+                    segment_path(self.directory, snapshot.symbol, snapshot.expiry_date), self.max_strikes
+                )
+        return writer.write(snapshot)
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+
+
+class SharedChain:
+    """One published snapshot as read-only views into the shared segment"""
+
+    def __init__(self, segment, sequence, meta, values):
+        self._segment = segment
+        self.sequence = sequence
+        self.n_strikes = int(meta["n_strikes"])
+        self.spot_price = float(meta["spot_price"])
+        self.atm_strike = float(meta["atm_strike"])
+        self.fetch_time = meta["fetch_time"].decode("ascii")
+        self.timestamp = meta["timestamp"].decode("ascii")
+        self.values = values[:self.n_strikes]
+
+    def column(self, name):
+        return self.values[:, QUOTE_INDEX[name]]
+
+    @property
+    def strikes(self):
+        return self.values[:, STRIKE_INDEX]
+
+    @property
+    def ce(self):
+        """(strikes x CE_COLUMNS) view"""
+        return self.values[:, :STRIKE_INDEX]
+
+    @property
+    def pe(self):
+        """(strikes x PE_COLUMNS) view"""
+        return self.values[:, STRIKE_INDEX + 1:]
+
+    def is_valid(self):
+        """True while the writer has not started overwriting this snapshot's slot"""
+        return self._segment.sequence <= self.sequence + 2
+
+    def copy(self):
+        """Private copy of the values, or None if the slot was overwritten during the copy"""
+        values = self.values.copy()
+        return values if self.is_valid() else None
+
+
+class ChainReader:
+    """Zero-copy reader of one (symbol, expiry) segment"""
+
+    def __init__(self, symbol, expiry_date, directory=DEFAULT_DIRECTORY):
+        self.path = segment_path(directory, symbol, expiry_date)
+        self._inode = None
+        self._segment = None
+
+    def _open(self):
+        # The writer replaces the file when it restarts; remap when the inode changes
+        stat = os.stat(self.path)
+        if self._segment is not None and stat.st_ino == self._inode:
+            return self._segment
+        with open(self.path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC or header["layout"] != LAYOUT_VERSION or header["n_columns"] != N_COLUMNS:
+            raise ValueError(f"{self.path} is not a layout {LAYOUT_VERSION} option chain segment")
+        self._segment = _Segment(buffer, int(header["max_strikes"]))
+        self._inode = stat.st_ino
+        return self._segment
+
+    @property
+    def sequence(self):
+        """Current sequence number (0: nothing published yet)"""
+        try:
+            return self._open().sequence
+        except FileNotFoundError:
+            return 0
+
+    def latest(self, retries=100):
+        """The most recent complete snapshot, or None before the first publish"""
+        segment = self._open()
+        for _ in range(retries):
+            # Mid-write (odd) the previous publish is still whole in the other slot
+            sequence = segment.sequence // 2 * 2
+            if sequence == 0:
+                return None
+            meta, values = segment.slots[(sequence // 2) % 2]
+            chain = SharedChain(segment, sequence, meta[0].copy(), values)
+            if chain.is_valid():
+                # The writer did not touch this slot while its scalars were read
+                return chain
+        raise RuntimeError(f"{self.path}: writer kept overtaking the reader")
+
+    def wait_next(self, after=None, timeout=None, poll_interval=0.001):
+        """Block until a snapshot newer than sequence `after` (default: the current one) is published"""
+        after = self.sequence if after is None else after
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                sequence = self._open().sequence
+            except FileNotFoundError:
+                sequence = 0
+            if sequence > after and sequence % 2 == 0:
+                return self.latest()
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
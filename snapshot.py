@@ -0,0 +1,148 @@
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Columns written to every option chain table, in table order
+OPTION_CHAIN_COLUMNS = [
+    'Symbol', 'expiry_date', 'fetch_time', 'Spot Price', 'ATM Strike',
+    'CE OI', 'CE Chg in OI', 'CE Volume', 'CE IV', 'CE LTP',
+    'CE Bid Qty', 'CE Bid', 'CE Ask', 'CE Ask Qty',
+    'CE Delta', 'CE Theta', 'CE Gamma', 'CE Vega',
+    'Strike Price',
+    'PE Bid Qty', 'PE Bid', 'PE Ask', 'PE Ask Qty',
+    'PE LTP', 'PE IV', 'PE Volume', 'PE Chg in OI', 'PE OI',
+    'PE Delta', 'PE Theta', 'PE Gamma', 'PE Vega',
+    'timestamp'
+]
+
+BIGINT_COLUMNS = {
+    'CE OI', 'CE Chg in OI', 'CE Volume', 'CE Bid Qty', 'CE Ask Qty',
+    'PE Bid Qty', 'PE Ask Qty', 'PE Volume', 'PE Chg in OI', 'PE OI'
+}
+
+FLOAT_COLUMNS = {
+    'Spot Price', 'ATM Strike', 'CE IV', 'CE LTP', 'CE Bid', 'CE Ask',
+    'CE Delta', 'CE Theta', 'CE Gamma', 'CE Vega', 'Strike Price',
+    'PE Bid', 'PE Ask', 'PE LTP', 'PE IV',
+    'PE Delta', 'PE Theta', 'PE Gamma', 'PE Vega'
+}
+
+# Per-strike numeric columns held in the snapshot array, in table order
+QUOTE_COLUMNS = OPTION_CHAIN_COLUMNS[5:-1]
+QUOTE_INDEX = {col: i for i, col in enumerate(QUOTE_COLUMNS)}
+_INTEGER_MASK = [col in BIGINT_COLUMNS for col in QUOTE_COLUMNS]
+
+
+@dataclass
+class OptionChainSnapshot:
+    """One option chain fetch: scalar metadata plus a (strikes x QUOTE_COLUMNS) float64 array"""
+    symbol: str
+    expiry_date: str
+    fetch_time: str
+    timestamp: str
+    spot_price: float
+    atm_strike: float
+    values: np.ndarray
+    is_keyframe: Optional[bool] = None  # Set by delta encoding: full chain (True) or changed strikes only
+
+    @classmethod
+    def from_frame(cls, df, symbol, expiry_date, fetch_time, timestamp, spot_price, atm_strike):
+        """Build a snapshot from the DataFrame returned by Tradehull get_option_chain"""
+        frame = df.reindex(columns=QUOTE_COLUMNS)
+        try:
+            # One conversion for the usual all-numeric broker frame
+            values = frame.to_numpy(dtype=np.float64, na_value=np.nan)
+        except (TypeError, ValueError):
+            values = np.column_stack([
+                pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                for col in QUOTE_COLUMNS
+            ])
+        return cls(symbol, expiry_date, fetch_time, timestamp,
+                   float(spot_price), float(atm_strike), values)
+
+    @property
+    def n_strikes(self):
+        return self.values.shape[0]
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def column(self, name):
+        """View (not a copy) of one per-strike column"""
+        return self.values[:, QUOTE_INDEX[name]]
+
+    @property
+    def strikes(self):
+        return self.column('Strike Price')
+
+    def to_frame(self):
+        """Expand to a DataFrame in table column order"""
+        n = self.n_strikes
+        data = {
+            'Symbol': [self.symbol] * n,
+            'expiry_date': [self.expiry_date] * n,
+            'fetch_time': [self.fetch_time] * n,
+            'Spot Price': np.full(n, self.spot_price),
+            'ATM Strike': np.full(n, self.atm_strike),
+        }
+        for col in QUOTE_COLUMNS:
+            values = self.column(col)
+            data[col] = pd.array(np.round(values), dtype='Int64') if col in BIGINT_COLUMNS else values
+        data['timestamp'] = [self.timestamp] * n
+        return pd.DataFrame(data, columns=OPTION_CHAIN_COLUMNS)
+
+    def to_records(self):
+        """Rows as dicts with None for missing values (executemany path)"""
+        prefix = {
+            'Symbol': self.symbol, 'expiry_date': self.expiry_date, 'fetch_time': self.fetch_time,
+            'Spot Price': self.spot_price, 'ATM Strike': self.atm_strike,
+        }
+        records = []
+        for row in self.values:
+            record = dict(prefix)
+            for col, value in zip(QUOTE_COLUMNS, row.tolist()):
+                if value != value:  # NaN
+                    record[col] = None
+                elif col in BIGINT_COLUMNS:
+                    record[col] = int(round(value))
+                else:
+                    record[col] = value
+            record['timestamp'] = self.timestamp
+            records.append(record)
+        return records
+
+    def write_csv(self, buffer):
+        """Write COPY ... (FORMAT csv) rows straight from the arrays"""
+        prefix = ",".join([
+            _csv_text(self.symbol), _csv_text(self.expiry_date), _csv_text(self.fetch_time),
+            repr(self.spot_price), repr(self.atm_strike), ""
+        ])
+        suffix = f",{_csv_text(self.timestamp)}\n"
+        for row in self.values.tolist():
+            fields = []
+            for value, as_integer in zip(row, _INTEGER_MASK):
+                if value != value:  # NaN is written as an empty field (NULL)
+                    fields.append("")
+                elif as_integer:
+                    fields.append(str(round(value)))
+                else:
+                    fields.append(repr(value))
+            buffer.write(prefix + ",".join(fields) + suffix)
+
+    def to_copy_buffer(self):
+        """In-memory CSV buffer ready for COPY FROM STDIN"""
+        buffer = io.StringIO()
+        self.write_csv(buffer)
+        buffer.seek(0)
+        return buffer
+
+
+def _csv_text(value):
+    """Quote a text field for CSV if it needs it"""
+    text = str(value)
+    if any(c in text for c in ',"\n\r') or text == "":
+        return '"' + text.replace('"', '""') + '"'
+    return text
@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+# Record layout: magic | header length | body length | crc32 of header+body | header | body
+RECORD_MAGIC = b"OCS1"
+RECORD_HEADER = struct.Struct("<4sIII")
+SEGMENT_SUFFIX = ".spool"
+ACK_SUFFIX = ".ack"
+# Records that kept failing to replay, in the same layout; never replayed automatically
+DEAD_LETTER_FILE = "dead-letter.spool"
+
+
+@dataclass
+class SpoolRecord:
+    """One spooled snapshot: metadata plus the COPY-ready CSV body"""
+    record_id: str
+    symbol: str
+    expiry_date: str
+    fetch_time: str
+    rows: int
+    body: bytes
+    is_keyframe: Optional[bool] = None
+
+
+class Spool:
+    """Append-only, segmented local spool of snapshots not yet acknowledged by Postgres"""
+
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        os.makedirs(directory, exist_ok=True)
+        existing = self._segment_numbers()
+        # Always start a fresh segment so older ones are sealed and safe to replay
+        self._current = (existing[-1] + 1) if existing else 1
+        self._file = open(self._segment_path(self._current), "ab")
+
+    def _segment_numbers(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)].split("-")[1])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:012d}{SEGMENT_SUFFIX}")
+
+    def _ack_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:012d}{ACK_SUFFIX}")
+
+    @staticmethod
+    def _frame(header, body):
+        header = json.dumps(header).encode("utf-8")
+        crc = zlib.crc32(body, zlib.crc32(header))
+        return RECORD_HEADER.pack(RECORD_MAGIC, len(header), len(body), crc) + header + body
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def append(self, symbol, expiry_date, fetch_time, rows, body, is_keyframe=None):
+        """Durably append a snapshot and return its record id"""
+        record = self._frame({
+            "symbol": symbol,
+            "expiry_date": expiry_date,
+            "fetch_time": fetch_time,
+            "rows": rows,
+            "keyframe": is_keyframe,
+        }, body)
+        with self._lock:
+            if self._file.tell() >= self.segment_max_bytes:
+                self._roll()
+            offset = self._file.tell()
+            self._file.write(record)
+            self._sync(self._file)
+            record_id = f"{self._current}:{offset}"
+            self._in_flight.add(record_id)
+        return record_id
+
+    def _roll(self):
+        """Seal the current segment and start a new one (lock held)"""
+        self._file.close()
+        self._current += 1
+        self._file = open(self._segment_path(self._current), "ab")
+
+    def ack(self, record_ids):
+        """Mark records as safely stored in Postgres"""
+        by_segment = {}
+        for record_id in record_ids:
+            number, offset = record_id.split(":")
+            by_segment.setdefault(int(number), []).append(offset)
+        with self._lock:
+            for number, offsets in by_segment.items():
+                with open(self._ack_path(number), "a") as f:
+                    f.write("".join(f"{offset}\n" for offset in offsets))
+                    self._sync(f)
+            self._in_flight.difference_update(record_ids)
+
+    def release(self, record_ids):
+        """Give records that failed to write back to the replayer"""
+        with self._lock:
+            self._in_flight.difference_update(record_ids)
+
+    def quarantine(self, records, error):
+        """Move records to the dead-letter file and acknowledge them, so they stop blocking replay"""
+        with self._lock:
+            with open(os.path.join(self.directory, DEAD_LETTER_FILE), "ab") as f:
+                for r in records:
+                    f.write(self._frame({
+                        "symbol": r.symbol,
+                        "expiry_date": r.expiry_date,
+                        "fetch_time": r.fetch_time,
+                        "rows": r.rows,
+                        "keyframe": r.is_keyframe,
+                        "record_id": r.record_id,
+                        "error": error,
+                    }, r.body))
+                self._sync(f)
+        self.ack([r.record_id for r in records])
+
+    def _acked_offsets(self, number):
+        try:
+            with open(self._ack_path(number)) as f:
+                return {int(line) for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _read_segment(self, number, end=None):
+        """Yield (offset, header, body) for every intact record in a segment"""
+        path = self._segment_path(number)
+        with open(path, "rb") as f:
+            while True:
+                offset = f.tell()
+                if end is not None and offset >= end:
+                    return
+                prefix = f.read(RECORD_HEADER.size)
+                if not prefix:
+                    return
+                if len(prefix) < RECORD_HEADER.size:
+                    logging.warning(f"Truncated record at {path}:{offset}, ignoring the rest of the segment")
+                    return
+                magic, header_len, body_len, crc = RECORD_HEADER.unpack(prefix)
+                header = f.read(header_len)
+                body = f.read(body_len)
+                if (magic != RECORD_MAGIC or len(header) != header_len or len(body) != body_len
+                        or zlib.crc32(body, zlib.crc32(header)) != crc):
+                    logging.warning(f"Corrupt record at {path}:{offset}, ignoring the rest of the segment")
+                    return
+                yield offset, json.loads(header), body
+
+    def pending(self, limit=None):
+        """Unacknowledged records that are not currently being written"""
+        with self._lock:
+            segments = [n for n in self._segment_numbers() if n <= self._current]
+            in_flight = set(self._in_flight)
+            self._file.flush()
+            # Stop at the last complete record of the segment being appended to
+            current, current_end = self._current, self._file.tell()
+        records = []
+        for number in segments:
+            acked = self._acked_offsets(number)
+            end = current_end if number == current else None
+            for offset, header, body in self._read_segment(number, end):
+                record_id = f"{number}:{offset}"
+                if offset in acked or record_id in in_flight:
+                    continue
+                records.append(SpoolRecord(record_id, header["symbol"], header["expiry_date"],
+                                           header["fetch_time"], header["rows"], body,
+                                           header.get("keyframe")))
+                if limit and len(records) >= limit:
+                    return records
+        return records
+
+    def claim(self, record_ids):
+        """Mark records as in flight so they are not handed out twice"""
+        with self._lock:
+            self._in_flight.update(record_ids)
+
+    def compact(self):
+        """Delete sealed segments whose records have all been acknowledged"""
+        with self._lock:
+            sealed = [n for n in self._segment_numbers() if n < self._current]
+        removed = 0
+        for number in sealed:
+            acked = self._acked_offsets(number)
+            if all(offset in acked for offset, _, _ in self._read_segment(number)):
+                os.remove(self._segment_path(number))
+                if os.path.exists(self._ack_path(number)):
+                    os.remove(self._ack_path(number))
+                removed += 1
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SpoolReplayer:
+    """Background thread that loads unacknowledged spool records into Postgres"""
+
+    def __init__(self, spool, replay_batch, is_available, interval=30, batch_size=20, max_attempts=3):
+        self.spool = spool
+        self.replay_batch = replay_batch
+        self.is_available = is_available
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._attempts = {}  # record id -> failed passes so far
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self.replayed = 0
+        self.quarantined = 0
+
+    def start(self):
+        self._thread.start()
+
+    def replay_once(self):
+        """Replay pending records in batches while the database is reachable"""
+        replayed = 0
+        # Records that failed on their own stay claimed until the pass ends, so later ones get through
+        failed = []
+        try:
+            while not self._stop.is_set():
+                records = self.spool.pending(limit=self.batch_size)
+                if not records:
+                    break
+                if not self.is_available():
+                    logging.warning(f"Database unavailable, {len(records)}+ spooled snapshots waiting")
+                    break
+                record_ids = [r.record_id for r in records]
+                self.spool.claim(record_ids)
+                try:
+                    self.replay_batch(records)
+                except Exception as e:
+                    logging.warning(f"Spool replay of {len(records)} snapshots failed, retrying one by one: {str(e)}")
+                    count, stalled = self._replay_each(records, failed)
+                    replayed += count
+                    if stalled:
+                        break
+                    continue
+                self.spool.ack(record_ids)
+                for record_id in record_ids:
+                    self._attempts.pop(record_id, None)
+                replayed += len(records)
+        finally:
+            if failed:
+                self.spool.release(failed)
+        if replayed:
+            self.replayed += replayed
+            logging.info(f"Replayed {replayed} spooled snapshots into the database")
+        self.spool.compact()
+        return replayed
+
+    def _replay_each(self, records, failed):
+        """Replay claimed records one at a time; returns (replayed, whether the database went away)"""
+        replayed = 0
+        for i, record in enumerate(records):
+            try:
+                self.replay_batch([record])
+            except Exception as e:
+                if not self.is_available():
+                    self.spool.release([r.record_id for r in records[i:]])
+                    logging.error(f"Spool replay failed: {str(e)}")
+                    return replayed, True
+                attempts = self._attempts.pop(record.record_id, 0) + 1
+                if attempts >= self.max_attempts:
+                    self.spool.quarantine([record], str(e))
+                    self.quarantined += 1
+                    logging.error(
+                        f"Spooled snapshot {record.symbol} {record.expiry_date} {record.fetch_time} failed "
+                        f"{attempts} replays, moved to {DEAD_LETTER_FILE}: {str(e)}"
+                    )
+                else:
+                    self._attempts[record.record_id] = attempts
+                    failed.append(record.record_id)
+                    logging.error(
+                        f"Spooled snapshot {record.symbol} {record.expiry_date} {record.fetch_time} failed "
+                        f"to replay ({attempts}/{self.max_attempts}): {str(e)}"
+                    )
+                continue
+            self.spool.ack([record.record_id])
+            self._attempts.pop(record.record_id, None)
+            replayed += 1
+        return replayed, False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.replay_once()
+            except Exception as e:
+                logging.error(f"Error in spool replayer: {str(e)}", exc_info=True)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
@@ -0,0 +1,513 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from snapshot import OptionChainSnapshot, QUOTE_COLUMNS, QUOTE_INDEX
+
+STRIKE_COLUMN = QUOTE_INDEX['Strike Price']
+GREEK_FIELDS = ('IV', 'Delta', 'Theta', 'Gamma', 'Vega')
+# Per side: quote columns a tick can set, and the model columns that go stale when the price moves
+_TICK_COLUMNS = {side: {field: QUOTE_INDEX[f'{side} {name}'] for field, name in (
+    ('ltp', 'LTP'), ('volume', 'Volume'), ('oi', 'OI'), ('bid', 'Bid'),
+    ('bid_qty', 'Bid Qty'), ('ask', 'Ask'), ('ask_qty', 'Ask Qty'))} for side in ("CE", "PE")}
+_GREEK_COLUMNS = {side: [QUOTE_INDEX[f'{side} {name}'] for name in GREEK_FIELDS] for side in ("CE", "PE")}
+
+
+@dataclass
+class FeedTick:
+    """One market feed update; fields the packet did not carry are None"""
+    segment: str          # e.g. NSE_FNO, BSE_FNO, IDX_I, NSE_EQ
+    security_id: str
+    time: datetime
+    ltp: Optional[float] = None
+    volume: Optional[float] = None
+    oi: Optional[float] = None
+    bid: Optional[float] = None
+    bid_qty: Optional[float] = None
+    ask: Optional[float] = None
+    ask_qty: Optional[float] = None
+
+    @property
+    def instrument(self):
+        return self.segment, self.security_id
+
+    def to_json(self):
+        entry = {key: value for key, value in asdict(self).items() if value is not None}
+        entry['time'] = self.time.isoformat()
+        return entry
+
+    @classmethod
+    def from_json(cls, entry):
+        return cls(**dict(entry, security_id=str(entry['security_id']),
+                          time=datetime.fromisoformat(entry['time'])))
+
+
+class FeedSource(ABC):
+    """A market feed the streaming collector subscribes to; instruments are (segment, security id) pairs
+
+      start(on_tick)            deliver FeedTicks to on_tick from a background thread
+      subscribe(instruments)    add instruments, before or after start()
+      unsubscribe(instruments)
+      stop()
+    """
+
+    @abstractmethod
+    def start(self, on_tick):
+        ...
+
+    @abstractmethod
+    def subscribe(self, instruments):
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, instruments):
+        ...
+
+    @abstractmethod
+    def stop(self):
+        ...
+
+
+def create_feed(config):
+    """Build the feed source selected by STREAMING_CONFIG"""
+    kind = config.get('feed', 'dhan')
+    if kind == "dhan":
+        load_dotenv()
+        feed = DhanFeedSource(os.getenv('DHAN_CLIENT_CODE'), os.getenv('DHAN_TOKEN_ID'))
+    elif kind == "replay":
+        feed = ReplayFeedSource(**config.get('replay', {}))
+    else:
+        raise ValueError(f"Unknown market feed: {kind}")
+    if config.get('record_path'):
+        feed = RecordingFeedSource(feed, config['record_path'])
+    logging.info(f"Using {kind} market feed" + (f", recording to {config['record_path']}" if config.get('record_path') else ""))
+    return feed
+
+
+class DhanFeedSource(FeedSource):
+    """Dhan market feed websocket (dhanhq marketfeed v2) in full-packet mode, reconnecting on errors
+
+    Dhan allows 5000 instruments per connection; subscriptions beyond that are refused.
+    """
+    SEGMENTS = {"IDX_I": "IDX", "NSE_EQ": "NSE", "NSE_FNO": "NSE_FNO", "BSE_EQ": "BSE", "BSE_FNO": "BSE_FNO"}
+    MAX_INSTRUMENTS = 5000
+
+    def __init__(self, client_id, access_token, reconnect_delay=5):
+        # Imported here so replays and simulations run without the Dhan SDK
+        from dhanhq import marketfeed
+        self._marketfeed = marketfeed
+        self._segment_names = {}
+        for segment, name in self.SEGMENTS.items():
+            self._segment_names[getattr(marketfeed, name)] = segment
+            self._segment_names[segment] = segment
+        self.client_id = client_id
+        self.access_token = access_token
+        self.reconnect_delay = reconnect_delay
+        self._lock = threading.Lock()
+        self._instruments = set()
+        self._feed = None
+        self._on_tick = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _packets(self, instruments):
+        return [(getattr(self._marketfeed, self.SEGMENTS[segment]), security_id, self._marketfeed.Full)
+                for segment, security_id in instruments]
+
+    def subscribe(self, instruments):
+        with self._lock:
+            new = set(instruments) - self._instruments
+            room = self.MAX_INSTRUMENTS - len(self._instruments)
+            if len(new) > room:
+                logging.error(f"Market feed is limited to {self.MAX_INSTRUMENTS} instruments, "
+                              f"{len(new) - room} subscriptions refused")
+                new = set(sorted(new)[:room])
+            self._instruments |= new
+            feed = self._feed
+        if feed is not None and new:
+            feed.subscribe_symbols(self._packets(new))
+
+    def unsubscribe(self, instruments):
+        with self._lock:
+            gone = set(instruments) & self._instruments
+            self._instruments -= gone
+            feed = self._feed
+        if feed is not None and gone:
+            feed.unsubscribe_symbols(self._packets(gone))
+
+    def start(self, on_tick):
+        self._on_tick = on_tick
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dhan-feed", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._lock:
+                    self._feed = self._marketfeed.DhanFeed(
+                        self.client_id, self.access_token, self._packets(self._instruments), "v2"
+                    )
+                while not self._stop.is_set():
+                    self._feed.run_forever()
+                    tick = self._parse(self._feed.get_data())
+                    if tick is not None:
+                        self._on_tick(tick)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logging.error(f"Market feed error, reconnecting in {self.reconnect_delay}s: {str(e)}")
+                self._stop.wait(self.reconnect_delay)
+
+    def _parse(self, data):
+        if not isinstance(data, dict) or 'security_id' not in data:
+            return None
+        segment = self._segment_names.get(data.get('exchange_segment'))
+        if segment is None:
+            return None
+
+        def number(source, key):
+            value = source.get(key)
+            return float(value) if value not in (None, "") else None
+
+        depth = (data.get('depth') or [{}])[0]
+        return FeedTick(
+            segment, str(data['security_id']), datetime.now(),
+            ltp=number(data, 'LTP'), volume=number(data, 'volume'), oi=number(data, 'OI'),
+            bid=number(depth, 'bid_price'), bid_qty=number(depth, 'bid_quantity'),
+            ask=number(depth, 'ask_price'), ask_qty=number(depth, 'ask_quantity')
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._feed is not None:
+            try:
+                self._feed.disconnect()
+            except Exception as e:
+                logging.warning(f"Error closing market feed: {str(e)}")
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        # The next start() connects afresh with only what is subscribed by then
+        with self._lock:
+            self._feed = None
+            self._instruments = set()
+
+
+class ReplayFeedSource(FeedSource):
+    """Replays ticks saved by RecordingFeedSource (one JSON tick per line) in real time
+
+    Recorded gaps are kept, divided by `speed`; with `loop` the file starts over at the end.
+    Ticks are delivered with the current time, as a live feed would.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True):
+        with open(path) as f:
+            self._ticks = sorted((FeedTick.from_json(json.loads(line)) for line in f if line.strip()),
+                                 key=lambda tick: tick.time)
+        if not self._ticks:
+            raise ValueError(f"No recorded ticks in {path}")
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._instruments = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.delivered = 0
+        span = (self._ticks[-1].time - self._ticks[0].time).total_seconds()
+        logging.info(f"Replaying {len(self._ticks)} ticks from {path} ({span / 60:.1f} min at {speed}x)")
+
+    def subscribe(self, instruments):
+        with self._lock:
+            self._instruments |= set(instruments)
+
+    def unsubscribe(self, instruments):
+        with self._lock:
+            self._instruments -= set(instruments)
+
+    def start(self, on_tick):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_tick,), name="replay-feed", daemon=True)
+        self._thread.start()
+
+    def _run(self, on_tick):
+        first = self._ticks[0].time
+        while not self._stop.is_set():
+            started = time.monotonic()
+            for tick in self._ticks:
+                delay = (tick.time - first).total_seconds() / self.speed - (time.monotonic() - started)
+                if delay > 0 and self._stop.wait(delay):
+                    return
+                if tick.instrument in self._instruments:
+                    on_tick(replace(tick, time=datetime.now()))
+                    self.delivered += 1
+            if not self.loop:
+                return
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self._instruments = set()
+
+
+class RecordingFeedSource(FeedSource):
+    """Passes a feed through and appends every tick to `path` for ReplayFeedSource"""
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def subscribe(self, instruments):
+        self.source.subscribe(instruments)
+
+    def unsubscribe(self, instruments):
+        self.source.unsubscribe(instruments)
+
+    def start(self, on_tick):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", buffering=1)
+
+        def record(tick):
+            with self._lock:
+                if self._file is not None:
+                    self._file.write(json.dumps(tick.to_json()) + "\n")
+            on_tick(tick)
+
+        self.source.start(record)
+
+    def stop(self):
+        self.source.stop()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LiveChain:
+    """Option chain of one (symbol, expiry) held in memory and updated in place by feed ticks"""
+
+    def __init__(self, symbol, expiry_info, strikes):
+        self.symbol = symbol
+        self.expiry = expiry_info
+        self._lock = threading.Lock()
+        self.strikes = np.array([], dtype=np.float64)
+        self.values = np.empty((0, len(QUOTE_COLUMNS)))
+        self._open_oi = np.empty((0, 2))
+        self.rows = {}  # instrument -> (row, side)
+        self.ticks = 0
+        self.set_window(strikes)
+
+    def set_window(self, strikes):
+        """Move to a new strike set, keeping the state of retained strikes; returns (added, removed) instruments"""
+        strikes = np.unique(np.asarray(strikes, dtype=np.float64))
+        values = np.full((len(strikes), len(QUOTE_COLUMNS)), np.nan)
+        values[:, STRIKE_COLUMN] = strikes
+        open_oi = np.full((len(strikes), 2), np.nan)
+        with self._lock:
+            old = {strike: row for row, strike in enumerate(self.strikes.tolist())}
+            for row, strike in enumerate(strikes.tolist()):
+                if strike in old:
+                    values[row] = self.values[old[strike]]
+                    open_oi[row] = self._open_oi[old[strike]]
+            rows = {}
+            for row, strike in enumerate(strikes.tolist()):
+                for side in ("CE", "PE"):
+                    security_id = self.expiry.contracts.get((strike, side))
+                    if security_id is not None:
+                        rows[(self.expiry.feed_segment, security_id)] = (row, side)
+            added, removed = set(rows) - set(self.rows), set(self.rows) - set(rows)
+            self.strikes, self.values, self._open_oi, self.rows = strikes, values, open_oi, rows
+        return added, removed
+
+    def seed(self, frame):
+        """Start from a full REST chain, which carries the IV, Greeks and change in OI that ticks lack"""
+        frame = frame.reindex(columns=QUOTE_COLUMNS).apply(pd.to_numeric, errors='coerce')
+        by_strike = {strike: row for row, strike in enumerate(frame['Strike Price'].tolist())}
+        seeded = frame.to_numpy(dtype=np.float64, na_value=np.nan)
+        with self._lock:
+            for row, strike in enumerate(self.strikes.tolist()):
+                if strike in by_strike:
+                    self.values[row] = seeded[by_strike[strike]]
+                    for column, side in enumerate(("CE", "PE")):
+                        oi, change = self.values[row, QUOTE_INDEX[f'{side} OI']], self.values[row, QUOTE_INDEX[f'{side} Chg in OI']]
+                        self._open_oi[row, column] = oi - change if change == change else oi
+
+    def apply(self, tick):
+        """Merge one tick into the chain; False if the instrument is not in the window"""
+        with self._lock:
+            position = self.rows.get(tick.instrument)
+            if position is None:
+                return False
+            row, side = position
+            values = self.values[row]
+            columns = _TICK_COLUMNS[side]
+            repriced = False
+            for field, column in columns.items():
+                value = getattr(tick, field)
+                if value is None or field == 'oi':
+                    continue
+                if field in ('ltp', 'bid', 'ask') and value != values[column]:
+                    repriced = True
+                values[column] = value
+            if tick.oi is not None:
+                column = 0 if side == "CE" else 1
+                if self._open_oi[row, column] != self._open_oi[row, column]:
+                    # Without a seed, change in OI counts from the first tick of the session
+                    self._open_oi[row, column] = tick.oi
+                values[columns['oi']] = tick.oi
+                values[QUOTE_INDEX[f'{side} Chg in OI']] = tick.oi - self._open_oi[row, column]
+            if repriced:
+                # IV and Greeks are recomputed from the new price by the local Greeks engine
+                values[_GREEK_COLUMNS[side]] = np.nan
+            self.ticks += 1
+            return True
+
+    def snapshot(self, spot_price, atm_strike, fetch_time, timestamp):
+        """Copy of the strikes quoted so far as an OptionChainSnapshot, or None before any quote"""
+        with self._lock:
+            quoted = ~(np.isnan(self.values[:, QUOTE_INDEX['CE LTP']]) & np.isnan(self.values[:, QUOTE_INDEX['PE LTP']]))
+            values = self.values[quoted].copy()
+        if not len(values):
+            return None
+        return OptionChainSnapshot(self.symbol, self.expiry.label, fetch_time, timestamp,
+                                   float(spot_price), float(atm_strike), values)
+
+
+class StreamingCollector:
+    """Live chains for every configured (symbol, expiry), kept current from a market feed
+
+    Each chain covers the strikes of its StrikeWindowManager window, and the feed subscriptions
+    follow the window's added and removed strikes as spot moves. Spot prices come from the
+    underlying's feed where the instrument master lists it, otherwise from set_spot().
+    `seed(symbol, expiry_index, num_strikes)` may return a REST option chain DataFrame to
+    start each chain from.
+    """
+
+    def __init__(self, feed, instrument_master, symbols_config, windows, seed=None):
+        self.feed = feed
+        self.instrument_master = instrument_master
+        self.symbols_config = symbols_config
+        self.windows = windows
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._chains = {}   # (symbol, expiry index) -> LiveChain
+        self._routes = {}   # instrument -> LiveChain
+        self._spot_routes = {}  # instrument -> symbol
+        self._spots = {}
+        self.running = False
+        self.stats = {"ticks": 0, "unrouted": 0, "window_moves": 0}
+
+    def start(self, symbols, spot_prices):
+        """Build the chains around the given spot prices, subscribe and start the feed"""
+        self._spots = dict(spot_prices)
+        instruments = set()
+        for symbol in symbols:
+            config = self.symbols_config[symbol]
+            underlying = self.instrument_master.underlying(symbol)
+            if underlying is not None:
+                self._spot_routes[underlying] = symbol
+                instruments.add(underlying)
+            if symbol not in self._spots:
+                logging.warning(f"{symbol} - No spot price, not streamed")
+                continue
+            for expiry_index in range(config['num_expiries']):
+                info = self.instrument_master.expiry(symbol, expiry_index)
+                if info is None or not info.contracts:
+                    logging.warning(f"{symbol} - No security ids for expiry {expiry_index}, not streamed")
+                    continue
+                window = self.windows.update(symbol, info.label, info.strikes, self._spots[symbol], config['num_strikes'])
+                chain = LiveChain(symbol, info, window.strikes)
+                if self.seed is not None:
+                    try:
+                        frame = self.seed(symbol, expiry_index, window.span)
+                        if frame is not None:
+                            chain.seed(frame)
+                    except Exception as e:
+                        logging.warning(f"{symbol} - Could not seed expiry {info.label} from REST: {str(e)}")
+                self._chains[(symbol, expiry_index)] = chain
+                for instrument in chain.rows:
+                    self._routes[instrument] = chain
+                instruments |= set(chain.rows)
+        self.feed.subscribe(instruments)
+        self.feed.start(self._on_tick)
+        self.running = True
+        logging.info(f"Streaming {len(self._chains)} chains over {len(instruments)} instruments")
+
+    def stop(self):
+        """Unsubscribe every instrument and stop the feed; start() builds the chains again"""
+        with self._lock:
+            instruments = set(self._routes) | set(self._spot_routes)
+            self._chains, self._routes, self._spot_routes = {}, {}, {}
+        if instruments:
+            try:
+                self.feed.unsubscribe(instruments)
+            except Exception as e:
+                logging.warning(f"Error unsubscribing {len(instruments)} instruments: {str(e)}")
+        if self.running:
+            self.feed.stop()
+            self.running = False
+
+    def _on_tick(self, tick):
+        self.stats["ticks"] += 1
+        symbol = self._spot_routes.get(tick.instrument)
+        if symbol is not None:
+            if tick.ltp is not None:
+                self._spots[symbol] = tick.ltp
+            return
+        chain = self._routes.get(tick.instrument)
+        if chain is None or not chain.apply(tick):
+            self.stats["unrouted"] += 1
+
+    def symbols_without_spot_feed(self, symbols):
+        return [symbol for symbol in symbols if symbol not in self._spot_routes.values()]
+
+    def set_spot(self, symbol, price):
+        self._spots[symbol] = price
+
+    def chains(self, symbols):
+        """[(symbol, expiry index)] of the live chains of these symbols"""
+        symbols = set(symbols)
+        return sorted(key for key in self._chains if key[0] in symbols)
+
+    def _move_window(self, chain, spot_price):
+        window = self.windows.update(chain.symbol, chain.expiry.label, chain.expiry.strikes, spot_price,
+                                     self.symbols_config[chain.symbol]['num_strikes'])
+        if not window.changed:
+            return
+        added, removed = chain.set_window(window.strikes)
+        with self._lock:
+            for instrument in removed:
+                self._routes.pop(instrument, None)
+            for instrument in added:
+                self._routes[instrument] = chain
+        self.feed.subscribe(added)
+        self.feed.unsubscribe(removed)
+        self.stats["window_moves"] += 1
+        logging.info(f"{chain.symbol} - Strike window for {chain.expiry.label} moved to "
+                     f"{window.strikes[0]:g}-{window.strikes[-1]:g}: +{len(added)} -{len(removed)} instruments")
+
+    def snapshot(self, symbol, expiry_index, fetch_time, timestamp):
+        """Current state of one chain as an OptionChainSnapshot, or None"""
+        chain = self._chains.get((symbol, expiry_index))
+        spot_price = self._spots.get(symbol)
+        if chain is None or spot_price is None:
+            return None
+        self._move_window(chain, spot_price)
+        atm_strike = self.instrument_master.atm_strike(
+            symbol, expiry_index, spot_price, self.symbols_config[symbol]['strike_gap']
+        )
+        return chain.snapshot(spot_price, atm_strike, fetch_time, timestamp)
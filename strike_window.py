@@ -0,0 +1,79 @@
+import threading
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+
+@dataclass
+class WindowUpdate:
+    """A (symbol, expiry)'s strike window after one spot update"""
+    strikes: np.ndarray   # Listed strikes in the window, ascending
+    added: np.ndarray     # Strikes that entered the window with this update
+    removed: np.ndarray   # Strikes that left it
+    span: int             # Strikes either side of ATM a broker chain request needs to cover the window
+
+    @property
+    def changed(self):
+        return bool(len(self.added) or len(self.removed))
+
+
+class StrikeWindowManager:
+    """Stable per (symbol, expiry) strike windows that move only when spot drifts far enough
+
+    A window starts as ATM +/- num_strikes over the listed strikes. It stays put while ATM
+    keeps at least num_strikes - shift_after strikes on each side; beyond that it extends
+    towards ATM so num_strikes are covered again, by at most max_extra_strikes beyond the
+    initial width, then slides and drops strikes from the far side. A market that swings back
+    and forth is therefore covered by one window rather than a new strike set every minute.
+    """
+
+    def __init__(self, shift_after=2, max_extra_strikes=10):
+        self.shift_after = shift_after
+        self.max_extra_strikes = max_extra_strikes
+        self._lock = threading.Lock()
+        self._windows = {}  # (symbol, expiry) -> (listed strikes, num_strikes, lo, hi)
+
+    def reset(self):
+        """Forget every window, e.g. on a new trade date"""
+        with self._lock:
+            self._windows = {}
+
+    def update(self, symbol, expiry, listed, spot_price, num_strikes):
+        """Window of `expiry` (any hashable, e.g. its label) for the current spot; `listed` ascending"""
+        listed = np.asarray(listed, dtype=np.float64)
+        last = len(listed) - 1
+        atm = int(np.argmin(np.abs(listed - spot_price)))
+        key = (symbol, expiry)
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or state[1] != num_strikes or not np.array_equal(state[0], listed):
+                old = None
+                lo, hi = max(atm - num_strikes, 0), min(atm + num_strikes, last)
+            else:
+                _, _, lo, hi = old = state
+                keep = max(num_strikes - self.shift_after, 0)
+                width = 2 * num_strikes + 1 + self.max_extra_strikes
+                if hi - atm < keep:
+                    hi = min(atm + num_strikes, last)
+                    lo = max(lo, hi - width + 1)
+                elif atm - lo < keep:
+                    lo = max(atm - num_strikes, 0)
+                    hi = min(hi, lo + width - 1)
+            self._windows[key] = (listed, num_strikes, lo, hi)
+
+        strikes = listed[lo:hi + 1]
+        if old is None:
+            added, removed = strikes, listed[:0]
+        else:
+            previous = listed[old[2]:old[3] + 1]
+            added = np.setdiff1d(strikes, previous, assume_unique=True)
+            removed = np.setdiff1d(previous, strikes, assume_unique=True)
+        return WindowUpdate(strikes, added, removed, span=max(atm - lo, hi - atm))
+
+
+def restrict_snapshot(snapshot, strikes):
+    """The snapshot's rows for the given strikes only"""
+    keep = np.isin(snapshot.strikes, strikes)
+    if keep.all():
+        return snapshot
+    return replace(snapshot, values=snapshot.values[keep])
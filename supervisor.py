@@ -0,0 +1,283 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import metrics
+
+
+def shard_weight(symbol_config):
+    """Strikes fetched per cycle for a symbol, used to balance shards"""
+    return symbol_config.get('num_expiries', 1) * (2 * symbol_config.get('num_strikes', 0) + 1)
+
+
+def split_symbols(symbols, num_shards):
+    """Spread {symbol: config} over at most num_shards lists, heaviest symbols first onto the lightest shard"""
+    shards = [[] for _ in range(max(1, min(num_shards, len(symbols))))]
+    loads = [0] * len(shards)
+    for symbol in sorted(symbols, key=lambda s: (-shard_weight(symbols[s]), s)):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(symbol)
+        loads[lightest] += shard_weight(symbols[symbol])
+    return shards
+
+
+def shard_path(path, shard):
+    """Per-shard variant of a file path: option_chain.log -> option_chain.shard-0.log"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard}{ext}"
+
+
+class ShardSupervisor:
+    """Runs one worker process per symbol shard, restarting crashed or hung workers
+
+    Workers are started with the spawn method, so each builds its own broker client, rate
+    limiter and database pool. `target(shard, symbols, num_shards, status_queue)` runs in
+    the worker and reports dict events on the status queue:
+      {"event": "started"}
+      {"event": "cycle", "cycle_seconds": .., "jobs": .., "failed": ..}
+      {"event": "sleeping", "until": datetime}
+    A worker that exits, or reports nothing for `stale_after` seconds outside a declared
+    sleep, is restarted after an exponential backoff; one that needs more than
+    `max_restarts` restarts within `restart_window` seconds is given up on.
+    """
+
+    def __init__(self, target, shards, max_restarts=5, restart_window=600, backoff=5,
+                 stale_after=600, stats_interval=60, stop_timeout=60):
+        self.target = target
+        self.shards = shards
+        self.num_shards = len(shards)  # Rate-limit split, fixed for the run
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.backoff = backoff
+        self.stale_after = stale_after
+        self.stats_interval = stats_interval
+        self.stop_timeout = stop_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self.status_queue = self._context.Queue()
+        self._stop = threading.Event()
+        self._processes = {}
+        self._restarts = {index: deque() for index in range(len(shards))}
+        self._restart_at = {}  # shard -> monotonic time of a pending restart
+        self._retiring = {}  # shard -> (reassigned process still flushing, monotonic kill deadline)
+        self.health = {index: self._new_health(symbols) for index, symbols in enumerate(shards)}
+
+    @staticmethod
+    def _new_health(symbols):
+        return {
+            "symbols": symbols, "state": "stopped", "pid": None, "restarts": 0,
+            "cycles": 0, "failed_jobs": 0, "last_cycle_seconds": None,
+            "max_cycle_seconds": 0.0, "total_cycle_seconds": 0.0, "last_report": None,
+            "deadline": None, "exitcode": None,
+        }
+
+    def _start(self, index):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.shards[index], self.num_shards, self.status_queue),
+            name=f"shard-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        health = self.health[index]
+        health.update(state="starting", pid=process.pid, exitcode=None,
+                      deadline=time.monotonic() + self.stale_after)
+        metrics.set_gauge("option_chain_shard_up", 1, shard=index)
+        logging.info(f"Started shard {index} (pid {process.pid}): {', '.join(self.shards[index])}")
+
+    def _handle(self, message):
+        index = message.get("shard")
+        health = self.health.get(index)
+        if health is None:
+            return
+        now = time.monotonic()
+        health["last_report"] = datetime.now()
+        health["deadline"] = now + self.stale_after
+        event = message.get("event")
+        if event == "started":
+            health["state"] = "running"
+        elif event == "sleeping":
+            health["state"] = "sleeping"
+            until = message.get("until")
+            if until is not None:
+                health["deadline"] = now + max((until - datetime.now()).total_seconds(), 0) + self.stale_after
+        elif event == "cycle":
+            health["state"] = "running"
+            seconds = message.get("cycle_seconds", 0.0)
+            health["cycles"] += 1
+            health["failed_jobs"] += message.get("failed", 0)
+            health["last_cycle_seconds"] = seconds
+            health["max_cycle_seconds"] = max(health["max_cycle_seconds"], seconds)
+            health["total_cycle_seconds"] += seconds
+            metrics.set_gauge("option_chain_shard_cycle_seconds", seconds, shard=index)
+            metrics.inc("option_chain_shard_cycles_total", shard=index)
+            metrics.inc("option_chain_shard_failed_jobs_total", message.get("failed", 0), shard=index)
+
+    def _schedule_restart(self, index, reason):
+        health = self.health[index]
+        metrics.set_gauge("option_chain_shard_up", 0, shard=index)
+        now = time.monotonic()
+        restarts = self._restarts[index]
+        while restarts and now - restarts[0] > self.restart_window:
+            restarts.popleft()
+        if len(restarts) >= self.max_restarts:
+            health["state"] = "failed"
+            logging.error(
+                f"Shard {index} {reason}; {len(restarts)} restarts in the last "
+                f"{self.restart_window}s, giving up on {', '.join(self.shards[index])}"
+            )
+            return
+        delay = min(self.backoff * 2 ** len(restarts), 300)
+        restarts.append(now)
+        health["state"] = "restarting"
+        health["restarts"] += 1
+        metrics.inc("option_chain_shard_restarts_total", shard=index)
+        self._restart_at[index] = now + delay
+        logging.error(f"Shard {index} {reason}, restarting in {delay:.0f}s")
+
+    def _reap(self, now):
+        """Start reassigned shards once their old process has exited (killed after stop_timeout)"""
+        for index, (process, deadline) in list(self._retiring.items()):
+            if process.is_alive():
+                if now < deadline:
+                    continue
+                logging.warning(f"Shard {index} did not stop in {self.stop_timeout}s, killing it")
+                process.kill()
+            process.join()
+            del self._retiring[index]
+            # Only then, so the old and new process never share the shard's spool and log files
+            if index in self.health:
+                self._start(index)
+
+    def _check(self):
+        now = time.monotonic()
+        self._reap(now)
+        for index, process in list(self._processes.items()):
+            health = self.health[index]
+            if index in self._restart_at:
+                if now >= self._restart_at[index]:
+                    del self._restart_at[index]
+                    self._start(index)
+                continue
+            if health["state"] == "failed":
+                continue
+            if not process.is_alive():
+                health["exitcode"] = process.exitcode
+                self._schedule_restart(index, f"exited with code {process.exitcode}")
+            elif health["deadline"] is not None and now > health["deadline"]:
+                process.terminate()
+                process.join(10)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                self._schedule_restart(index, f"sent no status for {self.stale_after}s")
+
+    def reassign(self, shards):
+        """Apply a new symbol split, restarting only the shards whose symbols changed
+
+        Old processes are stopped in the background (see _reap), so the supervisor keeps
+        checking the other shards meanwhile.
+        """
+        for index in range(max(len(shards), len(self.shards))):
+            old = self.shards[index] if index < len(self.shards) else None
+            new = shards[index] if index < len(shards) else None
+            if old == new:
+                continue
+            process = self._processes.pop(index, None)
+            if process is not None and process.is_alive():
+                process.terminate()  # Flushes its write queue before exiting
+                self._retiring[index] = (process, time.monotonic() + self.stop_timeout)
+            self._restart_at.pop(index, None)
+            if new is None:
+                self.health.pop(index, None)
+                self._restarts.pop(index, None)
+                metrics.set_gauge("option_chain_shard_up", 0, shard=index)
+                logging.info(f"Stopping shard {index}, no longer needed")
+                continue
+            if index >= len(self.shards):
+                self.shards.append(new)
+                self._restarts[index] = deque()
+                self.health[index] = self._new_health(new)
+            self.shards[index] = new
+            self.health[index]["symbols"] = new
+            logging.info(f"Shard {index} reassigned to {', '.join(new)}")
+            if index in self._retiring:
+                self.health[index]["state"] = "stopping"
+            else:
+                self._start(index)
+        del self.shards[len(shards):]
+
+    def get_stats(self):
+        """Aggregate health over all shards"""
+        cycles = sum(h["cycles"] for h in self.health.values())
+        return {
+            "shards": len(self.shards),
+            "up": sum(1 for p in self._processes.values() if p.is_alive()),
+            "cycles": cycles,
+            "failed_jobs": sum(h["failed_jobs"] for h in self.health.values()),
+            "restarts": sum(h["restarts"] for h in self.health.values()),
+            "avg_cycle_seconds": sum(h["total_cycle_seconds"] for h in self.health.values()) / cycles if cycles else 0.0,
+            "max_cycle_seconds": max((h["max_cycle_seconds"] for h in self.health.values()), default=0.0),
+        }
+
+    def _log_stats(self):
+        stats = self.get_stats()
+        logging.info(
+            f"Shards: {stats['up']}/{stats['shards']} up, {stats['cycles']} cycles, "
+            f"avg cycle {stats['avg_cycle_seconds']:.2f}s, max {stats['max_cycle_seconds']:.2f}s, "
+            f"{stats['failed_jobs']} failed jobs, {stats['restarts']} restarts"
+        )
+        for index, health in self.health.items():
+            last = health['last_cycle_seconds']
+            logging.info(
+                f"Shard {index} [{health['state']}] pid {health['pid']}: {health['cycles']} cycles, "
+                f"last {'-' if last is None else f'{last:.2f}s'}, max {health['max_cycle_seconds']:.2f}s, "
+                f"{health['failed_jobs']} failed jobs, {health['restarts']} restarts"
+            )
+
+    def run(self, on_stats=None):
+        """Start every shard and supervise them until stop() is called"""
+        for index in range(len(self.shards)):
+            self._start(index)
+        next_stats = time.monotonic() + self.stats_interval
+        while not self._stop.is_set():
+            try:
+                self._handle(self.status_queue.get(timeout=1))
+                while True:
+                    self._handle(self.status_queue.get_nowait())
+            except queue.Empty:
+                pass
+            if self._stop.is_set():
+                break
+            self._check()
+            if time.monotonic() >= next_stats:
+                next_stats += self.stats_interval
+                self._log_stats()
+                if on_stats is not None:
+                    on_stats(self.get_stats())
+        self._shutdown()
+
+    def stop(self):
+        """Make run() stop the workers and return"""
+        self._stop.set()
+
+    def _shutdown(self, timeout=60):
+        # Workers handle SIGTERM by flushing their write queues
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        processes = [(index, process) for index, (process, _) in self._retiring.items()]
+        for index, process in processes + list(self._processes.items()):
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logging.warning(f"Shard {index} did not stop in {timeout}s, killing it")
+                process.kill()
+                process.join()
+            metrics.set_gauge("option_chain_shard_up", 0, shard=index)
+        self._log_stats()
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import re
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+REQUIRED_KEYS = {"exchange": str, "num_expiries": int, "num_strikes": int, "strike_gap": (int, float)}
+OPTIONAL_KEYS = {"trading_exchange": str, "sim_price": (int, float), "lot_size": int}
+# Symbols are used unquoted in schema and table names (option_chain_<symbol>.<symbol>_<expiry>)
+SYMBOL_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def parse_symbols(data):
+    """Validate {symbol: {...}} read from the symbols file, raising ValueError on any problem"""
+    symbols = {}
+    for symbol, entry in data.items():
+        if not SYMBOL_PATTERN.match(symbol):
+            raise ValueError(
+                f"{symbol}: symbol names become SQL identifiers, so they may only contain letters, "
+                f"digits and underscores and must not start with a digit"
+            )
+        if not isinstance(entry, dict):
+            raise ValueError(f"{symbol}: expected a table of settings")
+        unknown = set(entry) - set(REQUIRED_KEYS) - set(OPTIONAL_KEYS)
+        if unknown:
+            raise ValueError(f"{symbol}: unknown keys {', '.join(sorted(unknown))}")
+        for key, kind in REQUIRED_KEYS.items():
+            if key not in entry:
+                raise ValueError(f"{symbol}: missing {key}")
+        for key, value in entry.items():
+            kind = REQUIRED_KEYS.get(key) or OPTIONAL_KEYS[key]
+            if not isinstance(value, kind) or isinstance(value, bool):
+                raise ValueError(f"{symbol}: {key} has the wrong type ({value!r})")
+        if entry['num_expiries'] < 1 or entry['num_strikes'] < 0 or entry['strike_gap'] <= 0:
+            raise ValueError(f"{symbol}: num_expiries, num_strikes and strike_gap must be positive")
+        symbols[symbol.upper()] = dict(entry)
+    return symbols
+
+
+def load_symbols(path):
+    """Read and validate the symbols file"""
+    with open(path, "rb") as f:
+        return parse_symbols(tomllib.load(f))
+
+
+def plan_capacity(symbols, interval, rate_limits, max_parallel_jobs, rate_share=1.0):
+    """Worker count and option chain rate budget one collection cycle needs for a symbol set
+
+    `rate_share` is the fraction of RATE_LIMITS this process gets (1/N per shard).
+    """
+    jobs = sum(config['num_expiries'] for config in symbols.values())
+    # One option chain request per job
+    limit = rate_limits['option_chain']
+    burst = max(1.0, limit.get('burst', 1) * rate_share)
+    chain_seconds = max(jobs - burst, 0) / (limit['rate'] * rate_share)
+    return {
+        "symbols": len(symbols),
+        "jobs": jobs,
+        "workers": max(1, min(max_parallel_jobs, jobs)),
+        "option_chain_seconds": chain_seconds,
+        "fits": chain_seconds <= interval,
+    }
+
+
+class SymbolConfigWatcher:
+    """Reloads the symbols file when its content changes; poll() between cycles"""
+
+    def __init__(self, path, symbols):
+        self.path = path
+        self.symbols = symbols  # The live dict shared with every module, updated in place
+        self._signature = self._read_signature()
+        self._digest = self._content_digest()
+
+    def _read_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _content_digest(self):
+        try:
+            with open(self.path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def poll(self):
+        """Apply a changed file to the live dict; returns (added, removed, changed) or None"""
+        signature = self._read_signature()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        digest = self._content_digest()
+        if digest is None or digest == self._digest:
+            return None
+        try:
+            symbols = load_symbols(self.path)
+        except Exception as e:
+            logging.error(f"Ignoring invalid symbols file {self.path}: {str(e)}")
+            return None
+        self._digest = digest
+        if not symbols:
+            logging.error(f"Ignoring symbols file {self.path} with no symbols")
+            return None
+
+        added = sorted(set(symbols) - set(self.symbols))
+        removed = sorted(set(self.symbols) - set(symbols))
+        changed = sorted(s for s in set(symbols) & set(self.symbols) if symbols[s] != self.symbols[s])
+        if not (added or removed or changed):
+            return None
+        # Writer, replayer and feed threads read the dict concurrently: replace each entry in one
+        # step and only then drop removed symbols, so it is never empty or missing a kept symbol
+        self.symbols.update(symbols)
+        for symbol in removed:
+            self.symbols.pop(symbol, None)
+        logging.info(
+            f"Reloaded {self.path}: added {', '.join(added) or '-'}, removed {', '.join(removed) or '-'}, "
+            f"changed {', '.join(changed) or '-'}"
+        )
+        return added, removed, changed
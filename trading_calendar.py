@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+DEFAULT_EXCHANGE = "NSE"
+
+
+def trading_exchange(symbol_config):
+    """Exchange whose sessions govern a symbol (SENSEX trades on BSE); defaults to NSE"""
+    return symbol_config.get('trading_exchange', DEFAULT_EXCHANGE)
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%H:%M:%S").time()
+
+
+class TradingCalendar:
+    """Per-exchange trading sessions: regular weekday hours minus holidays, plus special sessions
+
+    A special session (e.g. muhurat trading) on a holiday or weekend replaces the closed day;
+    on a normal trading day it is added alongside the regular session.
+    """
+
+    def __init__(self, sessions, holidays=None, special_sessions=None):
+        # exchange -> (start time, end time)
+        self.sessions = {
+            exchange: (_parse_time(hours['start']), _parse_time(hours['end']))
+            for exchange, hours in sessions.items()
+        }
+        self.holidays = holidays or {}                  # exchange -> {date: name}
+        self.special_sessions = special_sessions or {}  # exchange -> {date: [(start, end, name)]}
+
+    @classmethod
+    def load(cls, path, sessions):
+        """Build a calendar from a holiday file; a missing file means weekends are the only closures"""
+        holidays, special_sessions = {}, {}
+        if not os.path.exists(path):
+            logging.warning(f"Trading calendar file {path} not found, only weekends will be skipped")
+            return cls(sessions)
+        with open(path) as f:
+            data = json.load(f)
+        for exchange, entry in data.items():
+            holidays[exchange] = {
+                date.fromisoformat(day): name for day, name in entry.get('holidays', {}).items()
+            }
+            special = {}
+            for session in entry.get('special_sessions', []):
+                special.setdefault(date.fromisoformat(session['date']), []).append(
+                    (_parse_time(session['start']), _parse_time(session['end']), session.get('name', 'Special session'))
+                )
+            special_sessions[exchange] = special
+        logging.info(
+            f"Loaded trading calendar from {path}: "
+            + ", ".join(f"{exchange} {len(days)} holidays" for exchange, days in holidays.items())
+        )
+        return cls(sessions, holidays, special_sessions)
+
+    def covers_year(self, exchange, year):
+        """Whether the holiday file lists any holiday for this exchange and year"""
+        return any(day.year == year for day in self.holidays.get(exchange, {}))
+
+    def require_year(self, exchanges, year):
+        """Raise ValueError unless every exchange has holidays listed for `year`"""
+        missing = sorted(exchange for exchange in exchanges if not self.covers_year(exchange, year))
+        if missing:
+            raise ValueError(
+                f"No {year} holidays for {', '.join(missing)} in the trading calendar: add the "
+                f"exchange circulars, or holidays would be collected as trading days"
+            )
+
+    def sessions_on(self, exchange, day):
+        """[(start datetime, end datetime, name)] for an exchange on a date"""
+        windows = []
+        if exchange in self.sessions and day.weekday() < 5 and day not in self.holidays.get(exchange, {}):
+            start, end = self.sessions[exchange]
+            windows.append((datetime.combine(day, start), datetime.combine(day, end), "Regular session"))
+        for start, end, name in self.special_sessions.get(exchange, {}).get(day, []):
+            windows.append((datetime.combine(day, start), datetime.combine(day, end), name))
+        return sorted(windows)
+
+    def current_session(self, exchange, at):
+        """The session open at `at` (start and end inclusive), or None"""
+        for window in self.sessions_on(exchange, at.date()):
+            if window[0] <= at <= window[1]:
+                return window
+        return None
+
+    def open_exchanges(self, at, exchanges):
+        """The subset of exchanges in session at `at`"""
+        return {exchange for exchange in exchanges if self.current_session(exchange, at) is not None}
+
+    def next_session_start(self, after, exchanges, horizon_days=30):
+        """Earliest session start strictly after `after` on any of the exchanges"""
+        for offset in range(horizon_days + 1):
+            day = after.date() + timedelta(days=offset)
+            starts = [
+                start for exchange in exchanges
+                for start, _, _ in self.sessions_on(exchange, day) if start > after
+            ]
+            if starts:
+                return min(starts)
+        return None
+
+    def day_end(self, day, exchanges):
+        """When the last session of `day` on any of the exchanges ends, or None if none trade"""
+        ends = [end for exchange in exchanges for _, end, _ in self.sessions_on(exchange, day)]
+        return max(ends) if ends else None
+
+    def last_completed_trade_date(self, at, exchanges, horizon_days=30):
+        """Most recent date whose sessions on the exchanges had all ended by `at`"""
+        for offset in range(horizon_days + 1):
+            day = at.date() - timedelta(days=offset)
+            end = self.day_end(day, exchanges)
+            if end is not None and end < at:
+                return day
+        return None
+
+    def closed_reason(self, exchange, at):
+        """Why an exchange is not trading at `at`, for logging"""
+        day = at.date()
+        if day in self.holidays.get(exchange, {}):
+            return f"{exchange} holiday ({self.holidays[exchange][day]})"
+        if day.weekday() >= 5 and not self.special_sessions.get(exchange, {}).get(day):
+            return "Weekend"
+        windows = self.sessions_on(exchange, day)
+        if windows and at < windows[0][0]:
+            return "Before market open"
+        return "After market close"
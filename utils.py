@@ -2,13 +2,13 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from config import LOG_CONFIG
 
-def setup_logging():
+def setup_logging(log_file=None):
     """Set up logging configuration"""
     handler = RotatingFileHandler(
-        LOG_CONFIG['log_file'],
+        log_file or LOG_CONFIG['log_file'],
         maxBytes=LOG_CONFIG['max_bytes'],
         backupCount=LOG_CONFIG['backup_count']
     )
@@ -34,17 +34,18 @@ def get_current_time():
     """Get current time in HH:MM:SS format"""
     return datetime.now().strftime("%H:%M:%S")
 
-def calculate_next_run_time(current_time, market_start_time):
-    """Calculate the next run time based on current time and market start time"""
-    if current_time.time() < market_start_time:
-        next_run = current_time.replace(
-            hour=int(market_start_time[:2]),
-            minute=int(market_start_time[3:5]),
-            second=int(market_start_time[6:8]),
-            microsecond=0
-        )
-    else:
-        next_run = current_time + timedelta(minutes=1)
-        next_run = next_run.replace(second=2, microsecond=0)
-    
-    return next_run 
+def parse_expiry_date(expiry_label, reference_date):
+    """Parse an expiry label such as '26 JUN' into a date on or after reference_date"""
+    parts = expiry_label.replace('_', ' ').split()
+    if len(parts) < 2 or not parts[0].isdigit():
+        raise ValueError(f"Unrecognised expiry label: {expiry_label}")
+    day = int(parts[0])
+    month = datetime.strptime(parts[1][:3].title(), '%b').month
+    if len(parts) >= 3 and parts[2].isdigit():
+        year = int(parts[2])
+        return date(year + 2000 if year < 100 else year, month, day)
+    # Labels carry no year: take the first such date that has not passed yet
+    expiry = date(reference_date.year, month, day)
+    if expiry < reference_date:
+        expiry = date(reference_date.year + 1, month, day)
+    return expiry
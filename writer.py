@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class WriteRequest:
+    """One shaped option chain snapshot waiting to be written"""
+    symbol: str
+    expiry_date: str
+    data: Any
+    token: Any = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class WriteBehindWriter:
+    """Bounded queue drained by writer threads so fetches never wait on Postgres"""
+
+    def __init__(self, write_batch, write_one, max_queue=200, workers=1,
+                 batch_size=8, linger=0.2, put_timeout=10,
+                 on_written=None, on_failed=None):
+        self.write_batch = write_batch
+        self.write_one = write_one
+        # on_written gets the tokens of written requests, on_failed the failed or dropped
+        # WriteRequests themselves (with or without a token)
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.batch_size = batch_size
+        self.linger = linger
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "written": 0, "failed": 0, "dropped": 0,
+            "batches": 0, "blocked_puts": 0, "total_put_wait": 0.0,
+            "max_put_wait": 0.0, "max_depth": 0, "max_queue_latency": 0.0,
+        }
+        self._workers = [
+            threading.Thread(target=self._run, name=f"db-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _notify(self, callback, requests, tokens=True):
+        items = [r.token for r in requests if r.token is not None] if tokens else list(requests)
+        if callback is None or not items:
+            return
+        try:
+            callback(items)
+        except Exception as e:
+            logging.error(f"Write callback failed: {str(e)}")
+
+    def submit(self, symbol, expiry_date, data, token=None):
+        """Queue a snapshot for writing, blocking while the queue is full"""
+        request = WriteRequest(symbol, expiry_date, data, token)
+        started = time.monotonic()
+        blocked = self._queue.full()
+        try:
+            self._queue.put(request, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            logging.error(
+                f"Write queue full for {self.put_timeout}s, dropping {symbol}_{expiry_date} snapshot"
+            )
+            self._notify(self.on_failed, [request], tokens=False)
+            return False
+        waited = time.monotonic() - started
+        with self._lock:
+            self._stats["enqueued"] += 1
+            self._stats["blocked_puts"] += int(blocked)
+            self._stats["total_put_wait"] += waited
+            self._stats["max_put_wait"] = max(self._stats["max_put_wait"], waited)
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._queue.qsize())
+        return True
+
+    def _next_batch(self):
+        """Take one request, then whatever else arrives within the linger window"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            self._stats["max_queue_latency"] = max(
+                self._stats["max_queue_latency"], max(now - r.enqueued_at for r in batch)
+            )
+        try:
+            self.write_batch([(r.symbol, r.expiry_date, r.data) for r in batch])
+            written, failed = batch, []
+        except Exception as e:
+            # Retry one by one so a single bad snapshot does not sink the whole batch
+            logging.warning(f"Batch write of {len(batch)} snapshots failed, retrying individually: {str(e)}")
+            written, failed = [], []
+            for request in batch:
+                try:
+                    self.write_one(request.symbol, request.expiry_date, request.data)
+                    written.append(request)
+                except Exception as e:
+                    failed.append(request)
+                    logging.error(f"Error writing {request.symbol}_{request.expiry_date}: {str(e)}")
+        self._notify(self.on_written, written)
+        self._notify(self.on_failed, failed, tokens=False)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["written"] += len(written)
+            self._stats["failed"] += len(failed)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until every queued snapshot has been written, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Flush the queue and stop the writer threads"""
+        flushed = self.flush(timeout)
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout=1)
+        if not flushed:
+            logging.error(f"Write queue not drained on shutdown, {self._queue.qsize()} snapshots left")
+        return flushed
+
+    def get_stats(self):
+        """Queue depth and backpressure metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["depth"] = self._queue.qsize()
+        stats["capacity"] = self._queue.maxsize
+        stats["avg_put_wait"] = stats["total_put_wait"] / stats["enqueued"] if stats["enqueued"] else 0.0
+        return stats